@@ -32,7 +32,9 @@ from torch.nn.parallel import DistributedDataParallel as DDP
 from hyperpyyaml import resolve_references
 from speechbrain.utils.distributed import run_on_main
 from speechbrain.dataio.dataloader import LoopedLoader
+from speechbrain.dataio.dataloader import PrefetchLoader
 from speechbrain.dataio.dataloader import SaveableDataLoader
+from speechbrain.dataio.dataset import IterableDynamicItemDataset
 from speechbrain.dataio.sampler import DistributedSamplerWrapper
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
 
@@ -261,6 +263,12 @@ def parse_arguments(arg_list=None):
         type=int,
         help="Number of batches to accumulate gradients before optimizer step",
     )
+    parser.add_argument(
+        "--prefetch_batches",
+        type=int,
+        help="Number of batches to load ahead and move to the device "
+        "asynchronously. 0 disables prefetching.",
+    )
     parser.add_argument(
         "--optimizer_step_limit",
         type=int,
@@ -396,6 +404,12 @@ class Brain:
         ckpt_interval_minutes (float)
             Amount of time between saving intra-epoch checkpoints,
             in minutes, default: ``15.0``. If non-positive, these are not saved.
+        prefetch_batches (int)
+            Number of batches that DataLoaders made by ``make_dataloader()``
+            load ahead of time in a background thread, and move to the
+            device asynchronously (see
+            ``speechbrain.dataio.dataloader.PrefetchLoader``). Default: ``0``,
+            which disables prefetching.
 
         Typically in a script this comes from ``speechbrain.parse_args``, which
         has different defaults than Brain. If an option is not defined here
@@ -447,6 +461,7 @@ class Brain:
             "ckpt_interval_minutes": 0,
             "grad_accumulation_factor": 1,
             "optimizer_step_limit": None,
+            "prefetch_batches": 0,
         }
 
         for arg, default in run_opt_defaults.items():
@@ -692,6 +707,9 @@ class Brain:
         # TRAIN stage is handled specially.
         if stage == sb.Stage.TRAIN:
             loader_kwargs = self._train_loader_specifics(dataset, loader_kwargs)
+        if self.prefetch_batches > 0:
+            loader_kwargs.setdefault("prefetch_batches", self.prefetch_batches)
+            loader_kwargs.setdefault("prefetch_device", self.device)
         dataloader = sb.dataio.dataloader.make_dataloader(
             dataset, **loader_kwargs
         )
@@ -701,6 +719,7 @@ class Brain:
             and ckpt_prefix is not None
             and (
                 isinstance(dataloader, SaveableDataLoader)
+                or isinstance(dataloader, PrefetchLoader)
                 or isinstance(dataloader, LoopedLoader)
             )
         ):
@@ -709,6 +728,16 @@ class Brain:
         return dataloader
 
     def _train_loader_specifics(self, dataset, loader_kwargs):
+        if isinstance(dataset, IterableDynamicItemDataset):
+            # Splits its shards over the processes and shuffles them itself,
+            # it just needs set_epoch() to be called on each epoch.
+            self.train_sampler = dataset
+            if loader_kwargs.pop("shuffle", False):
+                logger.info(
+                    "Shuffling of an IterableDynamicItemDataset is configured "
+                    "on the dataset (shuffle_shards, shuffle_buffer)."
+                )
+            return loader_kwargs
         sampler = loader_kwargs.get("sampler", None)
         # Shuffling should really only matter for the train stage. Shuffling
         # will also lead to more padding in batches if the order was otherwise
@@ -1000,6 +1029,7 @@ class Brain:
 
         if not (
             isinstance(train_set, DataLoader)
+            or isinstance(train_set, PrefetchLoader)
             or isinstance(train_set, LoopedLoader)
         ):
             train_set = self.make_dataloader(
@@ -1007,6 +1037,7 @@ class Brain:
             )
         if valid_set is not None and not (
             isinstance(valid_set, DataLoader)
+            or isinstance(valid_set, PrefetchLoader)
             or isinstance(valid_set, LoopedLoader)
         ):
             valid_set = self.make_dataloader(
@@ -1206,6 +1237,7 @@ class Brain:
 
         if not (
             isinstance(test_set, DataLoader)
+            or isinstance(test_set, PrefetchLoader)
             or isinstance(test_set, LoopedLoader)
         ):
             test_loader_kwargs["ckpt_prefix"] = None
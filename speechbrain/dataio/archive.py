@@ -0,0 +1,539 @@
+"""Sharded, memory-mapped array archives.
+
+Reading millions of small files (one per utterance) through a network
+filesystem makes data loading syscall-bound. An archive packs many arrays
+into a few large shard files plus a JSON index, and reads them back as
+zero-copy, memory-mapped tensors.
+
+The on-disk layout of an archive directory is::
+
+    archive_dir/
+        index.json
+        shard-000000.bin
+        shard-000001.bin
+        ...
+
+Each shard is a plain concatenation of C-ordered arrays. The index maps each
+key to its shard, byte offset, shape and dtype, and can hold free-form
+metadata.
+
+On top of the generic archive, this module implements an audio archive, which
+stores each audio file of a data manifest once, and can then be used as a
+drop-in replacement for `speechbrain.dataio.dataio.read_audio`, including the
+``{"file": ..., "start": ..., "stop": ...}`` segment notation.
+
+Likewise, a feature archive stores precomputed features (e.g., from
+`speechbrain.lobes.features.Fbank`) for each data point, so that the
+front-end does not have to be recomputed every epoch when the audio is not
+augmented, or for evaluation.
+
+Example
+-------
+>>> import torch
+>>> tmpdir = getfixture('tmpdir')
+>>> with ArchiveWriter(tmpdir / "archive") as writer:
+...     writer.add("a", torch.arange(6.).view(2, 3))
+...     writer.add("b", torch.ones(4, dtype=torch.long))
+>>> archive = ArchiveReader(tmpdir / "archive")
+>>> len(archive)
+2
+>>> archive["a"]
+tensor([[0., 1., 2.],
+        [3., 4., 5.]])
+>>> archive.read("a", start=1)
+tensor([[3., 4., 5.]])
+"""
+
+import os
+import json
+import logging
+import torch
+import numpy as np
+from speechbrain.dataio.dataio import read_audio
+from speechbrain.utils.data_pipeline import DynamicItem
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.json"
+SHARD_FILENAME = "shard-{:06d}.bin"
+# Arrays are aligned to this many bytes inside shards, so that any dtype
+# can be viewed directly from the memory map.
+ALIGNMENT = 64
+
+
+class ArchiveWriter:
+    """Packs arrays into a sharded archive.
+
+    A new shard is started when adding an array would make the current shard
+    exceed ``max_shard_bytes`` (an array larger than that gets a shard of its
+    own). The index is written when the writer is closed, so use the writer
+    as a context manager or call `close()`.
+
+    Arguments
+    ---------
+    archive_dir : str, path
+        Directory to write the archive to. Created if it does not exist.
+    max_shard_bytes : int
+        Approximate maximum size of each shard file, in bytes.
+    metadata : dict
+        JSON-serializable metadata, stored in the index. Can also be updated
+        through the ``metadata`` attribute before closing.
+
+    Example
+    -------
+    >>> tmpdir = getfixture('tmpdir')
+    >>> writer = ArchiveWriter(tmpdir / "tiny", max_shard_bytes=16)
+    >>> for i in range(3):
+    ...     writer.add(f"x{i}", torch.zeros(4))
+    >>> writer.close()
+    >>> ArchiveReader(tmpdir / "tiny").num_shards
+    3
+    """
+
+    def __init__(self, archive_dir, max_shard_bytes=2 ** 30, metadata=None):
+        self.archive_dir = str(archive_dir)
+        self.max_shard_bytes = max_shard_bytes
+        self.metadata = metadata if metadata is not None else {}
+        self.entries = {}
+        self.num_shards = 0
+        self._shard_file = None
+        self._shard_bytes = 0
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    def add(self, key, array):
+        """Appends one array to the archive.
+
+        Arguments
+        ---------
+        key : str
+            Unique key to store the array under.
+        array : torch.Tensor, numpy.ndarray
+            The data to store.
+        """
+        if key in self.entries:
+            raise ValueError(f"Duplicate key in archive: {key}")
+        if isinstance(array, torch.Tensor):
+            array = array.detach().cpu().numpy()
+        array = np.ascontiguousarray(array)
+        padding = -self._shard_bytes % ALIGNMENT
+        if self._shard_file is None or (
+            self._shard_bytes > 0
+            and self._shard_bytes + padding + array.nbytes
+            > self.max_shard_bytes
+        ):
+            self._next_shard()
+            padding = 0
+        if padding:
+            self._shard_file.write(b"\0" * padding)
+            self._shard_bytes += padding
+        self.entries[key] = {
+            "shard": self.num_shards - 1,
+            "offset": self._shard_bytes,
+            "shape": list(array.shape),
+            "dtype": array.dtype.str,
+        }
+        self._shard_file.write(array.tobytes())
+        self._shard_bytes += array.nbytes
+
+    def _next_shard(self):
+        if self._shard_file is not None:
+            self._shard_file.close()
+        path = os.path.join(
+            self.archive_dir, SHARD_FILENAME.format(self.num_shards)
+        )
+        self._shard_file = open(path, "wb")
+        self._shard_bytes = 0
+        self.num_shards += 1
+
+    def close(self):
+        """Finishes the current shard and writes the index."""
+        if self._shard_file is not None:
+            self._shard_file.close()
+            self._shard_file = None
+        index = {
+            "shards": [
+                SHARD_FILENAME.format(i) for i in range(self.num_shards)
+            ],
+            "entries": self.entries,
+            "metadata": self.metadata,
+        }
+        with open(os.path.join(self.archive_dir, INDEX_FILENAME), "w") as fo:
+            json.dump(index, fo)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ArchiveReader:
+    """Reads arrays from a sharded archive as memory-mapped tensors.
+
+    The shards are mapped lazily, on first access, so that each DataLoader
+    worker maps them in its own process. The returned tensors share memory
+    with the (copy-on-write) mapping, so nothing is read from disk until the
+    data is actually touched, and reading a slice only touches that slice.
+
+    Arguments
+    ---------
+    archive_dir : str, path
+        Directory written by `ArchiveWriter`.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = str(archive_dir)
+        with open(os.path.join(self.archive_dir, INDEX_FILENAME)) as fi:
+            index = json.load(fi)
+        self.shards = index["shards"]
+        self.entries = index["entries"]
+        self.metadata = index["metadata"]
+        self._maps = {}
+
+    @property
+    def num_shards(self):
+        """Number of shard files in the archive."""
+        return len(self.shards)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def keys(self):
+        """The keys of the stored arrays, in the order they were written."""
+        return self.entries.keys()
+
+    def shape(self, key):
+        """The shape of the array stored under key, without reading it."""
+        return tuple(self.entries[key]["shape"])
+
+    def __getitem__(self, key):
+        return self.read(key)
+
+    def read(self, key, start=0, stop=None):
+        """Returns a zero-copy tensor view of the stored array.
+
+        Arguments
+        ---------
+        key : str
+            Key of the array.
+        start : int
+            First index to read along the first dimension.
+        stop : int, None
+            Index to stop reading at along the first dimension. None means
+            read until the end.
+
+        Returns
+        -------
+        torch.Tensor
+            Tensor backed by the memory map.
+        """
+        entry = self.entries[key]
+        shape = entry["shape"]
+        dtype = np.dtype(entry["dtype"])
+        if not shape:
+            # Scalars are not sliceable.
+            return torch.from_numpy(self._view(entry, dtype, 0, 1)[0])
+        length = shape[0]
+        stop = length if stop is None else min(stop, length)
+        start = min(start, stop)
+        row_size = int(np.prod(shape[1:], dtype=np.int64))
+        array = self._view(
+            entry, dtype, start * row_size, (stop - start) * row_size
+        )
+        return torch.from_numpy(array.reshape([stop - start] + shape[1:]))
+
+    def _view(self, entry, dtype, first, count):
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        mmap = self._get_map(entry["shard"])
+        begin = entry["offset"] + first * dtype.itemsize
+        end = begin + count * dtype.itemsize
+        return mmap[begin:end].view(dtype)
+
+    def _get_map(self, shard):
+        if shard not in self._maps:
+            path = os.path.join(self.archive_dir, self.shards[shard])
+            # Copy-on-write, so that torch gets a writable array; the file
+            # itself is never modified.
+            self._maps[shard] = np.memmap(path, dtype=np.uint8, mode="c")
+        return self._maps[shard]
+
+    def __getstate__(self):
+        # Memory maps must not be pickled (that would copy all the data),
+        # e.g. when sent to spawned DataLoader workers. They are re-opened.
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+
+def write_audio_archive(
+    data, archive_dir, audio_key="wav", max_shard_bytes=2 ** 30
+):
+    """Packs the audio referenced by a data manifest into an audio archive.
+
+    Each audio file is decoded once and stored as float32, even if many
+    segments of the manifest point into the same file. The audio annotation
+    of each data point is also kept in the archive, so the audio can then be
+    read either by annotation or by data point id (see `AudioArchive`).
+
+    Arguments
+    ---------
+    data : dict
+        Data manifest as returned by `load_data_json` or `load_data_csv`.
+    archive_dir : str, path
+        Directory to write the archive to.
+    audio_key : str
+        Key of the audio annotation in each data point. The annotation is
+        either a path, or a dict in the notation of `read_audio`.
+    max_shard_bytes : int
+        Approximate maximum size of each shard file, in bytes.
+
+    Example
+    -------
+    >>> from speechbrain.dataio.dataio import write_audio
+    >>> tmpdir = getfixture('tmpdir')
+    >>> wavfile = str(tmpdir / "long.wav")
+    >>> write_audio(wavfile, torch.rand(16000), 16000)
+    >>> data = {
+    ...     "seg1": {"wav": {"file": wavfile, "start": 0, "stop": 8000}},
+    ...     "seg2": {"wav": {"file": wavfile, "start": 8000, "stop": 16000}},
+    ... }
+    >>> write_audio_archive(data, tmpdir / "audio")
+    >>> archive = AudioArchive(tmpdir / "audio")
+    >>> len(archive)  # The file is stored only once
+    1
+    >>> archive.read_audio(data["seg2"]["wav"]).shape
+    torch.Size([8000])
+    >>> archive.read_id("seg1").allclose(read_audio(data["seg1"]["wav"]))
+    True
+    """
+    annotations = {}
+    with ArchiveWriter(archive_dir, max_shard_bytes) as writer:
+        for data_id, data_point in data.items():
+            waveforms_obj = data_point[audio_key]
+            path = _audio_path(waveforms_obj)
+            if path not in writer.entries:
+                writer.add(path, read_audio(path).float())
+            annotations[data_id] = waveforms_obj
+        writer.metadata["annotations"] = annotations
+    logger.info(
+        f"Wrote {len(writer.entries)} audio files to {writer.num_shards} "
+        f"shards in {archive_dir}"
+    )
+
+
+class AudioArchive(ArchiveReader):
+    """Reads audio from an archive written by `write_audio_archive`.
+
+    `read_audio` accepts the same annotations as
+    `speechbrain.dataio.dataio.read_audio` and returns the same tensors, but
+    slices them directly out of the memory-mapped shards. This makes it a
+    drop-in replacement in the audio pipeline of a `DynamicItemDataset`::
+
+        archive = AudioArchive("path/to/archive")
+
+        @sb.utils.data_pipeline.takes("wav")
+        @sb.utils.data_pipeline.provides("sig")
+        def audio_pipeline(wav):
+            return archive.read_audio(wav)
+
+    Alternatively, `read_id` reads the audio of a data point by its id
+    (the "id" key of the dataset).
+
+    Arguments
+    ---------
+    archive_dir : str, path
+        Directory written by `write_audio_archive`.
+    """
+
+    def read_audio(self, waveforms_obj):
+        """Reads audio based on the custom notation of `read_audio`.
+
+        Arguments
+        ---------
+        waveforms_obj : str, dict
+            Audio reading annotation: a path, or a dict with "file" and
+            optionally "start" and "stop".
+
+        Returns
+        -------
+        torch.Tensor
+            Audio tensor with shape: (samples, ) or (samples, channels).
+        """
+        if isinstance(waveforms_obj, str):
+            return self.read(waveforms_obj)
+        start = int(waveforms_obj.get("start", 0))
+        # Same convention as read_audio: no stop (or stop == start) means
+        # reading until the end of the file.
+        stop = int(waveforms_obj.get("stop", start))
+        if stop == start:
+            stop = None
+        return self.read(waveforms_obj["file"], start, stop)
+
+    def read_id(self, data_id):
+        """Reads the audio of the data point with the given id.
+
+        Arguments
+        ---------
+        data_id : str
+            The data point id, as in the manifest the archive was written from.
+
+        Returns
+        -------
+        torch.Tensor
+            Audio tensor with shape: (samples, ) or (samples, channels).
+        """
+        return self.read_audio(self.metadata["annotations"][data_id])
+
+
+def _audio_path(waveforms_obj):
+    if isinstance(waveforms_obj, str):
+        return waveforms_obj
+    return waveforms_obj["file"]
+
+
+def write_feature_archive(
+    data,
+    archive_dir,
+    compute_features,
+    audio_key="wav",
+    audio_reader=read_audio,
+    num_workers=0,
+    max_shard_bytes=2 ** 30,
+):
+    """Computes the features of each data point of a manifest and packs
+    them into a feature archive.
+
+    The features are computed one data point at a time, so they do not
+    depend on the padding of a batch, in num_workers DataLoader worker
+    processes in parallel. The number of frames of each data point is the
+    length of the first dimension of its stored features.
+
+    Arguments
+    ---------
+    data : dict
+        Data manifest as returned by `load_data_json` or `load_data_csv`.
+    archive_dir : str, path
+        Directory to write the archive to.
+    compute_features : callable
+        Computes the features of a batch of audio signals, e.g., an instance
+        of `speechbrain.lobes.features.Fbank` or `MFCC`.
+    audio_key : str
+        Key of the audio annotation in each data point.
+    audio_reader : callable
+        Reads the audio of an annotation, e.g., `AudioArchive.read_audio`.
+    num_workers : int
+        Number of worker processes computing the features (0 means in the
+        main process).
+    max_shard_bytes : int
+        Approximate maximum size of each shard file, in bytes.
+
+    Example
+    -------
+    >>> from speechbrain.lobes.features import Fbank
+    >>> tmpdir = getfixture('tmpdir')
+    >>> signals = {"utt1": torch.rand(16000), "utt2": torch.rand(8000)}
+    >>> data = {"utt1": {"wav": "utt1"}, "utt2": {"wav": "utt2"}}
+    >>> write_feature_archive(
+    ...     data, tmpdir / "fbanks", Fbank(n_mels=40), audio_reader=signals.get
+    ... )
+    >>> archive = FeatureArchive(tmpdir / "fbanks")
+    >>> archive.read_id("utt2").shape
+    torch.Size([51, 40])
+    """
+    dataset = _FeatureExtractionDataset(
+        data, compute_features, audio_key, audio_reader
+    )
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=None, num_workers=num_workers
+    )
+    with ArchiveWriter(archive_dir, max_shard_bytes) as writer:
+        for data_id, features in loader:
+            writer.add(data_id, features)
+    logger.info(
+        f"Wrote the features of {len(writer.entries)} data points to "
+        f"{writer.num_shards} shards in {archive_dir}"
+    )
+
+
+class _FeatureExtractionDataset(torch.utils.data.Dataset):
+    """Computes the features of each data point, for write_feature_archive."""
+
+    def __init__(self, data, compute_features, audio_key, audio_reader):
+        self.data_ids = list(data)
+        self.annotations = [data[data_id][audio_key] for data_id in data]
+        self.compute_features = compute_features
+        self.audio_reader = audio_reader
+
+    def __len__(self):
+        return len(self.data_ids)
+
+    def __getitem__(self, index):
+        signal = self.audio_reader(self.annotations[index])
+        with torch.no_grad():
+            features = self.compute_features(signal.unsqueeze(0))[0]
+        return self.data_ids[index], features
+
+
+class FeatureArchive(ArchiveReader):
+    """Reads features from an archive written by `write_feature_archive`.
+
+    The features are memory-mapped tensors, so that reading them (or a
+    slice of frames) does not copy them. The archive can replace the
+    feature computation in the pipeline of a `DynamicItemDataset`::
+
+        archive = FeatureArchive("path/to/archive")
+        dataset.add_dynamic_item(archive.dynamic_item(provides="feats"))
+
+    The features are then padded into batches by `PaddedBatch`, with their
+    relative lengths, as the audio would have been.
+
+    Arguments
+    ---------
+    archive_dir : str, path
+        Directory written by `write_feature_archive`.
+    """
+
+    def read_id(self, data_id, start=0, stop=None):
+        """Reads the features (or some frames) of the data point with the
+        given id.
+
+        Arguments
+        ---------
+        data_id : str
+            The data point id, as in the manifest the archive was written from.
+        start : int
+            First frame to read.
+        stop : int, None
+            Frame to stop reading at. None means read until the end.
+
+        Returns
+        -------
+        torch.Tensor
+            Features tensor with shape: (frames, ...).
+        """
+        return self.read(data_id, start, stop)
+
+    def num_frames(self, data_id):
+        """The number of frames of the data point with the given id."""
+        return self.shape(data_id)[0]
+
+    def dynamic_item(self, takes="id", provides="feats"):
+        """Returns a DynamicItem which reads the features by data point id.
+
+        Arguments
+        ---------
+        takes : str
+            The key of the data point id.
+        provides : str
+            The key of the features.
+
+        Returns
+        -------
+        DynamicItem
+            To add to a `DynamicItemDataset`.
+        """
+        return DynamicItem([takes], self.read_id, [provides])
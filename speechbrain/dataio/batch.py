@@ -40,7 +40,10 @@ class PaddedBatch:
         Called with a list of tensors to be padded together. Needs to return
         two tensors: the padded data, and another tensor for the data lengths.
     padding_kwargs : dict
-        (Optional) Extra kwargs to pass to padding_func. E.G. mode, value
+        (Optional) Extra kwargs to pass to padding_func. E.G. mode, value, or
+        pin_memory=True to pad directly into pinned memory (useful when
+        collating in the main process, e.g. with a PrefetchLoader: the
+        tensors of DataLoader workers are copied to shared memory anyway).
     apply_default_convert : bool
         Whether to apply PyTorch default_convert (numpy to torch recursively,
         etc.) on all data. Default:True, usually does the right thing.
@@ -0,0 +1,710 @@
+"""Columnar storage for the static data of large datasets.
+
+`DynamicItemDataset` takes its static data as a dict of dicts: one dict per
+data point. For corpora with millions of data points, building and querying
+that structure in pure Python is slow, and it takes a lot of memory: every
+string is a separate Python object. Worse, each DataLoader worker (and each
+DDP process) touches the reference counts of all those objects, so
+copy-on-write gradually duplicates the whole structure in every process.
+
+`ColumnarData` provides the same mapping interface (data id -> data point
+dict), but stores each key as one column, made of NumPy arrays:
+
+- numbers are stored as numeric arrays,
+- strings are packed into one UTF-8 buffer (`StringColumn`), or interned as
+  integer codes into a table of unique values (`CategoricalColumn`) when
+  they repeat a lot, like speaker ids,
+- the data ids are a `StringColumn` too, and looked up through a sorted
+  array instead of a dict.
+
+Only values of other types (e.g. nested dicts from JSON) are kept as Python
+objects. Filtering and sorting on numeric columns (see
+`DynamicItemDataset.filtered_sorted`) is vectorized.
+
+A `ColumnarData` can be saved to a directory and loaded back as read-only
+memory maps, so that all the processes of a (multi-node, multi-GPU) run
+share the same pages of memory, through the OS page cache.
+
+The loaders in this module read the usual SpeechBrain CSV and JSON manifests
+directly into columns; CSV files can be parsed in parallel chunks.
+
+Example
+-------
+>>> data = ColumnarData.from_dict({
+...     "utt1": {"wav": "/data/utt1.wav", "duration": 1.5},
+...     "utt2": {"wav": "/data/utt2.wav", "duration": 2.0},
+... })
+>>> data["utt2"]
+{'wav': '/data/utt2.wav', 'duration': 2.0}
+>>> data.column("duration")
+array([1.5, 2. ])
+>>> data.save(getfixture('tmpdir') / "data")
+>>> ColumnarData.load(getfixture('tmpdir') / "data")["utt1"]
+{'wav': '/data/utt1.wav', 'duration': 1.5}
+"""
+
+import os
+import re
+import gc
+import csv
+import json
+import pickle
+import logging
+import collections.abc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from speechbrain.dataio.dataio import _recursive_format
+
+logger = logging.getLogger(__name__)
+
+# Strings are interned when there are at most this many unique values per
+# value in the column:
+MAX_UNIQUE_RATIO = 0.5
+
+
+class StringColumn(collections.abc.Sequence):
+    """A sequence of strings, packed into one UTF-8 buffer.
+
+    Arguments
+    ---------
+    data : numpy.ndarray
+        The UTF-8 encoded strings, concatenated, as uint8.
+    offsets : numpy.ndarray
+        The start of each string in data, and the end of the last one, as
+        int64. So string i is data[offsets[i]:offsets[i+1]], and
+        offsets[0] == 0, offsets[-1] == len(data).
+
+    Example
+    -------
+    >>> column = StringColumn.from_strings(["hello", "wörld", ""])
+    >>> len(column), column[1], column[-1]
+    (3, 'wörld', '')
+    >>> list(column.take([1, 0]))
+    ['wörld', 'hello']
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Packs an iterable of strings."""
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)),
+            out=offsets[1:],
+        )
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    @classmethod
+    def concatenate(cls, columns):
+        """Joins StringColumns into one."""
+        columns = list(columns)
+        shifts = np.cumsum([0] + [len(column.data) for column in columns])
+        offsets = np.concatenate(
+            [np.zeros(1, dtype=np.int64)]
+            + [
+                column.offsets[1:] + shift
+                for column, shift in zip(columns, shifts)
+            ]
+        )
+        data = np.concatenate(
+            [np.zeros(0, dtype=np.uint8)] + [column.data for column in columns]
+        )
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index])
+        length = len(self.offsets) - 1
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("StringColumn index out of range")
+        start = self.offsets.item(index)
+        stop = self.offsets.item(index + 1)
+        return str(memoryview(self.data)[start:stop], "utf-8")
+
+    def __iter__(self):
+        buffer = memoryview(self.data)
+        offsets = self.offsets.tolist()
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            yield str(buffer[start:stop], "utf-8")
+
+    def take(self, indices):
+        """The strings at the given positions, as a new StringColumn."""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[:-1][indices]
+        lengths = self.offsets[1:][indices] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lengths)
+        gather += np.arange(offsets[-1], dtype=np.int64)
+        return StringColumn(self.data[gather], offsets)
+
+    def to_fixed_width(self):
+        """The strings as a NumPy bytes array (of the longest length).
+
+        NOTE: NumPy bytes arrays drop trailing null bytes.
+        """
+        lengths = np.diff(self.offsets)
+        width = max(int(lengths.max()) if len(lengths) else 0, 1)
+        out = np.zeros((len(self), width), dtype=np.uint8)
+        rows = np.repeat(np.arange(len(self)), lengths)
+        cols = np.arange(len(self.data)) - np.repeat(self.offsets[:-1], lengths)
+        out[rows, cols] = self.data
+        return out.view(f"S{width}").ravel()
+
+    @property
+    def nbytes(self):
+        """Memory used by the column, in bytes."""
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class CategoricalColumn(collections.abc.Sequence):
+    """A sequence of strings, stored as codes into a table of unique values.
+
+    Arguments
+    ---------
+    codes : numpy.ndarray
+        The position of each value in categories, as int32.
+    categories : StringColumn
+        The unique values.
+
+    Example
+    -------
+    >>> column = CategoricalColumn.from_strings(["spk1", "spk2", "spk1"])
+    >>> list(column), column.codes
+    (['spk1', 'spk2', 'spk1'], array([0, 1, 0], dtype=int32))
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Interns an iterable of strings."""
+        table = {}
+        codes = [table.setdefault(string, len(table)) for string in strings]
+        return cls(
+            np.array(codes, dtype=np.int32), StringColumn.from_strings(table)
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index])
+        return self.categories[self.codes.item(index)]
+
+    def __iter__(self):
+        # Interned: each unique value is a single str object.
+        categories = list(self.categories)
+        for code in self.codes.tolist():
+            yield categories[code]
+
+    def take(self, indices):
+        """The values at the given positions, as a new CategoricalColumn."""
+        return CategoricalColumn(self.codes[indices], self.categories)
+
+    def to_strings(self):
+        """The values as a StringColumn."""
+        return self.categories.take(self.codes)
+
+    @property
+    def nbytes(self):
+        """Memory used by the column, in bytes."""
+        return self.codes.nbytes + self.categories.nbytes
+
+
+class ColumnarData(collections.abc.Mapping):
+    """Static data stored by columns, with a dict of dicts interface.
+
+    Arguments
+    ---------
+    data_ids : list, StringColumn
+        The data point ids (str), in order.
+    columns : dict
+        Map from key to a column holding the value of that key for every data
+        point, in the order of data_ids. Lists of numbers are converted to
+        NumPy arrays and lists of strings to `StringColumn` or (if there are
+        many repeated values) `CategoricalColumn`.
+
+    Example
+    -------
+    >>> data = ColumnarData(["a", "b"], {"x": [1, 2], "text": ["hi", "yo"]})
+    >>> list(data)
+    ['a', 'b']
+    >>> data["a"]
+    {'x': 1, 'text': 'hi'}
+    >>> data.index_of(["b", "a"])
+    array([1, 0])
+    """
+
+    def __init__(self, data_ids, columns):
+        if not isinstance(data_ids, StringColumn):
+            data_ids = StringColumn.from_strings(data_ids)
+        self.data_ids = data_ids
+        self.columns = {
+            key: _to_column(values, len(self.data_ids))
+            for key, values in columns.items()
+        }
+        self._path = None
+        self._build_index()
+
+    def _build_index(self):
+        """Sorts the ids, for lookups by binary search."""
+        keys = self.data_ids.to_fixed_width()
+        self._sorted_positions = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._sorted_positions]
+        duplicates = np.flatnonzero(
+            self._sorted_keys[1:] == self._sorted_keys[:-1]
+        )
+        if len(duplicates) > 0:
+            data_id = self._sorted_keys[duplicates[0]].decode("utf-8")
+            raise ValueError(f"Duplicate id: {data_id}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """Converts a dict of data point dicts (with the same keys) into
+        columns."""
+        data_ids = list(data.keys())
+        keys = _common_keys(data, data_ids)
+        columns = {
+            key: [data[data_id][key] for data_id in data_ids] for key in keys
+        }
+        return cls(data_ids, columns)
+
+    def __len__(self):
+        return len(self.data_ids)
+
+    def __iter__(self):
+        return iter(self.data_ids)
+
+    def __contains__(self, data_id):
+        try:
+            self.position(data_id)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, data_id):
+        return self.row(self.position(data_id))
+
+    def position(self, data_id):
+        """The position of a data id in the data."""
+        key = data_id.encode("utf-8")
+        i = int(self._sorted_keys.searchsorted(key))
+        if i < len(self._sorted_keys) and self._sorted_keys[i] == key:
+            return self._sorted_positions.item(i)
+        raise KeyError(data_id)
+
+    def row(self, index):
+        """The data point at the given position, as a dict."""
+        return {
+            key: column.item(index)
+            if isinstance(column, np.ndarray)
+            else column[index]
+            for key, column in self.columns.items()
+        }
+
+    def column(self, key):
+        """All the values of one key, in data point order."""
+        return self.columns[key]
+
+    def index_of(self, data_ids):
+        """Positions of the given data ids, as an array."""
+        if data_ids is self.data_ids:
+            return np.arange(len(self.data_ids))
+        if isinstance(data_ids, StringColumn):
+            keys = data_ids.to_fixed_width()
+        else:
+            keys = np.array(
+                [data_id.encode("utf-8") for data_id in data_ids], dtype=bytes,
+            )
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64)
+        found = np.searchsorted(self._sorted_keys, keys)
+        found = np.minimum(found, len(self._sorted_keys) - 1)
+        missing = np.flatnonzero(self._sorted_keys[found] != keys)
+        if len(missing) > 0:
+            raise KeyError(keys[missing[0]].decode("utf-8"))
+        return self._sorted_positions[found]
+
+    @property
+    def nbytes(self):
+        """Memory used by the array columns and the ids, in bytes."""
+        return (
+            self.data_ids.nbytes
+            + self._sorted_keys.nbytes
+            + self._sorted_positions.nbytes
+            + sum(
+                column.nbytes
+                for column in self.columns.values()
+                if not isinstance(column, list)
+            )
+        )
+
+    def save(self, path):
+        """Saves the data in a directory, see `ColumnarData.load`."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            "ids.data": self.data_ids.data,
+            "ids.offsets": self.data_ids.offsets,
+            "ids.sorted_keys": self._sorted_keys,
+            "ids.sorted_positions": self._sorted_positions,
+        }
+        kinds = {}
+        objects = {}
+        for i, (key, column) in enumerate(self.columns.items()):
+            name = f"column{i}"
+            if isinstance(column, np.ndarray):
+                kinds[key] = ("array", name)
+                arrays[name] = column
+            elif isinstance(column, StringColumn):
+                kinds[key] = ("string", name)
+                arrays[name + ".data"] = column.data
+                arrays[name + ".offsets"] = column.offsets
+            elif isinstance(column, CategoricalColumn):
+                kinds[key] = ("categorical", name)
+                arrays[name + ".codes"] = column.codes
+                arrays[name + ".data"] = column.categories.data
+                arrays[name + ".offsets"] = column.categories.offsets
+            else:
+                kinds[key] = ("object", name)
+                objects[key] = column
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, "objects.pkl"), "wb") as fo:
+            pickle.dump(objects, fo)
+        with open(os.path.join(path, "columns.json"), "w") as fo:
+            json.dump(kinds, fo)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads data saved with `ColumnarData.save`.
+
+        Arguments
+        ---------
+        path : str
+            The directory the data was saved in.
+        mmap : bool
+            If True, the arrays are read-only memory maps of the files. All the
+            processes that load the same directory then share the memory, and
+            pickling (e.g. to spawned DataLoader workers) only sends the path.
+
+        Returns
+        -------
+        ColumnarData
+        """
+        path = str(path)
+
+        def array(name):
+            return np.load(
+                os.path.join(path, name + ".npy"),
+                mmap_mode="r" if mmap else None,
+            )
+
+        with open(os.path.join(path, "columns.json")) as fi:
+            kinds = json.load(fi)
+        with open(os.path.join(path, "objects.pkl"), "rb") as fi:
+            objects = pickle.load(fi)
+        columns = {}
+        for key, (kind, name) in kinds.items():
+            if kind == "array":
+                columns[key] = array(name)
+            elif kind == "string":
+                columns[key] = StringColumn(
+                    array(name + ".data"), array(name + ".offsets")
+                )
+            elif kind == "categorical":
+                columns[key] = CategoricalColumn(
+                    array(name + ".codes"),
+                    StringColumn(
+                        array(name + ".data"), array(name + ".offsets")
+                    ),
+                )
+            else:
+                columns[key] = objects[key]
+        data = cls.__new__(cls)
+        data.data_ids = StringColumn(array("ids.data"), array("ids.offsets"))
+        data.columns = columns
+        data._sorted_keys = array("ids.sorted_keys")
+        data._sorted_positions = array("ids.sorted_positions")
+        data._path = path if mmap else None
+        return data
+
+    def __getstate__(self):
+        if self._path is not None:
+            return {"_path": self._path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "data_ids" not in state:
+            state = ColumnarData.load(state["_path"]).__dict__
+        self.__dict__.update(state)
+
+
+def load_data_csv_columnar(csv_path, replacements={}, num_workers=1):
+    """Loads a CSV manifest into a `ColumnarData`.
+
+    Same format and semantics as `speechbrain.dataio.dataio.load_data_csv`:
+    the CSV must have an 'ID' field, a 'duration' field is interpreted as
+    float, and $variables are replaced.
+
+    With num_workers > 1, the file is split into chunks of lines which are
+    parsed in parallel processes. This assumes that no quoted field spans
+    multiple lines, which is the case for SpeechBrain data preparation
+    outputs.
+
+    Arguments
+    ---------
+    csv_path : str
+        Path to CSV file.
+    replacements : dict
+        (Optional dict), e.g., {"data_folder": "/home/speechbrain/data"}
+        This is used to recursively format all string values in the data.
+    num_workers : int
+        Number of processes to parse the file with.
+
+    Returns
+    -------
+    ColumnarData
+        CSV data with replacements applied.
+
+    Example
+    -------
+    >>> csv_spec = '''ID,duration,wav_path
+    ... utt1,1.45,$data_folder/utt1.wav
+    ... utt2,2.0,$data_folder/utt2.wav
+    ... '''
+    >>> tmpfile = getfixture("tmpdir") / "test.csv"
+    >>> with open(tmpfile, "w") as fo:
+    ...     _ = fo.write(csv_spec)
+    >>> data = load_data_csv_columnar(tmpfile, {"data_folder": "/home"})
+    >>> data["utt1"]["wav_path"]
+    '/home/utt1.wav'
+    >>> data.column("duration")
+    array([1.45, 2.  ])
+    """
+    with open(csv_path, "rb") as csvfile:
+        header_line = csvfile.readline().decode("utf-8")
+        body_start = csvfile.tell()
+    fieldnames = next(csv.reader([header_line], skipinitialspace=True))
+    if "ID" not in fieldnames:
+        raise KeyError(
+            "CSV has to have an 'ID' field, with unique ids"
+            " for all data points"
+        )
+    chunks = _chunk_lines(csv_path, body_start, num_workers)
+    args = [
+        (csv_path, fieldnames, start, stop, replacements)
+        for start, stop in chunks
+    ]
+    # Millions of small objects are created below, none of them cyclic, so
+    # the cyclic garbage collector would only keep rescanning them.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if num_workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(num_workers) as executor:
+                parsed = list(executor.map(_parse_csv_chunk, *zip(*args)))
+        else:
+            parsed = [_parse_csv_chunk(*arg) for arg in args]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    columns = {
+        key: _concatenate_columns([chunk[key] for chunk in parsed])
+        for key in fieldnames
+    }
+    data_ids = columns.pop("ID")
+    return ColumnarData(data_ids, columns)
+
+
+def load_data_json_columnar(json_path, replacements={}):
+    """Loads a JSON manifest into a `ColumnarData`.
+
+    Same format and semantics as `speechbrain.dataio.dataio.load_data_json`,
+    except that all the data points must have the same keys.
+
+    Arguments
+    ---------
+    json_path : str
+        Path to JSON file.
+    replacements : dict
+        (Optional dict), e.g., {"data_folder": "/home/speechbrain/data"}.
+        This is used to recursively format all string values in the data.
+
+    Returns
+    -------
+    ColumnarData
+        JSON data with replacements applied.
+    """
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    data_ids = list(data.keys())
+    keys = _common_keys(data, data_ids)
+    columns = {}
+    for key in keys:
+        values = [data[data_id][key] for data_id in data_ids]
+        _recursive_format(values, replacements)
+        columns[key] = values
+    del data
+    return ColumnarData(data_ids, columns)
+
+
+def _common_keys(data, data_ids):
+    """The keys of the data points, checking that they all have the same."""
+    if not data_ids:
+        return []
+    keys = list(data[data_ids[0]].keys())
+    key_set = set(keys)
+    for data_id in data_ids:
+        if data[data_id].keys() != key_set:
+            raise ValueError(
+                f"Data point {data_id} has the keys {sorted(data[data_id])}, "
+                f"but {data_ids[0]} has {sorted(keys)}: columnar data needs "
+                "the same keys in all data points."
+            )
+    return keys
+
+
+def _chunk_lines(path, start, num_chunks):
+    """Splits a file from start into byte ranges that end at line ends."""
+    size = os.path.getsize(path)
+    if num_chunks <= 1 or size <= start:
+        return [(start, size)]
+    boundaries = [start]
+    with open(path, "rb") as fi:
+        for i in range(1, num_chunks):
+            fi.seek(
+                max(start + (size - start) * i // num_chunks, boundaries[-1])
+            )
+            fi.readline()
+            boundaries.append(min(fi.tell(), size))
+    boundaries.append(size)
+    return [
+        (begin, end)
+        for begin, end in zip(boundaries[:-1], boundaries[1:])
+        if end > begin
+    ]
+
+
+def _parse_csv_chunk(csv_path, fieldnames, start, stop, replacements):
+    """Parses the CSV rows in a byte range, into columns by field."""
+    with open(csv_path, "rb") as fi:
+        fi.seek(start)
+        text = fi.read(stop - start).decode("utf-8")
+    # Only \n and \r\n end lines, like in the csv module (str.splitlines
+    # would also split on e.g. \x85 or \u2028 in the values):
+    lines = text.replace("\r\n", "\n").split("\n")
+    rows = [
+        row
+        for row in csv.reader(lines, skipinitialspace=True)
+        if row  # DictReader skips empty lines, too
+    ]
+    for row in rows:
+        if len(row) != len(fieldnames):
+            raise ValueError(
+                f"CSV row {row} does not match the header {fieldnames}"
+            )
+    columns = dict(zip(fieldnames, map(list, zip(*rows))))
+    if not rows:
+        columns = {key: [] for key in fieldnames}
+    variable_finder = re.compile(r"\$([\w.]+)")
+    for key, values in columns.items():
+        if key == "ID":
+            columns[key] = StringColumn.from_strings(values)
+            continue
+        # Replaced value by value, so that the values stay aligned with the
+        # ids even if a replacement contains a newline:
+        values = [
+            _replace_variables(value, variable_finder, replacements)
+            if "$" in value
+            else value
+            for value in values
+        ]
+        if key == "duration":
+            columns[key] = np.array(values, dtype=float)
+        else:
+            columns[key] = _string_column(values)
+    return columns
+
+
+def _replace_variables(value, variable_finder, replacements):
+    """Replaces the $variables of a CSV value."""
+    try:
+        return variable_finder.sub(
+            lambda match: str(replacements[match[1]]), value
+        )
+    except KeyError:
+        raise KeyError(
+            f"The item {value} requires replacements which were not supplied."
+        )
+
+
+def _string_column(strings):
+    """Interns the strings, if there are few unique ones, else packs them."""
+    column = CategoricalColumn.from_strings(strings)
+    if len(column.categories) <= len(column) * MAX_UNIQUE_RATIO:
+        return column
+    return StringColumn.from_strings(strings)
+
+
+def _concatenate_columns(parts):
+    """Joins the columns of consecutive chunks of data points."""
+    if all(isinstance(part, np.ndarray) for part in parts):
+        return np.concatenate(parts)
+    if all(isinstance(part, CategoricalColumn) for part in parts):
+        table = {}
+        codes = []
+        for part in parts:
+            remap = np.array(
+                [
+                    table.setdefault(category, len(table))
+                    for category in part.categories
+                ],
+                dtype=np.int32,
+            )
+            codes.append(remap[part.codes])
+        codes = np.concatenate(codes)
+        if len(table) <= len(codes) * MAX_UNIQUE_RATIO:
+            return CategoricalColumn(codes, StringColumn.from_strings(table))
+    if all(
+        isinstance(part, (StringColumn, CategoricalColumn)) for part in parts
+    ):
+        return StringColumn.concatenate(
+            part.to_strings() if isinstance(part, CategoricalColumn) else part
+            for part in parts
+        )
+    return [value for part in parts for value in part]
+
+
+def _to_column(values, length):
+    """Numbers become NumPy arrays, strings are packed or interned, anything
+    else stays a list."""
+    if isinstance(values, (np.ndarray, StringColumn, CategoricalColumn)):
+        column = values
+    elif values and all(type(value) is int for value in values):
+        try:
+            column = np.array(values, dtype=np.int64)
+        except OverflowError:
+            column = list(values)
+    elif values and all(type(value) is float for value in values):
+        column = np.array(values, dtype=np.float64)
+    elif values and all(type(value) is str for value in values):
+        column = _string_column(values)
+    else:
+        column = list(values)
+    if len(column) != length:
+        raise ValueError("All columns must have one value per data point.")
+    return column
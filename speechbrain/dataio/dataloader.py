@@ -37,17 +37,32 @@ Authors:
 from torch.utils.data import DataLoader
 from torch.utils.data import IterableDataset
 from torch.utils.data.dataloader import _BaseDataLoaderIter
+import copy
+import json
+import queue
+import torch
 import logging
 import warnings
 import functools
+import threading
+import collections
 from speechbrain.dataio.batch import PaddedBatch, BatchsizeGuesser
-from speechbrain.dataio.dataset import DynamicItemDataset
+from speechbrain.dataio.dataset import (
+    DynamicItemDataset,
+    IterableDynamicItemDataset,
+    STREAM_POSITION_KEY,
+    _stream_info,
+)
 from speechbrain.dataio.sampler import ReproducibleRandomSampler
 from speechbrain.utils.checkpoints import (
     register_checkpoint_hooks,
     mark_as_saver,
     mark_as_loader,
 )
+from speechbrain.utils.data_utils import recursive_to
+from torch.utils.data._utils.pin_memory import (
+    pin_memory as recursive_pin_memory,
+)
 
 # Optional support for webdataset
 try:
@@ -60,7 +75,13 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
-def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
+def make_dataloader(
+    dataset,
+    looped_nominal_epoch=None,
+    prefetch_batches=0,
+    prefetch_device=None,
+    **loader_kwargs,
+):
     """Makes a basic DataLoader with SpeechBrain defaults.
 
     For DynamicItemDatasets (which return dicts), use
@@ -68,8 +89,8 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
 
     Shuffling gets implemented by ReproducibleRandomSampler.
 
-    If the Dataset is not an IterableDataset, the DataLoader
-    is a SaveableDataLoader.
+    If the Dataset is not an IterableDataset (or is an
+    IterableDynamicItemDataset), the DataLoader is a SaveableDataLoader.
 
     If the Dataset is a webdataset.dataset.Composable, set default
     batch_size = None.
@@ -77,6 +98,9 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     Can also loop over the underlying dataloader continuously,
     and stop iterations at nominal epoch lengths.
 
+    Can also prefetch batches in a background thread, and move them to the
+    device ahead of time, see PrefetchLoader.
+
     Arguments
     ---------
     dataset : Dataset
@@ -85,6 +109,11 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
         If an integer is given, loop the underlying DataLoader infinitely and
         set a nominal epoch length in batches (or whatever the DataLoader
         yields).
+    prefetch_batches : int
+        If positive, wrap the DataLoader in a PrefetchLoader which keeps this
+        many batches ready ahead of time.
+    prefetch_device : str, torch.device, None
+        The device the PrefetchLoader moves the batches to.
     **loader_kwargs : dict
         Keyword args to DataLoader, see PyTorch DataLoader for
         options.
@@ -92,13 +121,15 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     Returns
     -------
     DataLoader
-        If looped_nominal_epoch is None
+        If looped_nominal_epoch is None and prefetch_batches is 0
+    PrefetchLoader
+        If looped_nominal_epoch is None and prefetch_batches is positive
     LoopedLoader
         If looped_nominal_epoch is not None
     """
     # PaddedBatch as default collation for DynamicItemDataset
     if "collate_fn" not in loader_kwargs and isinstance(
-        dataset, DynamicItemDataset
+        dataset, (DynamicItemDataset, IterableDynamicItemDataset)
     ):
         loader_kwargs["collate_fn"] = PaddedBatch
     # Reproducible random sampling
@@ -125,10 +156,16 @@ def make_dataloader(dataset, looped_nominal_epoch=None, **loader_kwargs):
     ):
         loader_kwargs["batch_size"] = None
     # Create the loader
-    if isinstance(dataset, IterableDataset):
+    if isinstance(dataset, IterableDataset) and not isinstance(
+        dataset, IterableDynamicItemDataset
+    ):
         dataloader = DataLoader(dataset, **loader_kwargs)
     else:
         dataloader = SaveableDataLoader(dataset, **loader_kwargs)
+    if prefetch_batches > 0:
+        dataloader = PrefetchLoader(
+            dataloader, prefetch_batches, device=prefetch_device
+        )
     if looped_nominal_epoch is not None:
         dataloader = LoopedLoader(dataloader, looped_nominal_epoch)
     return dataloader
@@ -199,19 +236,37 @@ class SaveableDataLoader(DataLoader):
     which performance was the best. Thus, if a checkpoint is loaded after
     entering __iter__, we just assume it is for this reason. A warning is
     logged, but that is all.
+    3. For an IterableDynamicItemDataset, the position saved is the shard and
+    the offset in the shard which each stream (DataLoader worker, in each
+    process) has reached, instead of the number of batches. The dataset
+    reports these positions along with each data point, so it should not be
+    used with other DataLoaders after being given to this one.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if isinstance(self.dataset, IterableDataset):
+        self._speechbrain_streaming = isinstance(
+            self.dataset, IterableDynamicItemDataset
+        )
+        if self._speechbrain_streaming:
+            self.dataset.report_positions = True
+            self.collate_fn = _StreamPositionCollate(self.collate_fn)
+        elif isinstance(self.dataset, IterableDataset):
             logging.warning(
                 "SaveableDataLoader cannot save the position in an "
                 "IterableDataset. Save the position on the dataset itself."
             )
         self._speechbrain_recovery_skip_to = None
         self._speechbrain_iterator = None
+        self._speechbrain_stream_state = None
+        self._speechbrain_stream_resume = None
 
     def __iter__(self):
+        if self._speechbrain_streaming:
+            # The dataset (or its copies in the workers) resumes the epoch
+            # if recovered, otherwise starts it from the beginning:
+            self.dataset.resume_state = self._speechbrain_stream_resume
+            self._speechbrain_stream_resume = None
         iterator = super().__iter__()
         # Keep a reference to the iterator,
         # to be able to access the iterator._num_yielded value.
@@ -220,10 +275,39 @@ class SaveableDataLoader(DataLoader):
         # after the iterator has been exhausted, but before the full epoch has
         # ended (e.g. validation is still running)
         self._speechbrain_iterator = iterator
+        if self._speechbrain_streaming:
+            return self._track_stream_positions(iterator)
         return iterator
 
-    @mark_as_saver
-    def _speechbrain_save(self, path):
+    def _track_stream_positions(self, iterator):
+        resumed = self.dataset.resume_state
+        if resumed is not None and resumed["epoch"] == self.dataset.epoch:
+            positions = dict(resumed["positions"])
+        else:
+            positions = {}
+        self._speechbrain_stream_state = {
+            "epoch": self.dataset.epoch,
+            "num_streams": None,
+            "positions": positions,
+        }
+        for batch, batch_positions, num_streams in iterator:
+            self._speechbrain_stream_state["num_streams"] = num_streams
+            positions.update(batch_positions)
+            yield batch
+
+    def _speechbrain_position(self):
+        """The position reached: number of batches, or state of the streams"""
+        if self._speechbrain_streaming:
+            return copy.deepcopy(self._speechbrain_stream_state)
+        if self._speechbrain_iterator is None:
+            return None
+        return self._speechbrain_iterator._num_yielded
+
+    def _speechbrain_write_position(self, path, position):
+        if self._speechbrain_streaming:
+            with open(path, "w") as fo:
+                json.dump(position, fo)
+            return
         if isinstance(self.dataset, IterableDataset):
             logging.warning(
                 "Warning again: a checkpoint was requested on "
@@ -231,12 +315,12 @@ class SaveableDataLoader(DataLoader):
                 "Cannot save the position in an IterableDataset. Not raising "
                 "an error; assuming that you know what you're doing."
             )
-        if self._speechbrain_iterator is None:
-            to_save = None
-        else:
-            to_save = self._speechbrain_iterator._num_yielded
         with open(path, "w") as fo:
-            fo.write(str(to_save))
+            fo.write(str(position))
+
+    @mark_as_saver
+    def _speechbrain_save(self, path):
+        self._speechbrain_write_position(path, self._speechbrain_position())
 
     @mark_as_loader
     def _speechbrain_load(self, path, end_of_epoch, device=None):
@@ -256,13 +340,190 @@ class SaveableDataLoader(DataLoader):
             return
         with open(path) as fi:
             saved = fi.read()
-            if saved == str(None):
+            if saved == str(None) or saved == "null":
                 # Saved at a point where e.g. an iterator did not yet exist.
                 return
+            elif self._speechbrain_streaming:
+                self._speechbrain_stream_resume = json.loads(saved)
             else:
                 self._speechbrain_recovery_skip_to = int(saved)
 
 
+@register_checkpoint_hooks
+class PrefetchLoader:
+    """Loads batches ahead of time, and moves them to the device.
+
+    A background thread iterates the underlying loader, so that, e.g.,
+    collation with num_workers=0 happens while the model computes. When the
+    device is a CUDA device, the batches are also pinned (unless the loader
+    already pins them) and copied to the device asynchronously on a side
+    stream. The copy of the next batches then overlaps with the computation
+    on the current one. Moving the batches to the device in the step (e.g.
+    ``batch.to(self.device)`` in ``compute_forward``) is then a no-op.
+
+    When wrapping a SaveableDataLoader, checkpoints save the position of the
+    last batch yielded by this, rather than of the batches prefetched.
+
+    Arguments
+    ---------
+    loader : iterable
+        The DataLoader (or other iterable of batches) to prefetch from.
+    num_prefetch : int
+        The number of batches to keep ready (or in flight to the device).
+    device : str, torch.device, None
+        The device to move the batches to. None means the batches are not
+        moved.
+    pin_memory : bool, None
+        Whether to pin the batches before the copy. By default, pins if the
+        device is a CUDA device and the loader does not already pin.
+
+    Example
+    -------
+    >>> import torch
+    >>> loader = PrefetchLoader(SaveableDataLoader(torch.arange(6)), 2)
+    >>> [int(batch) for batch in loader]
+    [0, 1, 2, 3, 4, 5]
+    """
+
+    def __init__(self, loader, num_prefetch=2, device=None, pin_memory=None):
+        self.loader = loader
+        self.num_prefetch = max(num_prefetch, 1)
+        self.device = torch.device(device) if device is not None else None
+        self.to_cuda = self.device is not None and self.device.type == "cuda"
+        if pin_memory is None:
+            pin_memory = self.to_cuda and not getattr(
+                loader, "pin_memory", False
+            )
+        self.pin_memory = pin_memory
+        self._position = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._produce, args=(batches, stop), daemon=True
+        )
+        thread.start()
+        stream = torch.cuda.Stream(self.device) if self.to_cuda else None
+        in_flight = collections.deque()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.num_prefetch:
+                    item = batches.get()
+                    if item is _END_OF_DATA:
+                        exhausted = True
+                    elif isinstance(item, _ProducerError):
+                        raise item.error
+                    else:
+                        in_flight.append(self._start_copy(stream, *item))
+                if not in_flight:
+                    return
+                batch, position, copied = in_flight.popleft()
+                if copied is not None:
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(copied)
+                    # The memory was allocated on the side stream, make sure
+                    # it is not reused before the computation is done:
+                    for tensor in _tensors(batch):
+                        tensor.record_stream(current_stream)
+                self._position = position
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+    def _start_copy(self, stream, batch, position):
+        if self.device is None:
+            return batch, position, None
+        if stream is None:
+            return recursive_to(batch, self.device), position, None
+        with torch.cuda.stream(stream):
+            batch = recursive_to(batch, self.device, non_blocking=True)
+            copied = torch.cuda.Event()
+            copied.record(stream)
+        return batch, position, copied
+
+    def _produce(self, batches, stop):
+        """Runs in the background thread."""
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for batch in self.loader:
+                if self.pin_memory:
+                    batch = recursive_pin_memory(batch)
+                position = None
+                if isinstance(self.loader, SaveableDataLoader):
+                    position = self.loader._speechbrain_position()
+                if not put((batch, position)):
+                    return
+            put(_END_OF_DATA)
+        except Exception as e:
+            put(_ProducerError(e))
+
+    @mark_as_saver
+    def _speechbrain_save(self, path):
+        if isinstance(self.loader, SaveableDataLoader):
+            self.loader._speechbrain_write_position(path, self._position)
+
+    @mark_as_loader
+    def _speechbrain_load(self, path, end_of_epoch, device=None):
+        if isinstance(self.loader, SaveableDataLoader):
+            self.loader._speechbrain_load(path, end_of_epoch, device)
+
+
+_END_OF_DATA = object()
+_ProducerError = collections.namedtuple("_ProducerError", ["error"])
+
+
+def _tensors(data):
+    """Finds all the tensors in a batch."""
+    if isinstance(data, torch.Tensor):
+        yield data
+    elif isinstance(data, (str, bytes)):
+        return
+    elif isinstance(data, collections.abc.Mapping):
+        for value in data.values():
+            yield from _tensors(value)
+    elif isinstance(data, (collections.abc.Sequence, PaddedBatch)):
+        for value in data:
+            yield from _tensors(value)
+
+
+class _StreamPositionCollate:
+    """Separates the stream positions from the data points, then collates.
+
+    Returns the batch, the position of the stream after the batch, and the
+    number of streams. This runs in the DataLoader workers.
+    """
+
+    def __init__(self, collate_fn):
+        self.collate_fn = collate_fn
+
+    def __call__(self, data_points):
+        positions = {}
+        if isinstance(data_points, dict):  # No automatic batching
+            stream, position = data_points.pop(STREAM_POSITION_KEY)
+            positions[str(stream)] = position
+        else:
+            for data_point in data_points:
+                stream, position = data_point.pop(STREAM_POSITION_KEY)
+                positions[str(stream)] = position
+        _, num_streams = _stream_info()
+        return self.collate_fn(data_points), positions, num_streams
+
+
 @register_checkpoint_hooks
 class LoopedLoader:
     """Loops an underlying iterable indefinitely, with nominal epoch lengths
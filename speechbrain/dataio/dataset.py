@@ -5,12 +5,24 @@ Authors
   * Samuele Cornell 2020
 """
 
+import os
 import copy
+import json
+import random
+import tarfile
 import contextlib
+import numpy as np
+import torch
 from types import MethodType
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset
 from speechbrain.utils.data_pipeline import DataPipeline
 from speechbrain.dataio.dataio import load_data_json, load_data_csv
+from speechbrain.dataio.columnar import (
+    ColumnarData,
+    CategoricalColumn,
+    load_data_json_columnar,
+    load_data_csv_columnar,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -147,7 +159,11 @@ class DynamicItemDataset(Dataset):
         self, data, dynamic_items=[], output_keys=[],
     ):
         self.data = data
-        self.data_ids = list(self.data.keys())
+        if isinstance(data, ColumnarData):
+            # Keep the ids compact, too
+            self.data_ids = data.data_ids
+        else:
+            self.data_ids = list(self.data.keys())
         static_keys = list(self.data[self.data_ids[0]].keys())
         if "id" in static_keys:
             raise ValueError("The key 'id' is reserved for the data point id.")
@@ -164,13 +180,13 @@ class DynamicItemDataset(Dataset):
         data_point = self.data[data_id]
         return self.pipeline.compute_outputs({"id": data_id, **data_point})
 
-    def add_dynamic_item(self, func, takes=None, provides=None):
+    def add_dynamic_item(self, func, takes=None, provides=None, cache=None):
         """Makes a new dynamic item available on the dataset.
 
         Two calling conventions. For DynamicItem objects, just use:
         add_dynamic_item(dynamic_item).
         But otherwise, should use:
-        add_dynamic_item(func, takes, provides).
+        add_dynamic_item(func, takes, provides, cache).
 
         See `speechbrain.utils.data_pipeline`.
 
@@ -189,8 +205,12 @@ class DynamicItemDataset(Dataset):
             A single arg can be given directly.
         provides : str
             Unique key or keys that this provides.
+        cache : DiskCache, LRUCache, None
+            If given, the outputs of func are cached in this store, so that
+            they are only computed once per data point. Only for deterministic
+            functions. See `speechbrain.utils.data_pipeline.cache`.
         """
-        self.pipeline.add_dynamic_item(func, takes, provides)
+        self.pipeline.add_dynamic_item(func, takes, provides, cache)
 
     def set_output_keys(self, keys):
         """Use this to change the output keys.
@@ -280,6 +300,10 @@ class DynamicItemDataset(Dataset):
         NOTE
         ----
         Temporarily changes the output keys!
+
+        If the data is a `ColumnarData` and all the keys used are static
+        numeric (or "id") columns, filtering and sorting are vectorized and no
+        output keys are changed.
         """
         filtered_sorted_ids = self._filtered_sorted_ids(
             key_min_value, key_max_value, key_test, sort_key, reverse, select_n,
@@ -297,7 +321,32 @@ class DynamicItemDataset(Dataset):
         reverse=False,
         select_n=None,
     ):
-        """Returns a list of data ids, fulfilling the sorting and filtering."""
+        """Returns the data ids fulfilling the sorting and filtering.
+
+        A list, or a `StringColumn` if the data is a `ColumnarData`.
+        """
+        if isinstance(self.data, ColumnarData):
+            # Comparisons and sorting need numeric columns, tests can take
+            # any static column:
+            compared_keys = (
+                set(key_min_value.keys())
+                | set(key_max_value.keys())
+                | set([] if sort_key is None else [sort_key])
+            )
+            if all(
+                isinstance(self.data.columns.get(key), np.ndarray)
+                for key in compared_keys
+            ) and all(
+                key == "id" or key in self.data.columns for key in key_test
+            ):
+                return self._filtered_sorted_ids_columnar(
+                    key_min_value,
+                    key_max_value,
+                    key_test,
+                    sort_key,
+                    reverse,
+                    select_n,
+                )
 
         def combined_filter(computed):
             for key, limit in key_min_value.items():
@@ -348,20 +397,99 @@ class DynamicItemDataset(Dataset):
             filtered_sorted_ids = filtered_ids
         return filtered_sorted_ids
 
+    def _filtered_sorted_ids_columnar(
+        self,
+        key_min_value,
+        key_max_value,
+        key_test,
+        sort_key,
+        reverse,
+        select_n,
+    ):
+        """Vectorized version of _filtered_sorted_ids, on static columns."""
+        positions = self.data.index_of(self.data_ids)
+
+        def column(key):
+            if key == "id":
+                return self.data_ids
+            values = self.data.column(key)
+            if isinstance(values, np.ndarray):
+                return values[positions]
+            if isinstance(values, list):
+                return [values[i] for i in positions.tolist()]
+            return values.take(positions)
+
+        def test(func, values):
+            if isinstance(values, np.ndarray):
+                values = values.tolist()
+            return np.fromiter(
+                (bool(func(value)) for value in values),
+                dtype=bool,
+                count=len(values),
+            )
+
+        keep = np.ones(len(positions), dtype=bool)
+        for key, limit in key_min_value.items():
+            keep &= column(key) >= limit
+        for key, limit in key_max_value.items():
+            keep &= column(key) <= limit
+        for key, func in key_test.items():
+            values = self.data.column(key) if key != "id" else None
+            if isinstance(values, CategoricalColumn):
+                # Interned strings: only need to test each unique value once
+                keep &= test(func, values.categories)[values.codes[positions]]
+            else:
+                keep &= test(func, column(key))
+        selected = np.flatnonzero(keep)
+        if select_n is not None:
+            selected = selected[:select_n]
+        if sort_key is not None:
+            # Stable sort, ties keep the current order (reversed, if reverse,
+            # just like sorting (value, index) tuples in reverse).
+            order = np.argsort(column(sort_key)[selected], kind="stable")
+            selected = selected[order]
+            if reverse:
+                selected = selected[::-1]
+        return self.data.data_ids.take(positions[selected])
+
     @classmethod
     def from_json(
-        cls, json_path, replacements={}, dynamic_items=[], output_keys=[]
+        cls,
+        json_path,
+        replacements={},
+        dynamic_items=[],
+        output_keys=[],
+        columnar=False,
     ):
-        """Load a data prep JSON file and create a Dataset based on it."""
-        data = load_data_json(json_path, replacements)
+        """Load a data prep JSON file and create a Dataset based on it.
+
+        If columnar is True, the static data is stored as a `ColumnarData`.
+        """
+        if columnar:
+            data = load_data_json_columnar(json_path, replacements)
+        else:
+            data = load_data_json(json_path, replacements)
         return cls(data, dynamic_items, output_keys)
 
     @classmethod
     def from_csv(
-        cls, csv_path, replacements={}, dynamic_items=[], output_keys=[]
+        cls,
+        csv_path,
+        replacements={},
+        dynamic_items=[],
+        output_keys=[],
+        columnar=False,
+        num_workers=1,
     ):
-        """Load a data prep CSV file and create a Dataset based on it."""
-        data = load_data_csv(csv_path, replacements)
+        """Load a data prep CSV file and create a Dataset based on it.
+
+        If columnar is True, the static data is stored as a `ColumnarData`,
+        and the file is parsed with num_workers processes.
+        """
+        if columnar:
+            data = load_data_csv_columnar(csv_path, replacements, num_workers)
+        else:
+            data = load_data_csv(csv_path, replacements)
         return cls(data, dynamic_items, output_keys)
 
     @classmethod
@@ -403,10 +531,270 @@ class FilteredSortedDynamicItemDataset(DynamicItemDataset):
         raise TypeError("Cannot create SubsetDynamicItemDataset directly!")
 
 
-def add_dynamic_item(datasets, func, takes=None, provides=None):
+class IterableDynamicItemDataset(IterableDataset):
+    """Streams data points from shards, producing dicts like DynamicItemDataset.
+
+    For corpora that are too large for a manifest, the data can be stored in
+    shards: files that each hold many data points, read sequentially. The
+    data points read from the shards are the static data; dynamic items,
+    output keys and so on work just like in `DynamicItemDataset`.
+
+    Each process of a DDP run, and each DataLoader worker in each process,
+    reads its own subset of the shards: the shards are split in a round
+    robin fashion over all the ``world_size * num_workers`` streams. So there
+    should be (many) more shards than streams, ideally with a multiple of the
+    number of streams, since DDP expects the same number of batches on every
+    process.
+
+    Shuffling is approximate: the shard order is shuffled each epoch (see
+    `set_epoch`), and the data points are shuffled through a bounded buffer.
+
+    When iterated through a `SaveableDataLoader`, mid-epoch checkpoints store
+    the shard and the offset in the shard that each stream has reached.
+    Recovery then resumes from there, provided that the number of streams is
+    the same. The data points which were in the shuffle buffer at the time of
+    the checkpoint are skipped for the rest of that epoch.
+
+    Arguments
+    ---------
+    shards : list
+        Paths to the shards.
+    dynamic_items : list, optional
+        Configuration for the dynamic items produced when fetching an example.
+        See `DynamicItemDataset`.
+    output_keys : dict, list, optional
+        List of keys (either directly available in data or dynamic items)
+        to include in the output dict. See `DynamicItemDataset`.
+    static_keys : list, None
+        The keys of the data points in the shards (other than "id"). If None,
+        these are read from the first data point of the first shard.
+    shard_reader : callable, None
+        Called as ``shard_reader(path, start)``, should return an iterator
+        over the data point dicts in the shard, starting from the data point
+        at index start. Each data point must have a unique "id". The default
+        is `read_tar_shard`.
+    shuffle_shards : bool
+        Whether to shuffle the order of the shards (the same way on all
+        processes) each epoch.
+    shuffle_buffer : int
+        Size of the buffer to shuffle data points through. 0 means no
+        shuffling of the data points.
+    seed : int
+        Random seed for the shard and data point shuffling.
+
+    Example
+    -------
+    >>> import io, json, tarfile
+    >>> shards = []
+    >>> for shard in range(2):
+    ...     path = getfixture('tmpdir') / f"shard-{shard}.tar"
+    ...     with tarfile.open(path, "w") as tar:
+    ...         for i in range(3):
+    ...             data = json.dumps({"words": f"utt {shard} {i}"}).encode()
+    ...             info = tarfile.TarInfo(f"utt{shard}-{i}.json")
+    ...             info.size = len(data)
+    ...             tar.addfile(info, io.BytesIO(data))
+    ...     shards.append(path)
+    >>> dataset = IterableDynamicItemDataset(shards, output_keys=["id"])
+    >>> dataset.add_dynamic_item(str.split, "words", "tokens")
+    >>> dataset.set_output_keys(["id", "tokens"])
+    >>> next(iter(dataset))
+    {'id': 'utt0-0', 'tokens': ['utt', '0', '0']}
+    >>> len(list(dataset))
+    6
+    """
+
+    def __init__(
+        self,
+        shards,
+        dynamic_items=[],
+        output_keys=[],
+        static_keys=None,
+        shard_reader=None,
+        shuffle_shards=False,
+        shuffle_buffer=0,
+        seed=563375142,
+    ):
+        self.shards = list(shards)
+        if not self.shards:
+            raise ValueError("No shards given.")
+        self.shard_reader = shard_reader or read_tar_shard
+        self.shuffle_shards = shuffle_shards
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        # Set by SaveableDataLoader:
+        self.report_positions = False
+        self.resume_state = None
+        if static_keys is None:
+            first = next(iter(self.shard_reader(self.shards[0], 0)))
+            static_keys = [key for key in first if key != "id"]
+        static_keys = list(static_keys)
+        if "id" in static_keys:
+            raise ValueError("The key 'id' is reserved for the data point id.")
+        static_keys.append("id")
+        self.pipeline = DataPipeline(static_keys, dynamic_items)
+        self.set_output_keys(output_keys)
+
+    def add_dynamic_item(self, func, takes=None, provides=None, cache=None):
+        """Makes a new dynamic item available on the dataset.
+
+        See `DynamicItemDataset.add_dynamic_item`.
+        """
+        self.pipeline.add_dynamic_item(func, takes, provides, cache)
+
+    def set_output_keys(self, keys):
+        """Use this to change the output keys.
+
+        See `DynamicItemDataset.set_output_keys`.
+        """
+        self.pipeline.set_output_keys(keys)
+
+    @contextlib.contextmanager
+    def output_keys_as(self, keys):
+        """Context manager to temporarily set output keys."""
+        saved_output = self.pipeline.output_mapping
+        self.pipeline.set_output_keys(keys)
+        yield self
+        self.pipeline.set_output_keys(saved_output)
+
+    def set_epoch(self, epoch):
+        """Sets the epoch, which determines the shard order if shuffled.
+
+        Like with DistributedSampler, this should be called at the start of
+        every epoch, with the same value on every process.
+        """
+        self.epoch = epoch
+
+    def stream_shards(self, stream, num_streams, epoch):
+        """The shards which the given stream reads, in order, in an epoch."""
+        shards = list(self.shards)
+        if self.shuffle_shards:
+            random.Random(self.seed + epoch).shuffle(shards)
+        return shards[stream::num_streams]
+
+    def __iter__(self):
+        stream, num_streams = _stream_info()
+        if stream == 0 and num_streams > len(self.shards):
+            logger.warning(
+                f"Only {len(self.shards)} shards for {num_streams} streams "
+                "(processes times DataLoader workers): some streams are empty."
+            )
+        shards = self.stream_shards(stream, num_streams, self.epoch)
+        shard_index, offset = 0, 0
+        state = self.resume_state
+        if (
+            state is not None
+            and state["epoch"] == self.epoch
+            and state["positions"]
+        ):
+            if state["num_streams"] == num_streams:
+                shard_index, offset = state["positions"].get(
+                    str(stream), (0, 0)
+                )
+            elif stream == 0:
+                logger.warning(
+                    "The number of streams has changed since the checkpoint, "
+                    "cannot resume the epoch. Starting it over."
+                )
+        rng = random.Random((self.seed + self.epoch) * num_streams + stream)
+        buffer = []
+        for shard_index in range(shard_index, len(shards)):
+            for data_point in self.shard_reader(shards[shard_index], offset):
+                offset += 1
+                if self.shuffle_buffer > 0:
+                    if len(buffer) < self.shuffle_buffer:
+                        buffer.append(data_point)
+                        continue
+                    i = rng.randrange(len(buffer))
+                    buffer[i], data_point = data_point, buffer[i]
+                yield self._compute(data_point, stream, (shard_index, offset))
+            offset = 0
+        rng.shuffle(buffer)
+        for data_point in buffer:
+            yield self._compute(data_point, stream, (len(shards), 0))
+
+    def _compute(self, data_point, stream, position):
+        outputs = self.pipeline.compute_outputs(data_point)
+        if self.report_positions:
+            outputs[STREAM_POSITION_KEY] = (stream, position)
+        return outputs
+
+
+# Reserved output key for reporting the position of each stream to the loader.
+STREAM_POSITION_KEY = "_stream_position"
+
+
+def _stream_info():
+    """This stream's index and the number of streams (ranks times workers)."""
+    rank, world_size = 0, 1
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        rank = torch.distributed.get_rank()
+        world_size = torch.distributed.get_world_size()
+    worker_id, num_workers = 0, 1
+    worker_info = torch.utils.data.get_worker_info()
+    if worker_info is not None:
+        worker_id, num_workers = worker_info.id, worker_info.num_workers
+    return rank * num_workers + worker_id, world_size * num_workers
+
+
+def read_tar_shard(path, start=0):
+    """Reads the data points from a tar file, in the WebDataset layout.
+
+    The files of a data point are consecutive in the tar, and share the same
+    name up to the first dot, which becomes the data point "id". The keys of
+    JSON files (.json) become items of the data point, text files (.txt)
+    become str items, and any other files are bytes items. The key of these
+    items is the extension, e.g. the audio of "utt1.flac" is the bytes item
+    "flac", which can be decoded with
+    ``torchaudio.load(io.BytesIO(flac))``. Compressed tars are supported.
+
+    Arguments
+    ---------
+    path : str
+        Path to the tar file.
+    start : int
+        Index of the first data point to read. The files of the skipped data
+        points are not decoded.
+
+    Yields
+    ------
+    dict
+        The data points.
+    """
+    data_point = None
+    data_id = None
+    index = -1
+    with tarfile.open(path, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            dirname, basename = os.path.split(member.name)
+            stem, _, extension = basename.partition(".")
+            key = f"{dirname}/{stem}" if dirname else stem
+            if key != data_id:
+                if data_point is not None:
+                    yield data_point
+                data_id = key
+                index += 1
+                data_point = {"id": key} if index >= start else None
+            if data_point is None:
+                continue
+            content = tar.extractfile(member).read()
+            if extension == "json":
+                data_point.update(json.loads(content))
+            elif extension == "txt":
+                data_point[extension] = content.decode("utf-8")
+            else:
+                data_point[extension] = content
+    if data_point is not None:
+        yield data_point
+
+
+def add_dynamic_item(datasets, func, takes=None, provides=None, cache=None):
     """Helper for adding the same item to multiple datasets."""
     for dataset in datasets:
-        dataset.add_dynamic_item(func, takes, provides)
+        dataset.add_dynamic_item(func, takes, provides, cache)
 
 
 def set_output_keys(datasets, output_keys):
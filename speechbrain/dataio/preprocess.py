@@ -1,7 +1,30 @@
 """Preprocessors for audio"""
+import os
 import torch
-import functools
+import torchaudio
+import threading
 from speechbrain.processing.speech_augmentation import Resample
+from speechbrain.utils.cache import LRUCache
+
+# Resample builds its filters on the first call, so the resamplers are shared
+# by all AudioNormalizers, one per (orig_freq, new_freq) pair. That lazy
+# initialization is not thread-safe, so each thread has its own resamplers.
+_MAX_RESAMPLERS = 32
+_resamplers = threading.local()
+
+
+def _cached_resample(orig_freq, new_freq):
+    """The resampler of this thread for the given pair of sample rates."""
+    resamplers = getattr(_resamplers, "cache", None)
+    if resamplers is None:
+        resamplers = _resamplers.cache = {}
+    key = (orig_freq, new_freq)
+    resampler = resamplers.get(key)
+    if resampler is None:
+        if len(resamplers) >= _MAX_RESAMPLERS:
+            del resamplers[next(iter(resamplers))]
+        resampler = resamplers[key] = Resample(orig_freq, new_freq)
+    return resampler
 
 
 class AudioNormalizer:
@@ -41,7 +64,7 @@ class AudioNormalizer:
         if mix not in ["avg-to-mono", "keep"]:
             raise ValueError(f"Unexpected mixing configuration {mix}")
         self.mix = mix
-        self._cached_resample = functools.lru_cache(maxsize=12)(Resample)
+        self._cached_resample = _cached_resample
 
     def __call__(self, audio, sample_rate):
         """Perform normalization
@@ -65,3 +88,80 @@ class AudioNormalizer:
             return torch.mean(audio, 1)
         if self.mix == "keep":
             return audio
+
+
+class AudioCache:
+    """Size-bounded cache of decoded and normalized audio files.
+
+    Meant to be shared by several models (e.g. ASR, speaker recognition and
+    VAD) which process the same files: each file is then only decoded and
+    resampled once per target format. The entries are keyed by the path and
+    modification time of the file, and by the sample rate and mixing of the
+    normalizer, so changed files are decoded again. Thread-safe.
+
+    Arguments
+    ---------
+    max_bytes : int
+        Maximum total size of the cached audio, in bytes.
+
+    Example
+    -------
+    >>> cache = AudioCache(max_bytes=2 ** 24)
+    >>> normalizer = AudioNormalizer(sample_rate=8000)
+    >>> example_file = 'samples/audio_samples/example_multichannel.wav'
+    >>> audio = cache.load(example_file, normalizer)
+    >>> audio = cache.load(example_file, normalizer)
+    >>> audio.shape, cache.hits, cache.misses
+    (torch.Size([16941]), 1, 1)
+    """
+
+    def __init__(self, max_bytes=2 ** 30):
+        self._cache = LRUCache(max_bytes)
+        self._lock = threading.Lock()
+
+    @property
+    def hits(self):
+        """Number of loads served from the cache."""
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        """Number of loads which decoded the file."""
+        return self._cache.misses
+
+    def load(self, path, normalizer):
+        """Loads an audio file, normalized by the given AudioNormalizer.
+
+        Arguments
+        ---------
+        path : str
+            Path to a local audio file.
+        normalizer : AudioNormalizer
+            Converts the audio to the format the model expects.
+
+        Returns
+        -------
+        torch.Tensor
+            The normalized audio. A copy, which can be modified freely.
+        """
+        stat = os.stat(path)
+        key = (
+            os.path.abspath(path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            normalizer.sample_rate,
+            normalizer.mix,
+        )
+        with self._lock:
+            audio = self._cache.get(key)
+        if audio is None:
+            signal, sr = torchaudio.load(str(path), channels_first=False)
+            audio = normalizer(signal, sr)
+            with self._lock:
+                self._cache.put(key, audio)
+        return audio.clone()
+
+    def clear(self):
+        """Removes all the cached audio."""
+        with self._lock:
+            self._cache.clear()
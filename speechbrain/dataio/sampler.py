@@ -20,6 +20,10 @@ from torch.utils.data import (
 import numpy as np
 from typing import List
 from speechbrain.dataio.dataset import DynamicItemDataset
+from speechbrain.dataio.iterators import (
+    padding_ratio,
+    total_length_with_padding,
+)
 from scipy.stats import lognorm
 
 logger = logging.getLogger(__name__)
@@ -342,6 +346,14 @@ class DynamicBatchSampler(Sampler):
     The buckets can also be specified by passing a list to the bucket_boundaries
     argument instead of specifying a left_bucket_length and a bucket_length_multiplier.
 
+    Alternatively, with packing=True, no buckets are used. Instead, the
+    examples (shuffled, if shuffle=True) are split into windows of
+    packing_window examples, each window is sorted by length, and cut into
+    batches such that each batch fits max_batch_length including padding
+    (i.e. number of examples times the longest length). Among the cuts with
+    the fewest batches, the one with the least padding is chosen (by dynamic
+    programming). Larger windows mean less padding, but less randomization.
+
     Example
     -------
     >>> import torch
@@ -403,9 +415,17 @@ class DynamicBatchSampler(Sampler):
         The epoch to start at.
     drop_last : bool
          If ``True``, the sampler will drop the last examples which
-         have not been grouped.
+         have not been grouped. Not used with packing.
     verbose: bool
         If ``True``, log also the stats for each batch at the first epoch.
+    packing : bool
+        If ``True``, batches are formed by padding-optimal packing of sorted
+        windows, instead of filling buckets. num_buckets and
+        bucket_boundaries are then not needed.
+    packing_window : int
+        Number of examples in each packing window. None means that the
+        whole dataset is packed at once (then shuffle only affects the
+        batch order, and packing is slower).
     """
 
     def __init__(
@@ -423,33 +443,35 @@ class DynamicBatchSampler(Sampler):
         epoch: int = 0,
         drop_last: bool = False,
         verbose: bool = False,
+        packing: bool = False,
+        packing_window: int = 1000,
     ):
         self._dataset = dataset
-        self._ex_lengths = {}
-        ex_ids = self._dataset.data_ids
         self.verbose = verbose
+        self._packing = packing
+        self._packing_window = packing_window
 
         # We do not put a default on num_buckets to encourage users to play with this parameter
-        if num_buckets is None and len(bucket_boundaries) == 0:
+        if num_buckets is None and len(bucket_boundaries) == 0 and not packing:
             raise RuntimeError(
                 "Please specify either num_buckets or bucket boundaries."
                 "Check the docs, and/or the tutorial !"
             )
 
+        # Lengths are kept in a contiguous array, indexed by example position.
         if lengths_list is not None:
             # take length of examples from this argument and bypass length_key
-            for indx in range(len(lengths_list)):
-                self._ex_lengths[str(indx)] = lengths_list[indx]
+            self._ex_lengths = np.asarray(lengths_list)
         else:
             # use length func
             if not isinstance(dataset, DynamicItemDataset):
                 raise NotImplementedError(
                     "Dataset should be a Speechbrain DynamicItemDataset when using length function"
                 )
-            for indx in range(len(self._dataset)):
-                self._ex_lengths[str(indx)] = length_func(
-                    self._dataset.data[ex_ids[indx]]
-                )
+            ex_ids = self._dataset.data_ids
+            self._ex_lengths = np.array(
+                [length_func(self._dataset.data[ex_id]) for ex_id in ex_ids]
+            )
 
         if len(bucket_boundaries) > 0:
             if not all([x >= 0 for x in bucket_boundaries]):
@@ -466,6 +488,9 @@ class DynamicBatchSampler(Sampler):
                 err_msg="The arg bucket_boundaries should be an ascending sorted list of non negative values values!",
             )
             self._bucket_boundaries = np.array(sorted(bucket_boundaries))
+        elif num_buckets is None:
+            # packing, no buckets
+            self._bucket_boundaries = np.array([])
         else:
             # use num_buckets
             self._bucket_boundaries = np.array(
@@ -486,11 +511,18 @@ class DynamicBatchSampler(Sampler):
             max(1, int(max_batch_length / self._bucket_boundaries[i]))
             for i in range(len(self._bucket_boundaries))
         ] + [1]
+        # The number of examples that make a batch full, in each bucket:
+        self._bucket_batch_sizes = np.array(self._bucket_lens)
+        if self._max_batch_ex > 0:
+            self._bucket_batch_sizes = np.minimum(
+                self._bucket_batch_sizes, self._max_batch_ex
+            )
         self._epoch = epoch
         self._generate_batches()
 
     def get_durations(self, batch):
-        return [self._ex_lengths[str(idx)] for idx in batch]
+        """The lengths of the examples in the batch (given as indices)."""
+        return self._ex_lengths[batch].tolist()
 
     def _get_boundaries_through_warping(
         self, max_batch_length: int, num_quantiles: int,
@@ -539,13 +571,12 @@ class DynamicBatchSampler(Sampler):
 
         elif self._batch_ordering == "ascending":
             self._batches = sorted(
-                self._batches,
-                key=lambda x: max([self._ex_lengths[str(idx)] for idx in x]),
+                self._batches, key=lambda x: self._ex_lengths[x].max(),
             )
         elif self._batch_ordering == "descending":
             self._batches = sorted(
                 self._batches,
-                key=lambda x: max([self._ex_lengths[str(idx)] for idx in x]),
+                key=lambda x: self._ex_lengths[x].max(),
                 reverse=True,
             )
         else:
@@ -557,71 +588,104 @@ class DynamicBatchSampler(Sampler):
             # deterministically shuffle based on epoch and seed
             g = torch.Generator()
             g.manual_seed(self._seed + self._epoch)
-            sampler = torch.randperm(len(self._dataset), generator=g).tolist()  # type: ignore
+            sampler = torch.randperm(len(self._dataset), generator=g).numpy()  # type: ignore
         else:
             # take examples as they are: e.g. they have been sorted
-            sampler = range(len(self._dataset))  # type: ignore
+            sampler = np.arange(len(self._dataset))  # type: ignore
 
-        self._batches = []
-        bucket_batches = [[] for i in self._bucket_lens]
-
-        stats_tracker = [
-            {"min": np.inf, "max": -np.inf, "tot": 0, "n_ex": 0}
-            for i in self._bucket_lens
-        ]
+        if self._packing:
+            self._batches = self._pack_batches(sampler)
+        else:
+            self._batches = self._bucket_batches(sampler)
 
-        for idx in sampler:
-            # length of pre-sampled audio
-            item_len = self._ex_lengths[str(idx)]
-            # bucket to fill up most padding
-            bucket_id = np.searchsorted(self._bucket_boundaries, item_len)
-            # fill audio's duration into that bucket
-            bucket_batches[bucket_id].append(idx)
+        self._permute_batches()  # possibly reorder batches
 
-            stats_tracker[bucket_id]["min"] = min(
-                stats_tracker[bucket_id]["min"], item_len
-            )
-            stats_tracker[bucket_id]["max"] = max(
-                stats_tracker[bucket_id]["max"], item_len
+        if self._epoch == 0:  # only log at first epoch
+            tot_frames = tot_padded_frames = 0
+            for batch in self._batches:
+                batch_lens = self.get_durations(batch)
+                tot_frames += sum(batch_lens)
+                tot_padded_frames += total_length_with_padding(batch_lens)
+            # Guard against empty datasets or zero lengths
+            padding = 1.0 - tot_frames / max(tot_padded_frames, 1e-12)
+            logger.info(
+                "DynamicBatchSampler: {} batches, padding ratio {:.2f} (%).".format(
+                    len(self._batches), padding * 100,
+                )
             )
-            stats_tracker[bucket_id]["tot"] += item_len
-            stats_tracker[bucket_id]["n_ex"] += 1
-            # track #samples - why not duration/#frames; rounded up?
-            # keep track of durations, if necessary
-
-            if (
-                len(bucket_batches[bucket_id]) >= self._bucket_lens[bucket_id]
-                or len(bucket_batches[bucket_id]) <= self._max_batch_ex
-            ):
-                self._batches.append(bucket_batches[bucket_id])
-                bucket_batches[bucket_id] = []
-                # keep track of durations
-
-        # Dump remaining batches
-        if not self._drop_last:
-            for batch in bucket_batches:
-                if batch:
-                    self._batches.append(batch)
+            if self.verbose:
+                padding_details = "Batch {} with {:.1f} frames with {} files - {:.1f} padding, {:.2f} (%) of total."
+                padding_details = "DynamicBatchSampler: " + padding_details
+                for i, batch in enumerate(self._batches):
+                    batch_lens = self.get_durations(batch)
+                    tot_frames = sum(batch_lens)
+                    tot_pad = total_length_with_padding(batch_lens) - tot_frames
+                    logger.info(
+                        padding_details.format(
+                            i,
+                            tot_frames,
+                            len(batch),
+                            tot_pad,
+                            padding_ratio(batch_lens) * 100,
+                        )
+                    )
 
-        self._permute_batches()  # possibly reorder batches
+    def _bucket_batches(self, sampler):
+        """Fills the buckets with the examples, in sampling order."""
+        # The buckets are filled in sampling order, and a batch is emitted
+        # as soon as it is full. This is computed for all examples at once:
+        # bucket all examples with one search, group them by bucket (keeping
+        # the sampling order within each bucket), and cut each bucket into
+        # batches based on the rank of the examples in the bucket.
+        item_lens = self._ex_lengths[sampler]
+        bucket_ids = np.searchsorted(self._bucket_boundaries, item_lens)
+        num_buckets = len(self._bucket_lens)
+        bucket_counts = np.bincount(bucket_ids, minlength=num_buckets)
+        bucket_starts = np.cumsum(bucket_counts) - bucket_counts
+        # Positions (in sampling order) of the examples, grouped by bucket:
+        grouped = np.argsort(bucket_ids, kind="stable")
+        grouped_buckets = bucket_ids[grouped]
+        ranks = np.arange(len(grouped)) - bucket_starts[grouped_buckets]
+        batch_sizes = self._bucket_batch_sizes[grouped_buckets]
+        batch_starts = np.flatnonzero(ranks % batch_sizes == 0)
+        batch_stops = np.append(batch_starts[1:], len(grouped))
+        is_full = batch_stops - batch_starts == batch_sizes[batch_starts]
+        # Full batches are emitted in the order they are completed. The
+        # remaining (partial) batches are dumped at the end, in bucket order.
+        full_batches = np.flatnonzero(is_full)
+        emitted_at = grouped[batch_stops[full_batches] - 1]
+        batch_order = full_batches[np.argsort(emitted_at)]
+        if not self._drop_last:
+            batch_order = np.append(batch_order, np.flatnonzero(~is_full))
+        grouped_indices = sampler[grouped].tolist()
+        batches = [
+            grouped_indices[start:stop]
+            for start, stop in zip(
+                batch_starts[batch_order].tolist(),
+                batch_stops[batch_order].tolist(),
+            )
+        ]
 
         if self._epoch == 0:  # only log at first epoch
             # frames per batch & their padding remaining
             boundaries = [0] + self._bucket_boundaries.tolist()
+            bucket_tots = np.bincount(
+                bucket_ids, weights=item_lens, minlength=num_buckets
+            )
+            bucket_mins = np.full(num_buckets, np.inf)
+            np.minimum.at(bucket_mins, bucket_ids, item_lens)
+            bucket_maxs = np.full(num_buckets, -np.inf)
+            np.maximum.at(bucket_maxs, bucket_ids, item_lens)
 
             for bucket_indx in range(len(self._bucket_boundaries)):
-                try:
-                    num_batches = stats_tracker[bucket_indx]["tot"] // (
+                if bucket_counts[bucket_indx] > 0:
+                    num_batches = bucket_tots[bucket_indx] // (
                         self._max_batch_length
                     )
                     pad_factor = (
-                        stats_tracker[bucket_indx]["max"]
-                        - stats_tracker[bucket_indx]["min"]
-                    ) / (
-                        stats_tracker[bucket_indx]["tot"]
-                        / stats_tracker[bucket_indx]["n_ex"]
-                    )
-                except ZeroDivisionError:
+                        bucket_maxs[bucket_indx] - bucket_mins[bucket_indx]
+                    ) / (bucket_tots[bucket_indx] / bucket_counts[bucket_indx])
+                else:
                     num_batches = 0
                     pad_factor = 0
 
@@ -634,47 +698,90 @@ class DynamicBatchSampler(Sampler):
                         boundaries[bucket_indx],
                         boundaries[bucket_indx + 1],
                         self._bucket_lens[bucket_indx],
-                        stats_tracker[bucket_indx]["n_ex"],
+                        bucket_counts[bucket_indx],
                         num_batches,
                         pad_factor * 100,
                     )
                 )
 
-            if self.verbose:
-                batch_stats = {
-                    "tot_frames": [],
-                    "tot_pad_frames": [],
-                    "pad_%": [],
-                }
-                for batch in self._batches:
-                    tot_frames = sum(
-                        [self._ex_lengths[str(idx)] for idx in batch]
-                    )
-                    batch_stats["tot_frames"].append(tot_frames)
-                    max_frames = max(
-                        [self._ex_lengths[str(idx)] for idx in batch]
-                    )
-                    tot_pad = sum(
-                        [
-                            max_frames - self._ex_lengths[str(idx)]
-                            for idx in batch
-                        ]
-                    )
-                    batch_stats["tot_pad_frames"].append(tot_pad)
-                    batch_stats["pad_%"].append(tot_pad / tot_frames * 100)
-
-                padding_details = "Batch {} with {:.1f} frames with {} files - {:.1f} padding, {:.2f} (%) of total."
-                padding_details = "DynamicBatchSampler: " + padding_details
-                for i in range(len(self._batches)):
-                    logger.info(
-                        padding_details.format(
-                            i,
-                            batch_stats["tot_frames"][i],
-                            len(self._batches[i]),
-                            batch_stats["tot_pad_frames"][i],
-                            batch_stats["pad_%"][i],
-                        )
-                    )
+        return batches
+
+    def _pack_batches(self, sampler):
+        """Cuts sorted windows of examples into padding-optimal batches."""
+        window = max(min(self._packing_window or len(sampler), len(sampler)), 1)
+        # The full windows are packed together, the last one separately:
+        num_full = len(sampler) // window * window
+        batches = []
+        for indices in [
+            sampler[:num_full].reshape(-1, window),
+            sampler[num_full:].reshape(1, -1),
+        ]:
+            if indices.size == 0:
+                continue
+            order = np.argsort(self._ex_lengths[indices], axis=1, kind="stable")
+            indices = np.take_along_axis(indices, order, axis=1)
+            all_cuts = self._packing_cuts(self._ex_lengths[indices])
+            for row, cuts in zip(indices.tolist(), all_cuts):
+                for begin, end in zip(cuts[:-1], cuts[1:]):
+                    batches.append(row[begin:end])
+        return batches
+
+    def _packing_cuts(self, sorted_lens):
+        """Optimal cut points of windows of ascending lengths into batches.
+
+        Dynamic programming over the prefixes of each window (row of
+        sorted_lens): for each prefix, the fewest batches it can be cut into,
+        and the least padded length with that many batches. The last batch of
+        a prefix ending at j may start at i if (j - i) * sorted_lens[j - 1]
+        fits max_batch_length (a single example always fits). Each step is
+        computed for all the windows at once.
+
+        Arguments
+        ---------
+        sorted_lens : numpy.ndarray
+            The lengths, shape [num_windows, window], ascending in each row.
+
+        Returns
+        -------
+        list
+            For each window, the list of cut points, starting with 0 and
+            ending with the window size.
+        """
+        num_windows, num_ex = sorted_lens.shape
+        max_sizes = np.maximum(
+            self._max_batch_length // np.maximum(sorted_lens, 1), 1
+        ).astype(int)
+        if self._max_batch_ex > 0:
+            max_sizes = np.minimum(max_sizes, self._max_batch_ex)
+        num_batches = np.zeros((num_windows, num_ex + 1), dtype=int)
+        padded_len = np.zeros((num_windows, num_ex + 1))
+        best_start = np.zeros((num_windows, num_ex + 1), dtype=int)
+        rows = np.arange(num_windows)
+        for stop in range(1, num_ex + 1):
+            sizes = max_sizes[:, stop - 1 : stop]
+            first = max(0, stop - int(sizes.max()))
+            starts = np.arange(first, stop)
+            # The fewest batches, among the allowed starts of each window:
+            candidates = np.where(
+                starts >= stop - sizes, num_batches[:, first:stop], num_ex + 1
+            )
+            fewest = candidates.min(axis=1, keepdims=True)
+            padded = (
+                padded_len[:, first:stop]
+                + (stop - starts) * sorted_lens[:, stop - 1 : stop]
+            )
+            padded = np.where(candidates == fewest, padded, np.inf)
+            best = padded.argmin(axis=1)
+            best_start[:, stop] = first + best
+            num_batches[:, stop] = fewest[:, 0] + 1
+            padded_len[:, stop] = padded[rows, best]
+        all_cuts = []
+        for row_starts in best_start.tolist():
+            cuts = [num_ex]
+            while cuts[-1] > 0:
+                cuts.append(row_starts[cuts[-1]])
+            all_cuts.append(cuts[::-1])
+        return all_cuts
 
     def __iter__(self):
         for batch in self._batches:
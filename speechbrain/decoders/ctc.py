@@ -5,7 +5,9 @@ Authors
  * Aku Rouhe 2020
  * Sung-Lin Yeh 2020
 """
+import math
 import torch
+import collections
 from itertools import groupby
 from speechbrain.dataio.dataio import length_to_mask
 
@@ -52,7 +54,8 @@ class CTCPrefixScorer:
         self.vocab_size = x.size(-1)
         self.device = x.device
         self.minus_inf = -1e20
-        self.last_frame_index = enc_lens - 1
+        self.last_frame_index = enc_lens.long() - 1
+        self.max_seq_len = int(enc_lens.max())
         self.ctc_window_size = ctc_window_size
 
         # mask frames > enc_lens
@@ -85,6 +88,12 @@ class CTCPrefixScorer:
         """This method if one step of forwarding operation
         for the prefix ctc scorer.
 
+        Only the frames where the prefixes can be aligned are scored: the
+        frames after the first frame reached by a prefix (the alignments are
+        monotonic), up to the end of the longest sequence, and within
+        ctc_window_size of the attention peaks if windowing is applied.
+        All the hypotheses are scored at once, with batched tensor ops.
+
         Arguments
         ---------
         g : torch.Tensor
@@ -96,8 +105,15 @@ class CTCPrefixScorer:
             The ctc_beam_size is set as 2 * beam_size. If given, performing partial ctc scoring.
         """
 
+        n_hyps = self.batch_size * self.beam_size
+        hyp_index = torch.arange(n_hyps, device=self.device)
         prefix_length = g.size(1)
-        last_char = [gi[-1] for gi in g] if prefix_length > 0 else [0] * len(g)
+        if prefix_length > 0:
+            last_char = g[:, -1]
+        else:
+            last_char = torch.zeros(
+                n_hyps, dtype=torch.long, device=self.device
+            )
         self.num_candidates = (
             self.vocab_size if candidates is None else candidates.size(-1)
         )
@@ -113,24 +129,29 @@ class CTCPrefixScorer:
             r_prev[:, 1] = torch.cumsum(
                 self.x[0, :, :, self.blank_index], 0
             ).unsqueeze(2)
-            r_prev = r_prev.view(-1, 2, self.batch_size * self.beam_size)
+            r_prev = r_prev.view(-1, 2, n_hyps)
             psi_prev = 0.0
         else:
             r_prev, psi_prev = state
 
+        # (Alg.2-10): phi = prev_nonblank + prev_blank = r_t-1^nb(g) + r_t-1^b(g)
+        r_sum = torch.logsumexp(r_prev, 1)
+
+        # Start, end frames for scoring (|g| < |h|).
+        start, end = self._scoring_frames(prefix_length, r_sum, attn)
+        # First frame of the window of forward probs
+        first = 0 if prefix_length == 0 else start - 1
+
         # for partial search
         if candidates is not None:
             scoring_table = torch.full(
-                (self.batch_size * self.beam_size, self.vocab_size),
+                (n_hyps, self.vocab_size),
                 -1,
                 dtype=torch.long,
                 device=self.device,
             )
             # Assign indices of candidates to their positions in the table
-            col_index = torch.arange(
-                self.batch_size * self.beam_size, device=self.device
-            ).unsqueeze(1)
-            scoring_table[col_index, candidates] = torch.arange(
+            scoring_table[hyp_index.unsqueeze(1), candidates] = torch.arange(
                 self.num_candidates, device=self.device
             )
             # Select candidates indices for scoring
@@ -141,106 +162,109 @@ class CTCPrefixScorer:
                 .view(-1, 1)
             ).view(-1)
             x_inflate = torch.index_select(
-                self.x.view(2, -1, self.batch_size * self.vocab_size),
+                self.x[:, first:end].reshape(
+                    2, -1, self.batch_size * self.vocab_size
+                ),
                 2,
                 scoring_index,
-            ).view(2, -1, self.batch_size * self.beam_size, self.num_candidates)
+            ).view(2, -1, n_hyps, self.num_candidates)
         # for full search
         else:
             scoring_table = None
             x_inflate = (
-                self.x.unsqueeze(3)
-                .repeat(1, 1, 1, self.beam_size, 1)
-                .view(
-                    2, -1, self.batch_size * self.beam_size, self.num_candidates
-                )
+                self.x[:, first:end]
+                .unsqueeze(3)
+                .expand(-1, -1, -1, self.beam_size, -1)
+                .reshape(2, -1, n_hyps, self.num_candidates)
             )
 
-        # Prepare forward probs
+        # Prepare forward probs, for the frames first to end
         r = torch.full(
-            (
-                self.max_enc_len,
-                2,
-                self.batch_size * self.beam_size,
-                self.num_candidates,
-            ),
+            (end - first, 2, n_hyps, self.num_candidates),
             self.minus_inf,
             device=self.device,
         )
-        r.fill_(self.minus_inf)
 
         # (Alg.2-6)
         if prefix_length == 0:
             r[0, 0] = x_inflate[0, 0]
-        # (Alg.2-10): phi = prev_nonblank + prev_blank = r_t-1^nb(g) + r_t-1^b(g)
-        r_sum = torch.logsumexp(r_prev, 1)
-        phi = r_sum.unsqueeze(2).repeat(1, 1, self.num_candidates)
+        phi = r_sum[first:end].unsqueeze(2).repeat(1, 1, self.num_candidates)
 
         # (Alg.2-10): if last token of prefix g in candidates, phi = prev_b + 0
         if candidates is not None:
-            for i in range(self.batch_size * self.beam_size):
-                pos = scoring_table[i, last_char[i]]
-                if pos != -1:
-                    phi[:, i, pos] = r_prev[:, 1, i]
+            pos = scoring_table[hyp_index, last_char]
+            in_candidates = pos != -1
+            phi[:, hyp_index[in_candidates], pos[in_candidates]] = r_prev[
+                first:end, 1, in_candidates
+            ]
         else:
-            for i in range(self.batch_size * self.beam_size):
-                phi[:, i, last_char[i]] = r_prev[:, 1, i]
-
-        # Start, end frames for scoring (|g| < |h|).
-        # Scoring based on attn peak if ctc_window_size > 0
-        if self.ctc_window_size == 0 or attn is None:
-            start = max(1, prefix_length)
-            end = self.max_enc_len
-        else:
-            _, attn_peak = torch.max(attn, dim=1)
-            max_frame = torch.max(attn_peak).item() + self.ctc_window_size
-            min_frame = torch.min(attn_peak).item() - self.ctc_window_size
-            start = max(max(1, prefix_length), int(min_frame))
-            end = min(self.max_enc_len, int(max_frame))
+            phi[:, hyp_index, last_char] = r_prev[first:end, 1]
 
         # Compute forward prob log(r_t^nb(h)) and log(r_t^b(h)):
-        for t in range(start, end):
+        for t in range(start - first, end - first):
             # (Alg.2-11): dim=0, p(h|cur step is nonblank) = [p(prev step=y) + phi] * p(c)
             rnb_prev = r[t - 1, 0]
             # (Alg.2-12): dim=1, p(h|cur step is blank) = [p(prev step is blank) + p(prev step is nonblank)] * p(blank)
             rb_prev = r[t - 1, 1]
             r_ = torch.stack([rnb_prev, phi[t - 1], rnb_prev, rb_prev]).view(
-                2, 2, self.batch_size * self.beam_size, self.num_candidates
+                2, 2, n_hyps, self.num_candidates
             )
             r[t] = torch.logsumexp(r_, 1) + x_inflate[:, t]
 
         # Compute the predix prob, psi
-        psi_init = r[start - 1, 0].unsqueeze(0)
+        psi_init = r[start - 1 - first, 0].unsqueeze(0)
         # phi is prob at t-1 step, shift one frame and add it to the current prob p(c)
-        phix = torch.cat((phi[0].unsqueeze(0), phi[:-1]), dim=0) + x_inflate[0]
+        phix = (
+            phi[start - 1 - first : end - 1 - first]
+            + x_inflate[0, start - first :]
+        )
         # (Alg.2-13): psi = psi + phi * p(c)
+        psi = torch.logsumexp(torch.cat((phix, psi_init), dim=0), dim=0)
         if candidates is not None:
-            psi = torch.full(
-                (self.batch_size * self.beam_size, self.vocab_size),
-                self.minus_inf,
-                device=self.device,
-            )
-            psi_ = torch.logsumexp(
-                torch.cat((phix[start:end], psi_init), dim=0), dim=0
-            )
             # only assign prob to candidates
-            for i in range(self.batch_size * self.beam_size):
-                psi[i, candidates[i]] = psi_[i]
-        else:
-            psi = torch.logsumexp(
-                torch.cat((phix[start:end], psi_init), dim=0), dim=0
-            )
+            psi = torch.full(
+                (n_hyps, self.vocab_size), self.minus_inf, device=self.device,
+            ).scatter_(1, candidates, psi)
 
         # (Alg.2-3): if c = <eos>, psi = log(r_T^n(g) + r_T^b(g)), where T is the length of max frames
-        for i in range(self.batch_size * self.beam_size):
-            psi[i, self.eos_index] = r_sum[
-                self.last_frame_index[i // self.beam_size], i
-            ]
+        psi[:, self.eos_index] = r_sum[
+            self.last_frame_index.repeat_interleave(self.beam_size), hyp_index
+        ]
 
         # Exclude blank probs for joint scoring
         psi[:, self.blank_index] = self.minus_inf
 
-        return psi - psi_prev, (r, psi, scoring_table)
+        return psi - psi_prev, (r, psi, scoring_table, first)
+
+    def _scoring_frames(self, prefix_length, r_sum, attn=None):
+        """Returns the start and end frames for scoring the extensions of
+        prefixes of the given length.
+
+        Arguments
+        ---------
+        prefix_length : int
+            The length of the prefixes g.
+        r_sum : torch.Tensor
+            (L, batch_size * beam_size) The forward probs of the prefixes.
+        attn : torch.Tensor
+            The attention weights, for windowing.
+        """
+        start = max(1, prefix_length)
+        # Frames before the first one reached by a prefix cannot be reached
+        # by its extensions either
+        reached = (r_sum > self.minus_inf / 2).any(dim=1)
+        if prefix_length > 0 and reached.any():
+            start = max(start, int(reached.int().argmax()) + 1)
+        end = self.max_seq_len
+        # Scoring based on attn peak if ctc_window_size > 0
+        if self.ctc_window_size > 0 and attn is not None:
+            _, attn_peak = torch.max(attn, dim=1)
+            max_frame = torch.max(attn_peak).item() + self.ctc_window_size
+            min_frame = torch.min(attn_peak).item() - self.ctc_window_size
+            start = max(start, int(min_frame))
+            end = min(end, int(max_frame))
+        start = min(start, self.max_seq_len)
+        return start, max(start, end)
 
     def permute_mem(self, memory, index):
         """This method permutes the CTC model memory
@@ -258,7 +282,7 @@ class CTCPrefixScorer:
         The variable of the memory being permuted.
 
         """
-        r, psi, scoring_table = memory
+        r, psi, scoring_table, first = memory
         # The index of top-K vocab came from in (t-1) timesteps.
         best_index = (
             index
@@ -282,16 +306,54 @@ class CTCPrefixScorer:
             score_index[score_index == -1] = 0
             best_index = score_index + effective_index * self.num_candidates
 
-        r = torch.index_select(
+        # The forward probs are minus_inf outside of the scored frames
+        r_full = torch.full(
+            (self.max_enc_len, 2, self.batch_size * self.beam_size),
+            self.minus_inf,
+            device=self.device,
+        )
+        r_full[first : first + r.size(0)] = torch.index_select(
             r.view(
                 -1, 2, self.batch_size * self.beam_size * self.num_candidates
             ),
             dim=-1,
             index=best_index,
         )
-        r = r.view(-1, 2, self.batch_size * self.beam_size)
 
-        return r, psi
+        return r_full, psi
+
+    def select_utterances(self, memory, index):
+        """This method keeps only some utterances of the batch, when the
+        finished utterances are removed from the search.
+
+        Arguments
+        ---------
+        memory : tuple
+            The ctc states, as returned by permute_mem.
+        index : torch.Tensor
+            The index of the kept utterances.
+
+        Returns
+        -------
+        The ctc states of the hypotheses of the kept utterances.
+        """
+        hyp_index = (
+            index.unsqueeze(1) * self.beam_size
+            + torch.arange(self.beam_size, device=self.device)
+        ).view(-1)
+        self.x = self.x[:, :, index]
+        self.last_frame_index = self.last_frame_index[index]
+        self.batch_size = index.size(0)
+        self.beam_offset = (
+            torch.arange(self.batch_size, device=self.device) * self.beam_size
+        )
+        self.cand_offset = (
+            torch.arange(self.batch_size, device=self.device) * self.vocab_size
+        )
+        if memory is None:
+            return None
+        r, psi = memory
+        return r[:, :, hyp_index], psi[hyp_index]
 
 
 def filter_ctc_output(string_pred, blank_id=-1):
@@ -381,3 +443,395 @@ def ctc_greedy_decode(probabilities, seq_lens, blank_id=-1):
         out = filter_ctc_output(predictions.tolist(), blank_id=blank_id)
         batch_outputs.append(out)
     return batch_outputs
+
+
+class CTCStreamingDecoder:
+    """Greedy decodes the CTC probabilities of a stream chunk by chunk.
+
+    The last prediction of each utterance is carried from one chunk to the
+    next, so that repetitions across chunks are merged, and decoding the
+    chunks of an utterance gives the same output as `ctc_greedy_decode` on
+    the whole utterance. Greedy outputs never change, so the partial
+    hypotheses are stable.
+
+    Arguments
+    ---------
+    blank_id : int, string
+        The blank symbol/index, as in `ctc_greedy_decode`.
+
+    Example
+    -------
+    >>> import torch
+    >>> probs = torch.rand(2, 10, 5)
+    >>> lens = torch.tensor([0.7, 1.0])
+    >>> decoder = CTCStreamingDecoder(blank_id=0)
+    >>> partial_hyps = decoder.accept_chunk(probs[:, :5], torch.ones(2))
+    >>> partial_hyps = decoder.accept_chunk(probs[:, 5:], torch.tensor([0.4, 1.0]))
+    >>> decoder.finalize() == ctc_greedy_decode(probs, lens, blank_id=0)
+    True
+    """
+
+    def __init__(self, blank_id=-1):
+        self.blank_id = blank_id
+        self.reset()
+
+    def reset(self):
+        """Forgets the current stream, to start decoding a new one."""
+        self.hyps = None
+        self.last_predictions = None
+
+    def accept_chunk(self, probabilities, seq_lens=None):
+        """Decodes the next chunk of the stream.
+
+        Arguments
+        ---------
+        probabilities : torch.tensor
+            Output probabilities (or log-probabilities) from the network for
+            the chunk, with shape [batch, chunk_len, probabilities].
+        seq_lens : torch.tensor
+            Relative true lengths of the chunk (to deal with padded inputs
+            and with utterances ending in the chunk), as in
+            `ctc_greedy_decode`. None means no padding.
+
+        Returns
+        -------
+        list
+            The hypothesis of each utterance so far.
+        """
+        blank_id = self.blank_id
+        if isinstance(blank_id, int) and blank_id < 0:
+            blank_id = probabilities.shape[-1] + blank_id
+        if self.hyps is None:
+            self.hyps = [[] for _ in range(probabilities.size(0))]
+            self.last_predictions = [None] * probabilities.size(0)
+        if seq_lens is None:
+            seq_lens = torch.ones(probabilities.size(0))
+        chunk_max_len = probabilities.shape[1]
+        for i, (seq, seq_len) in enumerate(zip(probabilities, seq_lens)):
+            actual_size = int(torch.round(seq_len * chunk_max_len))
+            if actual_size == 0:
+                continue
+            _, predictions = torch.max(seq.narrow(0, 0, actual_size), dim=1)
+            predictions = predictions.tolist()
+            last = self.last_predictions[i]
+            if last is None:
+                out = filter_ctc_output(predictions, blank_id=blank_id)
+            else:
+                out = filter_ctc_output([last] + predictions, blank_id=blank_id)
+                # The first token was emitted with the previous chunk
+                if last != blank_id:
+                    out = out[1:]
+            self.hyps[i].extend(out)
+            self.last_predictions[i] = predictions[-1]
+        return [list(hyp) for hyp in self.hyps]
+
+    def finalize(self):
+        """Returns the output of the whole stream, as `ctc_greedy_decode`
+        does for a whole utterance, and resets the decoder."""
+        if self.hyps is None:
+            raise ValueError("No chunk was decoded since the last reset.")
+        hyps = self.hyps
+        self.reset()
+        return hyps
+
+
+class CTCPrefixBeamSearcher:
+    """CTC prefix beam search, with optional word-level n-gram LM shallow
+    fusion and lexicon constraint.
+
+    The prefixes of each utterance are scored with the CTC probabilities of
+    all their alignments. When a LM is given, each completed word of a
+    prefix adds lm_weight * log P_LM(word | previous words) + word_bonus to
+    its score, and the last word and the end of sentence are scored at the
+    end. When a lexicon is given, the prefixes whose words are not in the
+    lexicon (or whose last word is not the prefix of a word of the lexicon)
+    are dropped.
+
+    The tokens are mapped to words with vocab_list: a token starting with
+    "▁" (as in SentencePiece) or equal to space_token starts a new word.
+
+    Only the token pruning is batched: the top token_beam tokens of each
+    frame with a log-probability above token_threshold are selected for the
+    whole batch at once (on the device of the log-probabilities). The prefix
+    search itself then runs in Python, one utterance at a time, and keeps at
+    each frame the best beam_size prefixes within beam_threshold of the best
+    one.
+
+    Arguments
+    ---------
+    blank_index : int
+        The index of the blank token.
+    beam_size : int
+        The maximum number of prefixes kept at each frame.
+    vocab_list : list
+        The string of each token, needed with a LM or a lexicon.
+    lm : BackoffNgramLM, str
+        A word-level n-gram LM with ARPA (log10) probabilities, or the path
+        of an ARPA file to load it from. None disables LM fusion.
+    lm_weight : float
+        The weight of the LM log-probabilities (α).
+    word_bonus : float
+        Score added for each word when the LM is used (β).
+    lexicon : list, str
+        The words allowed in the prefixes, or the path of a file with a word
+        at the start of each line. None allows any word.
+    token_beam : int
+        Number of best tokens considered at each frame.
+    token_threshold : float
+        Log-probability under which tokens are not considered.
+    beam_threshold : float
+        Prefixes scoring below the best one by more than this are dropped.
+    space_token : str
+        Token string separating words, for character-level models.
+    unk_word : str
+        LM word used for the words unknown to the LM.
+
+    Example
+    -------
+    >>> import torch
+    >>> probs = torch.tensor([[[0.1, 0.8, 0.1],
+    ...                        [0.6, 0.2, 0.2],
+    ...                        [0.1, 0.1, 0.8]]])
+    >>> searcher = CTCPrefixBeamSearcher(blank_index=0, beam_size=3)
+    >>> searcher(probs.log(), torch.tensor([1.0]))
+    [[1, 2]]
+    >>> # With a lexicon, only the prefixes of its words are allowed
+    >>> searcher = CTCPrefixBeamSearcher(
+    ...     blank_index=0,
+    ...     vocab_list=["-", "a", "b"],
+    ...     lexicon=["b", "bb"],
+    ... )
+    >>> searcher(probs.log(), torch.tensor([1.0]))
+    [[2]]
+    """
+
+    def __init__(
+        self,
+        blank_index,
+        beam_size=10,
+        vocab_list=None,
+        lm=None,
+        lm_weight=0.5,
+        word_bonus=0.0,
+        lexicon=None,
+        token_beam=None,
+        token_threshold=-20.0,
+        beam_threshold=30.0,
+        space_token=" ",
+        unk_word="<unk>",
+    ):
+        self.blank_index = blank_index
+        self.beam_size = beam_size
+        self.vocab_list = vocab_list
+        if isinstance(lm, str):
+            lm = _load_arpa_lm(lm)
+        self.lm = lm
+        self.lm_weight = lm_weight
+        self.word_bonus = word_bonus
+        if isinstance(lexicon, str):
+            with open(lexicon) as fi:
+                lexicon = [line.split()[0] for line in fi if line.strip()]
+        self.lexicon = None if lexicon is None else _build_trie(lexicon)
+        self.token_beam = token_beam
+        self.token_threshold = token_threshold
+        self.beam_threshold = beam_threshold
+        self.space_token = space_token
+        self.unk_word = unk_word
+        self._lm_cache = {}
+
+    def __call__(self, log_probs, seq_lens):
+        """Decodes a batch.
+
+        Arguments
+        ---------
+        log_probs : torch.tensor
+            Output log-probabilities from the network with shape
+            [batch, time, vocab].
+        seq_lens : torch.tensor
+            Relative true sequence lengths (to deal with padded inputs),
+            as in `ctc_greedy_decode`.
+
+        Returns
+        -------
+        list
+            The best hypothesis (list of token ids) of each utterance.
+        """
+        uses_words = self.lm is not None or self.lexicon is not None
+        if uses_words and self.vocab_list is None:
+            raise ValueError("A vocab_list is needed for LM and lexicon.")
+        batch_max_len = log_probs.size(1)
+        token_beam = min(self.token_beam or self.beam_size, log_probs.size(-1))
+        # Token pruning for the whole batch at once
+        logp, tokens = log_probs.topk(token_beam, dim=-1)
+        blank_logp = log_probs[:, :, self.blank_index].tolist()
+        keep = (logp > self.token_threshold) & (tokens != self.blank_index)
+        logp, tokens, keep = logp.tolist(), tokens.tolist(), keep.tolist()
+        self._lm_cache = {}
+        hyps = []
+        for i, seq_len in enumerate(seq_lens):
+            actual_size = int(torch.round(seq_len * batch_max_len))
+            frames = [
+                (
+                    blank_logp[i][t],
+                    [
+                        (token, token_logp)
+                        for token, token_logp, k in zip(
+                            tokens[i][t], logp[i][t], keep[i][t]
+                        )
+                        if k
+                    ],
+                )
+                for t in range(actual_size)
+            ]
+            hyps.append(self._search(frames))
+        return hyps
+
+    def _search(self, frames):
+        """Prefix beam search over the (pruned) frames of an utterance."""
+        # Prefix -> [log p(blank ending), log p(non-blank ending)]
+        beams = {tuple(): [0.0, _NEG_INF]}
+        word_states = {tuple(): self._initial_word_state()}
+        for blank_logp, candidates in frames:
+            next_beams = collections.defaultdict(lambda: [_NEG_INF, _NEG_INF])
+            for prefix, (p_b, p_nb) in beams.items():
+                p_total = _logaddexp(p_b, p_nb)
+                scores = next_beams[prefix]
+                scores[0] = _logaddexp(scores[0], p_total + blank_logp)
+                for token, token_logp in candidates:
+                    if prefix and token == prefix[-1]:
+                        # Repeated token, only extends after a blank
+                        scores[1] = _logaddexp(scores[1], p_nb + token_logp)
+                        p_extend = p_b + token_logp
+                    else:
+                        p_extend = p_total + token_logp
+                    new_prefix = prefix + (token,)
+                    if new_prefix not in word_states:
+                        word_states[new_prefix] = self._extend_word_state(
+                            word_states[prefix], token
+                        )
+                    if word_states[new_prefix] is None:
+                        continue
+                    new_scores = next_beams[new_prefix]
+                    new_scores[1] = _logaddexp(new_scores[1], p_extend)
+            beams = self._prune(next_beams, word_states)
+            # Only the states of the surviving prefixes are needed later
+            word_states = {prefix: word_states[prefix] for prefix in beams}
+        best_prefix, best_score = tuple(), _NEG_INF
+        for prefix, (p_b, p_nb) in beams.items():
+            final_lm_score = self._final_lm_score(word_states[prefix])
+            if final_lm_score is None:
+                continue
+            score = _logaddexp(p_b, p_nb) + final_lm_score
+            if score > best_score:
+                best_prefix, best_score = prefix, score
+        return list(best_prefix)
+
+    def _prune(self, beams, word_states):
+        """Keeps the best beam_size prefixes, within beam_threshold."""
+        scored = sorted(
+            (
+                (_logaddexp(p_b, p_nb) + word_states[prefix][0], prefix)
+                for prefix, (p_b, p_nb) in beams.items()
+            ),
+            reverse=True,
+        )[: self.beam_size]
+        best = scored[0][0]
+        return {
+            prefix: beams[prefix]
+            for score, prefix in scored
+            if score >= best - self.beam_threshold
+        }
+
+    def _initial_word_state(self):
+        """Word state: (LM score, completed words, last word, trie node)."""
+        return (0.0, tuple(), "", self.lexicon)
+
+    def _extend_word_state(self, state, token):
+        """Word state after the token, or None if the lexicon forbids it."""
+        if self.vocab_list is None:
+            return state
+        lm_score, words, word, node = state
+        piece = self.vocab_list[token]
+        if piece == self.space_token or piece.startswith("▁"):
+            if word:
+                lm_score = self._word_lm_score(lm_score, words, word, node)
+                if lm_score is None:
+                    return None
+                words = words + (word,)
+            word = ""
+            node = self.lexicon
+            piece = piece.lstrip("▁") if piece != self.space_token else ""
+        for char in piece:
+            if node is not None:
+                node = node.get(char)
+                if node is None:
+                    return None
+            word += char
+        return lm_score, words, word, node
+
+    def _word_lm_score(self, lm_score, words, word, node):
+        """Adds the score of a completed word, None if not in the lexicon."""
+        if self.lexicon is not None and _WORD_END not in node:
+            return None
+        if self.lm is None:
+            return lm_score
+        return lm_score + self._lm_logprob(word, words) + self.word_bonus
+
+    def _final_lm_score(self, state):
+        """LM score of a final prefix, with its last word and </s>."""
+        lm_score, words, word, node = state
+        if word:
+            lm_score = self._word_lm_score(lm_score, words, word, node)
+            if lm_score is None:
+                return None
+            words = words + (word,)
+        if self.lm is None:
+            return lm_score
+        return lm_score + self._lm_logprob("</s>", words)
+
+    def _lm_logprob(self, word, words):
+        """Weighted natural log-probability of the word given the words."""
+        context = (("<s>",) + words)[-(self.lm.top_order - 1) :]
+        if self.lm.top_order == 1:
+            context = tuple()
+        key = (word, context)
+        if key not in self._lm_cache:
+            logprob = self.lm.logprob(word, context)
+            if logprob == _NEG_INF:
+                logprob = self.lm.logprob(self.unk_word, context)
+            self._lm_cache[key] = self.lm_weight * logprob * math.log(10)
+        return self._lm_cache[key]
+
+
+def _logaddexp(a, b):
+    """log(exp(a) + exp(b)) for Python floats."""
+    if a < b:
+        a, b = b, a
+    if b == _NEG_INF:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+def _build_trie(words):
+    """Character trie (nested dicts) of the words, see CTCPrefixBeamSearcher."""
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_WORD_END] = True
+    return root
+
+
+def _load_arpa_lm(path):
+    """Loads a BackoffNgramLM from an ARPA file."""
+    from speechbrain.lm.arpa import read_arpa
+    from speechbrain.lm.ngram import BackoffNgramLM
+
+    with open(path) as fi:
+        _, ngrams, backoffs = read_arpa(fi)
+    return BackoffNgramLM(ngrams, backoffs)
+
+
+_NEG_INF = float("-inf")
+_WORD_END = None
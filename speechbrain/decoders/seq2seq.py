@@ -270,6 +270,10 @@ class S2SBeamSearcher(S2SBaseSearcher):
         The number of hypothesis to return. (default: 1)
     return_log_probs : bool
         Whether to return log-probabilities. (default: False)
+    return_nbest : bool
+        Whether to also return the n-best list of the topk hypotheses of
+        each utterance, with their per-token log-probabilities. See
+        rescore_nbest() for a second-pass LM rescoring. (default: False)
     using_eos_threshold : bool
         Whether to use eos threshold. (default: true)
     eos_threshold : float
@@ -309,6 +313,15 @@ class S2SBeamSearcher(S2SBaseSearcher):
         DefaultL -1e20
         The value of minus infinity to block some path
         of the search.
+    beam_threshold : float
+        If given, the hypotheses whose score is lower than the score of the
+        best hypothesis of the utterance (alive or ended) minus
+        beam_threshold are pruned, and the search of an utterance stops
+        when all its hypotheses are pruned or ended. (default: None)
+    compact_batch : bool
+        Whether to remove the finished utterances from the batch, so that
+        they stop consuming compute. It does not change the results.
+        (default: True)
     """
 
     def __init__(
@@ -320,6 +333,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
         beam_size,
         topk=1,
         return_log_probs=False,
+        return_nbest=False,
         using_eos_threshold=True,
         eos_threshold=1.5,
         length_normalization=True,
@@ -334,6 +348,8 @@ class S2SBeamSearcher(S2SBaseSearcher):
         using_max_attn_shift=False,
         max_attn_shift=60,
         minus_inf=-1e20,
+        beam_threshold=None,
+        compact_batch=True,
     ):
         super(S2SBeamSearcher, self).__init__(
             bos_index, eos_index, min_decode_ratio, max_decode_ratio,
@@ -341,6 +357,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
         self.beam_size = beam_size
         self.topk = topk
         self.return_log_probs = return_log_probs
+        self.return_nbest = return_nbest
         self.length_normalization = length_normalization
         self.length_rewarding = length_rewarding
         self.coverage_penalty = coverage_penalty
@@ -378,6 +395,13 @@ class S2SBeamSearcher(S2SBaseSearcher):
         self.ctc_score_mode = ctc_score_mode
         self.ctc_window_size = ctc_window_size
 
+        self.beam_threshold = beam_threshold
+        self.compact_batch = compact_batch
+        # Decoding steps run for each utterance, and steps saved with
+        # respect to decoding all the utterances for max_decode_steps
+        self.decode_steps = 0
+        self.decode_steps_saved = 0
+
     def _check_full_beams(self, hyps, beam_size):
         """This method checks whether hyps has been full.
 
@@ -499,6 +523,96 @@ class S2SBeamSearcher(S2SBaseSearcher):
                 hyps_and_scores[batch_id].append((hyp, log_probs, final_scores))
         return is_eos
 
+    def _prune_by_threshold(self, scores, is_eos, best_ended_scores):
+        """This method finds the hypotheses whose score is lower than the
+        score of the best hypothesis of their utterance minus beam_threshold.
+
+        Arguments
+        ---------
+        scores : torch.Tensor
+            The scores of the hypotheses at the current step.
+        is_eos : torch.BoolTensor
+            Whether the hypotheses have reached eos at the current step.
+        best_ended_scores : torch.Tensor
+            The best score of the ended hypotheses of each utterance.
+
+        Returns
+        -------
+        pruned : torch.BoolTensor
+            Each element represents whether the hypothesis is pruned.
+        best_ended_scores : torch.Tensor
+            The updated best scores of the ended hypotheses.
+        """
+        batch_size = best_ended_scores.size(0)
+        scores = scores.view(batch_size, -1)
+        ended_scores = scores.masked_fill(
+            ~is_eos.view(batch_size, -1), float("-inf")
+        )
+        best_ended_scores = torch.maximum(
+            best_ended_scores, ended_scores.max(dim=-1).values
+        )
+        best_scores = torch.maximum(
+            scores.max(dim=-1).values, best_ended_scores
+        )
+        pruned = scores < (best_scores - self.beam_threshold).unsqueeze(1)
+        return pruned.view(-1), best_ended_scores
+
+    def _check_finished_utterances(
+        self,
+        hyps_and_scores,
+        sequence_scores,
+        alived_seq,
+        alived_log_probs,
+        scores,
+    ):
+        """This method checks which utterances are finished: the ones with
+        full beams, and, when pruning, the ones without alive hypotheses.
+        The beams of the latter are filled with pruned hypotheses.
+
+        Arguments
+        ---------
+        hyps_and_scores : list
+            To store generated hypotheses and scores.
+        sequence_scores : torch.Tensor
+            The scores of the alive hypotheses (-inf if blocked).
+        alived_seq : torch.Tensor
+            The tensor to store the alived_seq.
+        alived_log_probs : torch.Tensor
+            The tensor to store the alived_log_probs.
+        scores : torch.Tensor
+            The scores of the hypotheses at the current step.
+
+        Returns
+        -------
+        finished : torch.BoolTensor
+            Each element represents whether the utterance is finished.
+        """
+        batch_size = len(hyps_and_scores)
+        device = sequence_scores.device
+        finished = torch.tensor(
+            [len(hyps) == self.beam_size for hyps in hyps_and_scores],
+            device=device,
+        )
+        if self.beam_threshold is None:
+            return finished
+
+        dead = torch.isinf(sequence_scores).view(batch_size, -1).all(dim=-1)
+        to_fill = dead & ~finished
+        if to_fill.any():
+            # The pruned hypotheses fill the beams, with -inf scores
+            fill_tokens = torch.full_like(alived_seq[:, -1], -1).masked_fill(
+                to_fill.repeat_interleave(self.beam_size), self.eos_index
+            )
+            self._update_hyp_and_scores(
+                fill_tokens,
+                alived_seq,
+                alived_log_probs,
+                hyps_and_scores,
+                torch.full_like(scores, float("-inf")),
+                timesteps=0,
+            )
+        return finished | dead
+
     def _get_top_score_prediction(self, hyps_and_scores, topk):
         """This method sorts the scores and return corresponding hypothesis and log probs.
 
@@ -551,6 +665,50 @@ class S2SBeamSearcher(S2SBaseSearcher):
 
         return topk_hyps, topk_scores, topk_lengths, topk_log_probs
 
+    def _get_nbest(self, topk_hyps, topk_scores, topk_lengths, topk_log_probs):
+        """This method builds the n-best list of each utterance from the
+        topk hypotheses.
+
+        Arguments
+        ---------
+        topk_hyps : torch.Tensor (batch, topk, max length of token_id sequences)
+            The topk predicted hypotheses.
+        topk_scores : torch.Tensor (batch, topk)
+            The final scores of the topk hypotheses.
+        topk_lengths : torch.Tensor (batch, topk)
+            The length of each topk hypothesis.
+        topk_log_probs : list
+            The log probabilities of each hypothesis.
+
+        Returns
+        -------
+        nbest : list
+            For each utterance, the list of its topk hypotheses, best first.
+            Each hypothesis is a dict with the "tokens" (eos excluded), the
+            "token_log_probs" of the decoder for these tokens and the final
+            "score" of the search.
+        """
+        nbest = []
+        for i in range(topk_hyps.size(0)):
+            utterance_nbest = []
+            for j in range(topk_hyps.size(1)):
+                length = topk_lengths[i, j].item()
+                tokens = filter_seq2seq_output(
+                    topk_hyps[i, j, :length].tolist(), eos_id=self.eos_index
+                )
+                token_log_probs = topk_log_probs[i * topk_hyps.size(1) + j]
+                utterance_nbest.append(
+                    {
+                        "tokens": tokens,
+                        "token_log_probs": token_log_probs[
+                            : len(tokens)
+                        ].tolist(),
+                        "score": topk_scores[i, j].item(),
+                    }
+                )
+            nbest.append(utterance_nbest)
+        return nbest
+
     def forward(self, enc_states, wav_len):  # noqa: C901
         enc_lens = torch.round(enc_states.shape[1] * wav_len).int()
         device = enc_states.device
@@ -602,6 +760,9 @@ class S2SBeamSearcher(S2SBaseSearcher):
 
         # keep the hypothesis that reaches eos and their corresponding score and log_probs.
         hyps_and_scores = [[] for _ in range(batch_size)]
+        # the lists of the utterances still in the batch (not finished).
+        active_hyps_and_scores = hyps_and_scores
+        full_batch_size = batch_size
 
         # keep the sequences that still not reaches eos.
         alived_seq = torch.empty(
@@ -620,10 +781,17 @@ class S2SBeamSearcher(S2SBaseSearcher):
         # This variable will be used when using_max_attn_shift=True
         prev_attn_peak = torch.zeros(batch_size * self.beam_size, device=device)
 
+        # The best score of the ended hypotheses, for pruning
+        best_ended_scores = torch.full(
+            (batch_size,), float("-inf"), device=device
+        )
+        decode_steps = 0
+
         for t in range(max_decode_steps):
             # terminate condition
-            if self._check_full_beams(hyps_and_scores, self.beam_size):
+            if self._check_full_beams(active_hyps_and_scores, self.beam_size):
                 break
+            decode_steps += batch_size
 
             log_probs, memory, attn = self.forward_step(
                 inp_tokens, memory, enc_states, enc_lens
@@ -781,7 +949,7 @@ class S2SBeamSearcher(S2SBaseSearcher):
                 inp_tokens,
                 alived_seq,
                 alived_log_probs,
-                hyps_and_scores,
+                active_hyps_and_scores,
                 scores,
                 timesteps=t,
             )
@@ -789,7 +957,74 @@ class S2SBeamSearcher(S2SBaseSearcher):
             # Block the paths that have reached eos.
             sequence_scores.masked_fill_(is_eos, float("-inf"))
 
-        if not self._check_full_beams(hyps_and_scores, self.beam_size):
+            # Block the paths too far from the best hypothesis.
+            if self.beam_threshold is not None:
+                pruned, best_ended_scores = self._prune_by_threshold(
+                    scores, is_eos, best_ended_scores
+                )
+                sequence_scores.masked_fill_(pruned, float("-inf"))
+
+            finished = self._check_finished_utterances(
+                active_hyps_and_scores,
+                sequence_scores,
+                alived_seq,
+                alived_log_probs,
+                scores,
+            )
+
+            # Remove the finished utterances from the batch.
+            if self.compact_batch and finished.any() and not finished.all():
+                kept = torch.nonzero(~finished, as_tuple=True)[0]
+                kept_hyps = (
+                    kept.unsqueeze(1) * self.beam_size
+                    + torch.arange(self.beam_size, device=device)
+                ).view(-1)
+                active_hyps_and_scores = [
+                    active_hyps_and_scores[i] for i in kept.tolist()
+                ]
+                batch_size = kept.size(0)
+                self.beam_offset = (
+                    torch.arange(batch_size, device=device) * self.beam_size
+                )
+                (
+                    enc_states,
+                    enc_lens,
+                    inp_tokens,
+                    scores,
+                    sequence_scores,
+                    alived_seq,
+                    alived_log_probs,
+                    prev_attn_peak,
+                ) = [
+                    torch.index_select(x, dim=0, index=kept_hyps)
+                    for x in (
+                        enc_states,
+                        enc_lens,
+                        inp_tokens,
+                        scores,
+                        sequence_scores,
+                        alived_seq,
+                        alived_log_probs,
+                        prev_attn_peak,
+                    )
+                ]
+                best_ended_scores = best_ended_scores[kept]
+                memory = self.compact_mem(memory, kept_hyps)
+                if self.lm_weight > 0:
+                    lm_memory = self.compact_lm_mem(lm_memory, kept_hyps)
+                if self.ctc_weight > 0:
+                    ctc_memory = ctc_scorer.select_utterances(ctc_memory, kept)
+                if self.coverage_penalty > 0:
+                    self.coverage = torch.index_select(
+                        self.coverage, dim=0, index=kept_hyps
+                    )
+
+        self.decode_steps += decode_steps
+        self.decode_steps_saved += (
+            full_batch_size * max_decode_steps - decode_steps
+        )
+
+        if not self._check_full_beams(active_hyps_and_scores, self.beam_size):
             # Using all eos to fill-up the hyps.
             eos = (
                 torch.zeros(batch_size * self.beam_size, device=device)
@@ -800,11 +1035,14 @@ class S2SBeamSearcher(S2SBaseSearcher):
                 eos,
                 alived_seq,
                 alived_log_probs,
-                hyps_and_scores,
+                active_hyps_and_scores,
                 scores,
                 timesteps=max_decode_steps,
             )
 
+        self.beam_offset = (
+            torch.arange(full_batch_size, device=device) * self.beam_size
+        )
         (
             topk_hyps,
             topk_scores,
@@ -817,10 +1055,16 @@ class S2SBeamSearcher(S2SBaseSearcher):
             predictions, eos_id=self.eos_index
         )
 
+        outputs = (predictions, topk_scores)
         if self.return_log_probs:
-            return predictions, topk_scores, log_probs
-        else:
-            return predictions, topk_scores
+            outputs += (log_probs,)
+        if self.return_nbest:
+            outputs += (
+                self._get_nbest(
+                    topk_hyps, topk_scores, topk_lengths, log_probs
+                ),
+            )
+        return outputs
 
     def ctc_forward_step(self, x):
         logits = self.ctc_fc(x)
@@ -862,6 +1106,42 @@ class S2SBeamSearcher(S2SBaseSearcher):
         """
         raise NotImplementedError
 
+    def compact_mem(self, memory, index):
+        """This method selects the hypotheses of the seq2seq model memory
+        that are kept when the finished utterances are removed from the
+        batch. By default, it is the same as permute_mem.
+
+        Arguments
+        ---------
+        memory : No limit
+            The memory variable to be compacted.
+        index : torch.Tensor
+            The index of the kept hypotheses.
+
+        Returns
+        -------
+        The variable of the memory being compacted.
+        """
+        return self.permute_mem(memory, index)
+
+    def compact_lm_mem(self, memory, index):
+        """This method selects the hypotheses of the language model memory
+        that are kept when the finished utterances are removed from the
+        batch. By default, it is the same as permute_lm_mem.
+
+        Arguments
+        ---------
+        memory : No limit
+            The memory variable to be compacted.
+        index : torch.Tensor
+            The index of the kept hypotheses.
+
+        Returns
+        -------
+        The variable of the memory being compacted.
+        """
+        return self.permute_lm_mem(memory, index)
+
 
 class S2SRNNBeamSearcher(S2SBeamSearcher):
     """
@@ -967,6 +1247,19 @@ class S2SRNNBeamSearcher(S2SBeamSearcher):
             )
         return (hs, c)
 
+    def compact_mem(self, memory, index):
+        memory = self.permute_mem(memory, index)
+        # The attention also keeps the projected encoder states and masks
+        for name in ["enc_len", "precomputed_enc_h", "mask", "keys", "values"]:
+            value = getattr(self.dec.attn, name, None)
+            if isinstance(value, torch.Tensor):
+                setattr(
+                    self.dec.attn,
+                    name,
+                    torch.index_select(value, dim=0, index=index),
+                )
+        return memory
+
 
 class S2SRNNBeamSearchLM(S2SRNNBeamSearcher):
     """This class implements the beam search decoding
@@ -1236,6 +1529,12 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
         The model to use for decoding.
     linear : torch.nn.Module
         A linear output layer.
+    use_kv_cache : bool
+        Whether to decode incrementally, caching the self-attention keys
+        and values of the previous tokens in each layer of the decoder (and
+        of the LM), when the model supports decode_step() (and the LM
+        forward_step()). Otherwise the whole prefix is decoded at every
+        step. (default: True)
     **kwargs
         Arguments to pass to S2SBeamSearcher
 
@@ -1245,7 +1544,12 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
     """
 
     def __init__(
-        self, modules, temperature=1.0, temperature_lm=1.0, **kwargs,
+        self,
+        modules,
+        temperature=1.0,
+        temperature_lm=1.0,
+        use_kv_cache=True,
+        **kwargs,
     ):
         super(S2STransformerBeamSearch, self).__init__(**kwargs)
 
@@ -1256,6 +1560,12 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
 
         self.temperature = temperature
         self.temperature_lm = temperature_lm
+        self.use_kv_cache = use_kv_cache and _supports_step(
+            self.model, "decode_step"
+        )
+        self.use_lm_kv_cache = use_kv_cache and _supports_step(
+            self.lm_modules, "forward_step"
+        )
 
     def reset_mem(self, batch_size, device):
         return None
@@ -1264,26 +1574,239 @@ class S2STransformerBeamSearch(S2SBeamSearcher):
         return None
 
     def permute_mem(self, memory, index):
+        if self.use_kv_cache:
+            return _permute_cached_mem(memory, index)
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
     def permute_lm_mem(self, memory, index):
+        if self.use_lm_kv_cache:
+            return _permute_cached_mem(memory, index)
         memory = torch.index_select(memory, dim=0, index=index)
         return memory
 
     def forward_step(self, inp_tokens, memory, enc_states, enc_lens):
-        memory = _update_mem(inp_tokens, memory)
-        pred, attn = self.model.decode(memory, enc_states)
+        if not self.use_kv_cache:
+            memory = _update_mem(inp_tokens, memory)
+            pred, attn = self.model.decode(memory, enc_states)
+            prob_dist = self.softmax(self.fc(pred) / self.temperature)
+            return prob_dist[:, -1, :], memory, attn
+
+        # memory: (tokens, decoder cache, attention of the previous tokens)
+        tokens, cache, prev_attn = (
+            (None, None, None) if memory is None else memory
+        )
+        tokens = _update_mem(inp_tokens, tokens)
+        pred, attn, cache = self.model.decode_step(tokens, enc_states, cache)
+        if prev_attn is not None:
+            attn = torch.cat([prev_attn, attn], dim=1)
         prob_dist = self.softmax(self.fc(pred) / self.temperature)
-        return prob_dist[:, -1, :], memory, attn
+        return prob_dist[:, -1, :], (tokens, cache, attn), attn
 
     def lm_forward_step(self, inp_tokens, memory):
-        memory = _update_mem(inp_tokens, memory)
         if not next(self.lm_modules.parameters()).is_cuda:
             self.lm_modules.to(inp_tokens.device)
-        logits = self.lm_modules(memory)
+        if not self.use_lm_kv_cache:
+            memory = _update_mem(inp_tokens, memory)
+            logits = self.lm_modules(memory)
+            log_probs = self.softmax(logits / self.temperature_lm)
+            return log_probs[:, -1, :], memory
+
+        # memory: (tokens, LM cache)
+        tokens, cache = (None, None) if memory is None else memory
+        tokens = _update_mem(inp_tokens, tokens)
+        logits, cache = self.lm_modules.forward_step(tokens, cache)
         log_probs = self.softmax(logits / self.temperature_lm)
-        return log_probs[:, -1, :], memory
+        return log_probs[:, -1, :], (tokens, cache)
+
+
+def _supports_step(module, method):
+    """Whether an incremental step method (e.g. decode_step) can be used
+    with a module: it must be implemented, and supported by the configuration
+    of the module, as given by its supports_<method> property, if any."""
+    return hasattr(module, method) and getattr(
+        module, "supports_" + method, True
+    )
+
+
+def _permute_cached_mem(memory, index):
+    """Permutes the memory of an incremental transformer decoding: a tuple
+    of tensors and of lists of tensors (the caches of the layers), with
+    the hypotheses as first dimension.
+
+    Arguments
+    ---------
+    memory : tuple
+        The memory variable to be permuted.
+    index : torch.Tensor
+        The index of the previous path.
+
+    Returns
+    -------
+    tuple
+        The memory being permuted.
+    """
+    permuted = []
+    for item in memory:
+        if isinstance(item, list):
+            permuted.append(
+                [torch.index_select(x, dim=0, index=index) for x in item]
+            )
+        else:
+            permuted.append(torch.index_select(item, dim=0, index=index))
+    return tuple(permuted)
+
+
+def lm_score_sequences(lm_modules, sequences, bos_index, eos_index):
+    """Computes the log-probabilities of a batch of token sequences with
+    a neural language model (e.g. TransformerLM or RNNLM).
+
+    All the sequences are scored with one padded forward of the LM: the
+    inputs are the sequences preceded by bos and the targets are the
+    sequences followed by eos.
+
+    Arguments
+    ---------
+    lm_modules : torch.nn.Module
+        The language model, returning the logits (and possibly its hidden
+        states) for a batch of token sequences.
+    sequences : list
+        The token sequences to score, as lists of ints.
+    bos_index : int
+        The index of beginning-of-sequence token.
+    eos_index : int
+        The index of end-of-sequence token.
+
+    Returns
+    -------
+    torch.Tensor
+        The log-probability of each sequence (natural log).
+
+    Example
+    -------
+    >>> from speechbrain.lobes.models.RNNLM import RNNLM
+    >>> lm = RNNLM(output_neurons=5, return_hidden=True).eval()
+    >>> log_probs = lm_score_sequences(lm, [[3, 4], [], [2]], 1, 2)
+    >>> log_probs.shape
+    torch.Size([3])
+    """
+    device = next(lm_modules.parameters()).device
+    lengths = torch.tensor([len(seq) + 1 for seq in sequences], device=device)
+    inputs = torch.zeros(
+        len(sequences), int(lengths.max()), dtype=torch.long, device=device
+    )
+    targets = torch.zeros_like(inputs)
+    for i, seq in enumerate(sequences):
+        seq = torch.tensor(seq, dtype=torch.long, device=device)
+        inputs[i, 0] = bos_index
+        inputs[i, 1 : len(seq) + 1] = seq
+        targets[i, : len(seq)] = seq
+        targets[i, len(seq)] = eos_index
+
+    logits = lm_modules(inputs)
+    if isinstance(logits, tuple):
+        logits = logits[0]
+    log_probs = torch.log_softmax(logits, dim=-1)
+    log_probs = log_probs.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+    mask = sb.dataio.dataio.length_to_mask(lengths, dtype=torch.bool)
+    return log_probs.masked_fill(~mask, 0.0).sum(dim=-1)
+
+
+def rescore_nbest(
+    nbest,
+    lm_modules,
+    bos_index,
+    eos_index,
+    lm_weight=0.5,
+    max_batch_size=None,
+    length_normalization=True,
+):
+    """Rescores the n-best lists returned by a beam searcher with a
+    language model, in a second pass.
+
+    The hypotheses of all the utterances are scored together, in padded
+    batches of at most max_batch_size hypotheses. This allows to use a
+    small LM (or none) during the search, and a large one only once
+    per hypothesis.
+
+    With length normalization, the search score of a hypothesis is its
+    log-probability divided by the number of decoded steps (its tokens and
+    eos), so the LM log-probability (also over the tokens and eos) is divided
+    the same way before being added. Pass the length_normalization of the
+    searcher.
+
+    Arguments
+    ---------
+    nbest : list
+        For each utterance, the list of its hypotheses, as dicts with
+        "tokens" and "score" (see S2SBeamSearcher with return_nbest=True).
+    lm_modules : torch.nn.Module
+        The language model (e.g. TransformerLM or RNNLM).
+    bos_index : int
+        The index of beginning-of-sequence token.
+    eos_index : int
+        The index of end-of-sequence token.
+    lm_weight : float
+        The weight of the LM score (λ): score + λ log P_LM(y), or
+        score + λ log P_LM(y) / (len(y) + 1) with length normalization.
+    max_batch_size : int
+        The maximum number of hypotheses per forward of the LM.
+        If None, all the hypotheses are scored in one forward.
+    length_normalization : bool
+        Whether the search scores are length-normalized, as with
+        S2SBeamSearcher(length_normalization=True), the default.
+
+    Returns
+    -------
+    list
+        The rescored n-best lists, sorted by decreasing score. Each
+        hypothesis gets its "lm_score" (log P_LM(y), not normalized) and its
+        updated "score".
+
+    Example
+    -------
+    >>> from speechbrain.lobes.models.RNNLM import RNNLM
+    >>> lm = RNNLM(output_neurons=5, return_hidden=True).eval()
+    >>> nbest = [
+    ...     [{"tokens": [3, 4], "score": -1.0}, {"tokens": [3], "score": -2.0}],
+    ...     [{"tokens": [4], "score": -0.5}],
+    ... ]
+    >>> rescored = rescore_nbest(nbest, lm, bos_index=1, eos_index=2)
+    >>> [len(hyps) for hyps in rescored]
+    [2, 1]
+    >>> sorted(rescored[1][0].keys())
+    ['lm_score', 'score', 'tokens']
+    """
+    hyps = [hyp for utterance_nbest in nbest for hyp in utterance_nbest]
+    if max_batch_size is None:
+        max_batch_size = max(len(hyps), 1)
+
+    lm_scores = []
+    with torch.no_grad():
+        for start in range(0, len(hyps), max_batch_size):
+            batch = hyps[start : start + max_batch_size]
+            lm_scores += lm_score_sequences(
+                lm_modules,
+                [hyp["tokens"] for hyp in batch],
+                bos_index,
+                eos_index,
+            ).tolist()
+
+    rescored = []
+    lm_scores = iter(lm_scores)
+    for utterance_nbest in nbest:
+        utterance_rescored = []
+        for hyp in utterance_nbest:
+            lm_score = next(lm_scores)
+            hyp = dict(hyp)
+            hyp["lm_score"] = lm_score
+            if length_normalization:
+                lm_score = lm_score / (len(hyp["tokens"]) + 1)
+            hyp["score"] = hyp["score"] + lm_weight * lm_score
+            utterance_rescored.append(hyp)
+        utterance_rescored.sort(key=lambda hyp: hyp["score"], reverse=True)
+        rescored.append(utterance_rescored)
+    return rescored
 
 
 def batch_filter_seq2seq_output(prediction, eos_id=-1):
@@ -5,6 +5,7 @@ Author:
     Sung-Lin Yeh 2020
 """
 import torch
+from speechbrain.utils.cache import LRUCache, value_nbytes
 
 
 class TransducerBeamSearcher(torch.nn.Module):
@@ -40,6 +41,15 @@ class TransducerBeamSearcher(torch.nn.Module):
         that are added in A (process_hyp).
         Reference: https://arxiv.org/pdf/1911.01629.pdf
         Reference: https://github.com/kaldi-asr/kaldi/blob/master/src/decoder/simple-decoder.cc (See PruneToks)
+    max_symbols_per_step : int
+        The maximum number of tokens a hypothesis can be extended by at
+        each time step in beam search. (default: 4)
+    pn_cache_bytes : int
+        Size bound of the cache of prediction network outputs and hiddens
+        by label prefix, shared by the hyps of a batch in beam search,
+        so that identical prefixes cost one PN forward. 0 disables the
+        cache. The hits and misses are counted in ``pn_cache_hits`` and
+        ``pn_cache_misses``. (default: 2 ** 26)
 
     Example
     -------
@@ -95,6 +105,8 @@ class TransducerBeamSearcher(torch.nn.Module):
         lm_weight=0.0,
         state_beam=2.3,
         expand_beam=2.3,
+        max_symbols_per_step=4,
+        pn_cache_bytes=2 ** 26,
     ):
         super(TransducerBeamSearcher, self).__init__()
         self.decode_network_lst = decode_network_lst
@@ -111,6 +123,10 @@ class TransducerBeamSearcher(torch.nn.Module):
 
         self.state_beam = state_beam
         self.expand_beam = expand_beam
+        self.max_symbols_per_step = max_symbols_per_step
+        self.pn_cache_bytes = pn_cache_bytes
+        self.pn_cache_hits = 0
+        self.pn_cache_misses = 0
         self.softmax = torch.nn.LogSoftmax(dim=-1)
 
         if self.beam_size <= 1:
@@ -134,6 +150,109 @@ class TransducerBeamSearcher(torch.nn.Module):
         hyps = self.searcher(tn_output)
         return hyps
 
+    def init_search_state(self, batch_size, device):
+        """Returns the state of a search over a batch before its first frame.
+
+        The search can then go on frame by frame with ``search_step``, e.g.
+        on the chunks of a stream (see ``TransducerStreamingDecoder``).
+
+        Arguments
+        ----------
+        batch_size : int
+            Number of utterances decoded together.
+        device : torch.device
+            Device of the transcription network outputs.
+
+        Returns
+        -------
+        dict
+            The search state.
+        """
+        if self.beam_size <= 1:
+            return self._greedy_init(batch_size, device)
+        return self._beam_search_init(batch_size, device)
+
+    def search_step(self, state, tn_output):
+        """Continues the search of ``state`` over some transcription network
+        output frames. The state is updated in place.
+
+        Arguments
+        ----------
+        state : dict
+            The search state, see ``init_search_state``.
+        tn_output : torch.tensor
+            Output from transcription network with shape
+            [batch, time_len, hiddens].
+        """
+        for t_step in range(tn_output.size(1)):
+            if self.beam_size <= 1:
+                self._greedy_step(state, tn_output[:, t_step, :])
+            else:
+                self._beam_search_step(state, tn_output[:, t_step, :])
+
+    def search_result(self, state):
+        """Returns the hypotheses of the search, as ``forward`` does.
+
+        Arguments
+        ----------
+        state : dict
+            The search state, see ``init_search_state``.
+        """
+        if self.beam_size <= 1:
+            return self._greedy_result(state)
+        return self._beam_search_result(state)
+
+    def partial_hypotheses(self, state):
+        """Returns the current best hypothesis and its stable prefix for each
+        utterance of a search.
+
+        The stable prefix is the part of the hypothesis that later frames
+        cannot change anymore: all of it in greedy search, and the common
+        prefix of the hypotheses of the beam in beam search.
+
+        Arguments
+        ----------
+        state : dict
+            The search state, see ``init_search_state``.
+
+        Returns
+        -------
+        best_hyps : list
+            Best hypothesis (list of tokens) of each utterance.
+        stable_hyps : list
+            Stable prefix (list of tokens) of each utterance.
+        """
+        if self.beam_size <= 1:
+            best_hyps = [list(hyp) for hyp in state["prediction"]]
+            return best_hyps, [list(hyp) for hyp in best_hyps]
+
+        hyps = state["hyps"]
+        beam = self.beam_size
+        scores = hyps["logp_score"].view(-1, beam).cpu()
+        norm_scores = scores / hyps["length"].view(-1, beam).cpu()
+        predictions = hyps["prediction"].tolist()
+        lengths = hyps["length"].tolist()
+        best_hyps = []
+        stable_hyps = []
+        for i_batch, best in enumerate(norm_scores.argmax(dim=1).tolist()):
+            alive = [
+                predictions[i_batch * beam + j][1 : lengths[i_batch * beam + j]]
+                for j in range(beam)
+                if torch.isfinite(scores[i_batch, j])
+            ]
+            hyp = i_batch * beam + best
+            best_hyps.append(predictions[hyp][1 : lengths[hyp]])
+            stable = best_hyps[-1]
+            for other in alive:
+                n_common = 0
+                for token_a, token_b in zip(stable, other):
+                    if token_a != token_b:
+                        break
+                    n_common += 1
+                stable = stable[:n_common]
+            stable_hyps.append(list(stable))
+        return best_hyps, stable_hyps
+
     def transducer_greedy_decode(self, tn_output):
         """Transducer greedy decoder is a greedy decoder over batch which apply Transducer rules:
             1- for each time step in the Transcription Network (TN) output:
@@ -154,77 +273,91 @@ class TransducerBeamSearcher(torch.nn.Module):
             Outputs a logits tensor [B,T,1,Output_Dim]; padding
             has not been removed.
         """
-        hyp = {
-            "prediction": [[] for _ in range(tn_output.size(0))],
-            "logp_scores": [0.0 for _ in range(tn_output.size(0))],
-        }
+        state = self._greedy_init(tn_output.size(0), tn_output.device)
+        # For each time step
+        for t_step in range(tn_output.size(1)):
+            self._greedy_step(state, tn_output[:, t_step, :])
+        return self._greedy_result(state)
+
+    def _greedy_init(self, batch_size, device):
+        """Greedy search state before the first frame."""
         # prepare BOS = Blank for the Prediction Network (PN)
-        hidden = None
         input_PN = (
-            torch.ones(
-                (tn_output.size(0), 1),
-                device=tn_output.device,
-                dtype=torch.int32,
-            )
+            torch.ones((batch_size, 1), device=device, dtype=torch.int32,)
             * self.blank_id
         )
         # First forward-pass on PN
         out_PN, hidden = self._forward_PN(input_PN, self.decode_network_lst)
-        # For each time step
-        for t_step in range(tn_output.size(1)):
-            # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
-            log_probs = self._joint_forward_step(
-                tn_output[:, t_step, :].unsqueeze(1).unsqueeze(1),
-                out_PN.unsqueeze(1),
+        return {
+            "prediction": [[] for _ in range(batch_size)],
+            "logp_scores": [0.0 for _ in range(batch_size)],
+            "input_PN": input_PN,
+            "out_PN": out_PN,
+            "hidden": hidden,
+        }
+
+    def _greedy_step(self, state, tn_step):
+        """Greedy search over one frame [batch, hiddens]."""
+        input_PN = state["input_PN"]
+        out_PN = state["out_PN"]
+        # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
+        log_probs = self._joint_forward_step(
+            tn_step.unsqueeze(1).unsqueeze(1), out_PN.unsqueeze(1),
+        )
+        # Sort outputs at time
+        logp_targets, positions = torch.max(
+            self.softmax(log_probs).squeeze(1).squeeze(1), dim=1
+        )
+        # Batch hidden update
+        have_update_hyp = []
+        for i in range(positions.size(0)):
+            # Update hiddens only if
+            # 1- current prediction is non blank
+            if positions[i].item() != self.blank_id:
+                state["prediction"][i].append(positions[i].item())
+                state["logp_scores"][i] += logp_targets[i]
+                input_PN[i][0] = positions[i]
+                have_update_hyp.append(i)
+        if len(have_update_hyp) > 0:
+            # Select sentence to update
+            # And do a forward steps + generated hidden
+            (
+                selected_input_PN,
+                selected_hidden,
+            ) = self._get_sentence_to_update(
+                have_update_hyp, input_PN, state["hidden"]
             )
-            # Sort outputs at time
-            logp_targets, positions = torch.max(
-                self.softmax(log_probs).squeeze(1).squeeze(1), dim=1
+            selected_out_PN, selected_hidden = self._forward_PN(
+                selected_input_PN, self.decode_network_lst, selected_hidden
+            )
+            # update hiddens and out_PN
+            out_PN[have_update_hyp] = selected_out_PN
+            state["hidden"] = self._update_hiddens(
+                have_update_hyp, selected_hidden, state["hidden"]
             )
-            # Batch hidden update
-            have_update_hyp = []
-            for i in range(positions.size(0)):
-                # Update hiddens only if
-                # 1- current prediction is non blank
-                if positions[i].item() != self.blank_id:
-                    hyp["prediction"][i].append(positions[i].item())
-                    hyp["logp_scores"][i] += logp_targets[i]
-                    input_PN[i][0] = positions[i]
-                    have_update_hyp.append(i)
-            if len(have_update_hyp) > 0:
-                # Select sentence to update
-                # And do a forward steps + generated hidden
-                (
-                    selected_input_PN,
-                    selected_hidden,
-                ) = self._get_sentence_to_update(
-                    have_update_hyp, input_PN, hidden
-                )
-                selected_out_PN, selected_hidden = self._forward_PN(
-                    selected_input_PN, self.decode_network_lst, selected_hidden
-                )
-                # update hiddens and out_PN
-                out_PN[have_update_hyp] = selected_out_PN
-                hidden = self._update_hiddens(
-                    have_update_hyp, selected_hidden, hidden
-                )
 
+    def _greedy_result(self, state):
+        """Hypotheses of a greedy search, as returned by ``forward``."""
         return (
-            hyp["prediction"],
-            torch.Tensor(hyp["logp_scores"]).exp().mean(),
+            state["prediction"],
+            torch.Tensor(state["logp_scores"]).exp().mean(),
             None,
             None,
         )
 
     def transducer_beam_search_decode(self, tn_output):
         """Transducer beam search decoder is a beam search decoder over batch which apply Transducer rules:
-            1- for each utterance:
-                2- for each time steps in the Transcription Network (TN) output:
-                    -> Do forward on PN and Joint network
-                    -> Select topK <= beam
-                    -> Do a while loop extending the hyps until we reach blank
-                        -> otherwise:
-                        --> extend hyp by the new token
+            1- for each time steps in the Transcription Network (TN) output:
+                -> Do forward on PN and Joint network for all the
+                   hypotheses of all the utterances at once
+                -> Hyps ending with blank go to the beam of the next step
+                -> Extend the hyps by the topK non-blank tokens, keep the
+                   best beam_size ones per utterance and repeat, until the
+                   extended hyps are worse by more than state_beam than the
+                   ones ending with blank (or max_symbols_per_step is reached).
+
+        The hypotheses of all the utterances are kept in packed tensors
+        of batch_size * beam_size rows (see ``_select_hyps``).
 
         Arguments
         ----------
@@ -238,131 +371,179 @@ class TransducerBeamSearcher(torch.nn.Module):
             Outputs a logits tensor [B,T,1,Output_Dim]; padding
             has not been removed.
         """
+        state = self._beam_search_init(tn_output.size(0), tn_output.device)
+        # For each time step
+        for t_step in range(tn_output.size(1)):
+            self._beam_search_step(state, tn_output[:, t_step, :])
+        return self._beam_search_result(state)
 
-        # min between beam and max_target_lent
-        nbest_batch = []
-        nbest_batch_score = []
-        for i_batch in range(tn_output.size(0)):
-            # if we use RNN LM keep there hiddens
-            # prepare BOS = Blank for the Prediction Network (PN)
-            # Prepare Blank prediction
-            blank = (
-                torch.ones((1, 1), device=tn_output.device, dtype=torch.int32)
-                * self.blank_id
+    def _beam_search_init(self, batch_size, device):
+        """Beam search state before the first frame."""
+        beam = self.beam_size
+        n_hyps = batch_size * beam
+        # Only the first hyp of each utterance is alive at the start,
+        # with prediction = [BOS = Blank]
+        scores = torch.full((batch_size, beam), float("-inf"), device=device)
+        scores[:, 0] = 0.0
+        input_PN = torch.full(
+            (n_hyps, 1), self.blank_id, device=device, dtype=torch.int32
+        )
+        out_PN, hidden = self._forward_PN(input_PN, self.decode_network_lst)
+        hidden_lm = None
+        if self.lm_weight > 0:
+            # The initial LM state of each hyp: the zero state (as for
+            # hx=None), materialized so that it is carried like the others
+            _, hidden_lm = self._lm_forward_step(input_PN.long(), None)
+            hidden_lm = self._zeros_hidden(hidden_lm)
+        return {
+            "batch_size": batch_size,
+            "hyps": {
+                "prediction": input_PN.long(),
+                "length": torch.ones(n_hyps, device=device, dtype=torch.long),
+                "logp_score": scores.view(-1),
+                "out_PN": out_PN,
+                "hidden_dec": hidden,
+                "hidden_lm": hidden_lm,
+            },
+            # PN outputs and hiddens by label prefix, for this batch
+            "pn_cache": (
+                LRUCache(self.pn_cache_bytes) if self.pn_cache_bytes else None
+            ),
+        }
+
+    def _beam_search_step(self, state, tn_step):
+        """Beam search over one frame [batch, hiddens]."""
+        batch_size = state["batch_size"]
+        beam = self.beam_size
+        n_hyps = batch_size * beam
+        # Index of the first hyp of each utterance in the packed tensors
+        beam_offset = torch.arange(batch_size, device=tn_step.device)
+        beam_offset = beam_offset.unsqueeze(1) * beam
+
+        # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
+        tn_step = tn_step.repeat_interleave(beam, dim=0)
+        tn_step = tn_step.unsqueeze(1).unsqueeze(1)
+        # get hyps for extension
+        process_hyps = state["hyps"]
+        beam_hyps = None
+        for _ in range(self.max_symbols_per_step):
+            log_probs = self._joint_forward_step(
+                tn_step, process_hyps["out_PN"].unsqueeze(1)
+            ).view(n_hyps, -1)
+
+            # Hyps ending with blank compete for the beam
+            blank_hyps = dict(process_hyps)
+            blank_hyps["logp_score"] = (
+                process_hyps["logp_score"] + log_probs[:, self.blank_id]
+            )
+            if beam_hyps is None:
+                beam_hyps = blank_hyps
+            else:
+                beam_hyps = self._merge_hyps(beam_hyps, blank_hyps)
+
+            if self.lm_weight > 0:
+                log_probs_lm, hidden_lm = self._lm_forward_step(
+                    self._last_tokens(process_hyps), process_hyps["hidden_lm"],
+                )
+                log_probs_lm = log_probs_lm.view(n_hyps, -1)
+
+            # Sort outputs at time
+            logp_targets, positions = torch.topk(log_probs, k=beam, dim=-1)
+            is_blank = positions == self.blank_id
+            best_logp = logp_targets.masked_fill(is_blank, float("-inf")).max(
+                dim=-1, keepdim=True
+            )[0]
+            expand_scores = process_hyps["logp_score"].unsqueeze(
+                1
+            ) + logp_targets.masked_fill(
+                is_blank | (logp_targets < best_logp - self.expand_beam),
+                float("-inf"),
+            )
+            if self.lm_weight > 0:
+                expand_scores = expand_scores + (
+                    self.lm_weight * log_probs_lm.gather(1, positions)
+                )
+
+            # Keep the best expansions of each utterance (norm score)
+            norm_scores = expand_scores / (
+                process_hyps["length"].unsqueeze(1) + 1
+            )
+            _, expand_index = norm_scores.view(batch_size, beam * beam).topk(
+                beam, dim=-1
+            )
+            expand_scores = expand_scores.view(batch_size, -1).gather(
+                1, expand_index
+            )
+            tokens = positions.view(batch_size, -1).gather(1, expand_index)
+            parents = (beam_offset + expand_index // beam).view(-1)
+
+            # Stop extending the hyps of an utterance once its best
+            # expanded hyp is worse by more than state_beam than the best
+            # hyp of the beam (best by norm score, compared by score)
+            beam_norm_scores = beam_hyps["logp_score"] / beam_hyps["length"]
+            beam_best = (
+                beam_hyps["logp_score"]
+                .view(batch_size, -1)
+                .gather(
+                    1, beam_norm_scores.view(batch_size, -1).argmax(1, True)
+                )
+            )
+            expand_best = expand_scores[:, :1]
+            expand_scores = expand_scores.masked_fill(
+                beam_best >= self.state_beam + expand_best, float("-inf")
+            )
+            if not torch.isfinite(expand_scores).any():
+                break
+
+            # Extend hyps by the selection, one PN forward for all
+            process_hyps = self._select_hyps(process_hyps, parents)
+            process_hyps["logp_score"] = expand_scores.view(-1)
+            process_hyps["prediction"] = self._append_tokens(
+                process_hyps["prediction"],
+                process_hyps["length"],
+                tokens.view(-1),
             )
-            input_PN = (
-                torch.ones((1, 1), device=tn_output.device, dtype=torch.int32)
-                * self.blank_id
+            process_hyps["length"] = process_hyps["length"] + 1
+            (
+                process_hyps["out_PN"],
+                process_hyps["hidden_dec"],
+            ) = self._cached_forward_PN(
+                process_hyps, tokens.view(-1), state["pn_cache"]
             )
-            # First forward-pass on PN
-            hyp = {
-                "prediction": [self.blank_id],
-                "logp_score": 0.0,
-                "hidden_dec": None,
-            }
             if self.lm_weight > 0:
-                lm_dict = {"hidden_lm": None}
-                hyp.update(lm_dict)
-            beam_hyps = [hyp]
-
-            # For each time step
-            for t_step in range(tn_output.size(1)):
-                # get hyps for extension
-                process_hyps = beam_hyps
-                beam_hyps = []
-                while True:
-                    if len(beam_hyps) >= self.beam_size:
-                        break
-                    # Add norm score
-                    a_best_hyp = max(
-                        process_hyps,
-                        key=lambda x: x["logp_score"] / len(x["prediction"]),
-                    )
-
-                    # Break if best_hyp in A is worse by more than state_beam than best_hyp in B
-                    if len(beam_hyps) > 0:
-                        b_best_hyp = max(
-                            beam_hyps,
-                            key=lambda x: x["logp_score"]
-                            / len(x["prediction"]),
-                        )
-                        a_best_prob = a_best_hyp["logp_score"]
-                        b_best_prob = b_best_hyp["logp_score"]
-                        if b_best_prob >= self.state_beam + a_best_prob:
-                            break
-
-                    # remove best hyp from process_hyps
-                    process_hyps.remove(a_best_hyp)
-
-                    # forward PN
-                    input_PN[0, 0] = a_best_hyp["prediction"][-1]
-                    out_PN, hidden = self._forward_PN(
-                        input_PN,
-                        self.decode_network_lst,
-                        a_best_hyp["hidden_dec"],
-                    )
-                    # do unsqueeze over since tjoint must be have a 4 dim [B,T,U,Hidden]
-                    log_probs = self._joint_forward_step(
-                        tn_output[i_batch, t_step, :]
-                        .unsqueeze(0)
-                        .unsqueeze(0)
-                        .unsqueeze(0),
-                        out_PN.unsqueeze(0),
-                    )
-
-                    if self.lm_weight > 0:
-                        log_probs_lm, hidden_lm = self._lm_forward_step(
-                            input_PN, a_best_hyp["hidden_lm"]
-                        )
-
-                    # Sort outputs at time
-                    logp_targets, positions = torch.topk(
-                        log_probs.view(-1), k=self.beam_size, dim=-1
-                    )
-                    best_logp = (
-                        logp_targets[0]
-                        if positions[0] != blank
-                        else logp_targets[1]
-                    )
-
-                    # Extend hyp by  selection
-                    for j in range(logp_targets.size(0)):
-
-                        # hyp
-                        topk_hyp = {
-                            "prediction": a_best_hyp["prediction"][:],
-                            "logp_score": a_best_hyp["logp_score"]
-                            + logp_targets[j],
-                            "hidden_dec": a_best_hyp["hidden_dec"],
-                        }
-
-                        if positions[j] == self.blank_id:
-                            beam_hyps.append(topk_hyp)
-                            if self.lm_weight > 0:
-                                topk_hyp["hidden_lm"] = a_best_hyp["hidden_lm"]
-                            continue
-
-                        if logp_targets[j] >= best_logp - self.expand_beam:
-                            topk_hyp["prediction"].append(positions[j].item())
-                            topk_hyp["hidden_dec"] = hidden
-                            if self.lm_weight > 0:
-                                topk_hyp["hidden_lm"] = hidden_lm
-                                topk_hyp["logp_score"] += (
-                                    self.lm_weight
-                                    * log_probs_lm[0, 0, positions[j]]
-                                )
-                            process_hyps.append(topk_hyp)
-            # Add norm score
-            nbest_hyps = sorted(
-                beam_hyps,
-                key=lambda x: x["logp_score"] / len(x["prediction"]),
-                reverse=True,
-            )[: self.nbest]
+                process_hyps["hidden_lm"] = self._select_hidden(
+                    hidden_lm, parents
+                )
+        state["hyps"] = beam_hyps
+
+    def _beam_search_result(self, state):
+        """Hypotheses of a beam search, as returned by ``forward``."""
+        batch_size = state["batch_size"]
+        beam = self.beam_size
+        beam_hyps = state["hyps"]
+        # Add norm score
+        norm_scores = (
+            (beam_hyps["logp_score"] / beam_hyps["length"])
+            .view(batch_size, beam)
+            .cpu()
+        )
+        predictions = beam_hyps["prediction"].cpu()
+        lengths = beam_hyps["length"].cpu()
+        nbest_batch = []
+        nbest_batch_score = []
+        for i_batch in range(batch_size):
+            order = norm_scores[i_batch].argsort(descending=True)
             all_predictions = []
             all_scores = []
-            for hyp in nbest_hyps:
-                all_predictions.append(hyp["prediction"][1:])
-                all_scores.append(hyp["logp_score"] / len(hyp["prediction"]))
+            for j in order[: self.nbest].tolist():
+                score = norm_scores[i_batch, j].item()
+                if score == float("-inf"):
+                    break
+                hyp = i_batch * beam + j
+                all_predictions.append(
+                    predictions[hyp, 1 : lengths[hyp]].tolist()
+                )
+                all_scores.append(score)
             nbest_batch.append(all_predictions)
             nbest_batch_score.append(all_scores)
         return (
@@ -376,6 +557,233 @@ class TransducerBeamSearcher(torch.nn.Module):
             nbest_batch_score,
         )
 
+    def _cached_forward_PN(self, hyps, tokens, pn_cache):
+        """Forward-pass of the prediction network (PN) for the hyps just
+        extended by tokens, reusing the outputs cached for their prefix.
+
+        The PN only depends on the labels, so hyps with the same prefix
+        (e.g. with different alignments) share one PN forward-pass. The
+        hyps with a -inf score are skipped.
+
+        Arguments
+        ----------
+        hyps : dict
+            Packed hypotheses (see ``_select_hyps``), whose prediction
+            ends with tokens, with the PN outputs and hiddens from before
+            tokens.
+        tokens : torch.tensor
+            The last token of each hypothesis [N].
+        pn_cache : LRUCache
+            Cache of the PN outputs and hiddens by prefix, or None to run
+            the PN on all the hyps.
+
+        Returns
+        -------
+        out_PN : torch.tensor
+            Outputs of the PN [N, 1, hiddens].
+        hidden : torch.tensor
+            Hiddens of the PN, for the next step.
+        """
+        if pn_cache is None:
+            return self._forward_PN(
+                tokens.view(-1, 1).int(),
+                self.decode_network_lst,
+                hyps["hidden_dec"],
+            )
+
+        alive = torch.isfinite(hyps["logp_score"]).nonzero().view(-1).tolist()
+        predictions = hyps["prediction"].tolist()
+        lengths = hyps["length"].tolist()
+        keys = {i: tuple(predictions[i][: lengths[i]]) for i in alive}
+        cached = {}
+        to_compute = {}
+        for i, key in keys.items():
+            if key in cached or key in to_compute:
+                self.pn_cache_hits += 1
+                continue
+            value = pn_cache.get(key)
+            if value is None:
+                self.pn_cache_misses += 1
+                to_compute[key] = i
+            else:
+                self.pn_cache_hits += 1
+                cached[key] = value
+
+        out_PN = hyps["out_PN"].clone()
+        hidden = self._clone_hidden(hyps["hidden_dec"])
+        if to_compute:
+            rows = list(to_compute.values())
+            new_out_PN, new_hidden = self._forward_PN(
+                tokens[rows].view(-1, 1).int(),
+                self.decode_network_lst,
+                self._select_hidden(hyps["hidden_dec"], rows),
+            )
+            # Size of the outputs and hiddens of one hyp
+            nbytes = value_nbytes([new_out_PN, new_hidden]) // new_out_PN.size(
+                0
+            )
+            for j, key in enumerate(to_compute):
+                # Copies, so that the batch tensors are not kept alive
+                cached[key] = (
+                    new_out_PN[j].clone(),
+                    self._clone_hidden(self._select_hidden(new_hidden, j)),
+                )
+                pn_cache.put(key, cached[key], nbytes)
+
+        if alive:
+            values = [cached[key] for key in keys.values()]
+            out_PN[alive] = torch.stack([value[0] for value in values])
+            self._set_hidden(
+                hidden, alive, [value[1] for value in values],
+            )
+        return out_PN, hidden
+
+    def _clone_hidden(self, hidden):
+        """Copies recurrent hiddens (None, tensor or tuple of tensors)."""
+        if hidden is None:
+            return None
+        if isinstance(hidden, tuple):
+            return tuple(h.clone() for h in hidden)
+        return hidden.clone()
+
+    def _zeros_hidden(self, hidden):
+        """Zero recurrent hiddens of the same shape (None, tensor or tuple
+        of tensors)."""
+        if hidden is None:
+            return None
+        if isinstance(hidden, tuple):
+            return tuple(torch.zeros_like(h) for h in hidden)
+        return torch.zeros_like(hidden)
+
+    def _set_hidden(self, hidden, index, values):
+        """Sets hypotheses in recurrent hiddens [layers, N, hiddens], from
+        a list of hiddens [layers, hiddens] of single hypotheses."""
+        if hidden is None:
+            return
+        if isinstance(hidden, tuple):
+            for k, h in enumerate(hidden):
+                h[:, index] = torch.stack([value[k] for value in values], 1)
+        else:
+            hidden[:, index] = torch.stack(values, 1)
+
+    def _merge_hyps(self, hyps_a, hyps_b):
+        """Keeps the best beam_size hyps of each utterance (by norm score)
+        among two sets of packed hypotheses.
+
+        Arguments
+        ----------
+        hyps_a : dict
+            Packed hypotheses, batch_size * beam_size of them.
+        hyps_b : dict
+            Packed hypotheses, batch_size * beam_size of them.
+
+        Returns
+        -------
+        dict
+            The best batch_size * beam_size hypotheses.
+        """
+        n_hyps = hyps_a["logp_score"].size(0)
+        batch_size = n_hyps // self.beam_size
+        # Add norm score
+        scores = torch.cat(
+            [
+                (hyps_a["logp_score"] / hyps_a["length"]).view(batch_size, -1),
+                (hyps_b["logp_score"] / hyps_b["length"]).view(batch_size, -1),
+            ],
+            dim=1,
+        )
+        _, index = scores.topk(self.beam_size, dim=-1)
+        # Index in the concatenation of hyps_a and hyps_b
+        offset = torch.arange(batch_size, device=scores.device).unsqueeze(1)
+        offset = offset * self.beam_size
+        index = torch.where(
+            index < self.beam_size,
+            offset + index,
+            n_hyps + offset + index - self.beam_size,
+        ).view(-1)
+
+        width = max(hyps_a["prediction"].size(1), hyps_b["prediction"].size(1))
+        merged = {}
+        for key in hyps_a:
+            if key == "prediction":
+                merged[key] = torch.cat(
+                    [
+                        self._pad_tokens(hyps_a[key], width),
+                        self._pad_tokens(hyps_b[key], width),
+                    ]
+                )
+            elif key in ["hidden_dec", "hidden_lm"]:
+                merged[key] = self._cat_hidden(hyps_a[key], hyps_b[key])
+            else:
+                merged[key] = torch.cat([hyps_a[key], hyps_b[key]])
+        return self._select_hyps(merged, index)
+
+    def _select_hyps(self, hyps, index):
+        """Selects packed hypotheses.
+
+        Arguments
+        ----------
+        hyps : dict
+            Packed hypotheses: "prediction" [N, max_len] (starting with
+            blank, padded with blank), "length" [N], "logp_score" [N],
+            "out_PN" [N, 1, hiddens], and the "hidden_dec" and "hidden_lm"
+            hiddens of the PN and LM (or None).
+        index : torch.tensor
+            Indexes of the hypotheses to select.
+
+        Returns
+        -------
+        dict
+            The selected hypotheses.
+        """
+        return {
+            key: self._select_hidden(value, index)
+            if key in ["hidden_dec", "hidden_lm"]
+            else value[index]
+            for key, value in hyps.items()
+        }
+
+    def _select_hidden(self, hidden, index):
+        """Selects hypotheses in recurrent hiddens [layers, N, hiddens]
+        (None, tensor, or tuple of tensors for LSTM)."""
+        if hidden is None:
+            return None
+        if isinstance(hidden, tuple):
+            return tuple(h[:, index] for h in hidden)
+        return hidden[:, index]
+
+    def _cat_hidden(self, hidden_a, hidden_b):
+        """Concatenates the hypotheses of two recurrent hiddens."""
+        if hidden_a is None and hidden_b is None:
+            return None
+        if hidden_a is None or hidden_b is None:
+            raise ValueError("Cannot concatenate hiddens with missing ones")
+        if isinstance(hidden_a, tuple):
+            return tuple(
+                torch.cat([h_a, h_b], dim=1)
+                for h_a, h_b in zip(hidden_a, hidden_b)
+            )
+        return torch.cat([hidden_a, hidden_b], dim=1)
+
+    def _pad_tokens(self, prediction, width):
+        """Pads packed predictions with blanks, up to the given width."""
+        if prediction.size(1) >= width:
+            return prediction
+        return torch.nn.functional.pad(
+            prediction, (0, width - prediction.size(1)), value=self.blank_id
+        )
+
+    def _append_tokens(self, prediction, length, tokens):
+        """Appends a token to each packed prediction."""
+        prediction = self._pad_tokens(prediction, int(length.max()) + 1)
+        rows = torch.arange(prediction.size(0), device=prediction.device)
+        prediction[rows, length] = tokens
+        return prediction
+
+    def _last_tokens(self, hyps):
+        """Last token of each packed prediction, shape [N, 1]."""
+        return hyps["prediction"].gather(1, hyps["length"].unsqueeze(1) - 1)
+
     def _joint_forward_step(self, h_i, out_PN):
         """Join predictions (TN & PN)."""
 
@@ -526,3 +934,92 @@ class TransducerBeamSearcher(torch.nn.Module):
         for layer in classifier_network:
             out = layer(out)
         return out
+
+
+class TransducerStreamingDecoder:
+    """Decodes the transcription network outputs of a stream chunk by chunk.
+
+    The search (beam, hiddens of the PN and memory of the LM) is carried
+    from one chunk to the next, so that decoding the chunks of an utterance
+    gives the same hypotheses as decoding the whole utterance at once with
+    the searcher.
+
+    Arguments
+    ---------
+    searcher : TransducerBeamSearcher
+        The (greedy or beam) searcher to decode with.
+
+    Example
+    -------
+    >>> from speechbrain.nnet.transducer.transducer_joint import Transducer_joint
+    >>> import speechbrain as sb
+    >>> emb = sb.nnet.embedding.Embedding(
+    ...     num_embeddings=35,
+    ...     embedding_dim=3,
+    ...     consider_as_one_hot=True,
+    ...     blank_id=0
+    ... )
+    >>> dec = sb.nnet.RNN.GRU(
+    ...     hidden_size=10, input_shape=(1, 40, 34), bidirectional=False
+    ... )
+    >>> lin = sb.nnet.linear.Linear(input_shape=(1, 40, 10), n_neurons=35)
+    >>> joint_network= sb.nnet.linear.Linear(input_shape=(1, 1, 40, 35), n_neurons=35)
+    >>> tjoint = Transducer_joint(joint_network, joint="sum")
+    >>> searcher = TransducerBeamSearcher(
+    ...     decode_network_lst=[emb, dec],
+    ...     tjoint=tjoint,
+    ...     classifier_network=[lin],
+    ...     blank_id=0,
+    ...     beam_size=2,
+    ...     nbest=1,
+    ... )
+    >>> decoder = TransducerStreamingDecoder(searcher)
+    >>> enc = torch.rand([1, 20, 10])
+    >>> for chunk in enc.split(8, dim=1):
+    ...     partial_hyps, stable_hyps = decoder.accept_chunk(chunk)
+    >>> hyps, scores, _, _ = decoder.finalize()
+    >>> hyps == searcher(enc)[0]
+    True
+    """
+
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self.state = None
+
+    def reset(self):
+        """Forgets the current stream, to start decoding a new one."""
+        self.state = None
+
+    def accept_chunk(self, tn_output):
+        """Decodes the next chunk of the stream.
+
+        Arguments
+        ---------
+        tn_output : torch.tensor
+            Output from transcription network for the chunk, with shape
+            [batch, chunk_len, hiddens]. The batch size must not change
+            within a stream.
+
+        Returns
+        -------
+        partial_hyps : list
+            Current best hypothesis (list of tokens) of each utterance.
+        stable_hyps : list
+            Prefix of each partial hypothesis which later chunks cannot
+            change anymore.
+        """
+        if self.state is None:
+            self.state = self.searcher.init_search_state(
+                tn_output.size(0), tn_output.device
+            )
+        self.searcher.search_step(self.state, tn_output)
+        return self.searcher.partial_hypotheses(self.state)
+
+    def finalize(self):
+        """Returns the hypotheses of the whole stream, as the searcher does
+        for a whole utterance, and resets the decoder."""
+        if self.state is None:
+            raise ValueError("No chunk was decoded since the last reset.")
+        hyps = self.searcher.search_result(self.state)
+        self.reset()
+        return hyps
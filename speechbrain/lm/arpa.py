@@ -59,8 +59,13 @@ Example
 Authors
  * Aku Rouhe 2020
 """
+import os
+import gzip
+import json
 import collections
 import logging
+import numpy as np
+import tqdm
 
 logger = logging.getLogger(__name__)
 
@@ -227,3 +232,250 @@ def _parse_order(line):
 
 def _ends_arpa(line):
     return line == "\\end\\"
+
+
+def arpa_to_compiled_lm(
+    arpa_path,
+    output_dir,
+    max_order=None,
+    prune_threshold=None,
+    chunk_size=1000000,
+    progress=True,
+):
+    r"""
+    Converts an ARPA file to a `speechbrain.lm.ngram.CompiledNgramLM`, in a
+    streaming fashion
+
+    The N-grams are read and converted chunk by chunk, and written to disk
+    as they come, so the peak memory is about the size of the binary arrays
+    of one order, instead of several times the size of the ARPA file. Load
+    the result with ``CompiledNgramLM.load(output_dir)``.
+
+    Pruning happens while reading: the orders above max_order are not read
+    at all, and the N-grams (above unigrams) with a log probability below
+    prune_threshold are dropped, as well as the N-grams whose context was
+    dropped. The result is the same as a `BackoffNgramLM` of the kept
+    N-grams.
+
+    Arguments
+    ---------
+    arpa_path : str
+        The ARPA file, gzip compressed if its name ends with ".gz".
+    output_dir : str
+        The directory to save the compiled model in.
+    max_order : int
+        The highest order to keep. None keeps all the orders.
+    prune_threshold : float
+        The log (base 10) probability under which N-grams are dropped.
+    chunk_size : int
+        The number of N-gram lines converted at once.
+    progress : bool
+        Whether to show a progress bar of the lines read.
+
+    Returns
+    -------
+    dict
+        Maps N-gram orders to the number of N-grams kept.
+
+    Raises
+    ------
+    ValueError
+        If no LM is found or the file is badly formatted.
+
+    Example
+    -------
+    >>> from speechbrain.lm.ngram import CompiledNgramLM
+    >>> tmpdir = getfixture("tmpdir")
+    >>> with open(tmpdir / "lm.arpa", "w") as f:
+    ...     print("\\data\\", file=f)
+    ...     print("ngram 1=2", file=f)
+    ...     print("ngram 2=3", file=f)
+    ...     print("", file=f)
+    ...     print("\\1-grams:", file=f)
+    ...     print("-0.6931 a", file=f)
+    ...     print("-0.6931 b 0.", file=f)
+    ...     print("", file=f)
+    ...     print("\\2-grams:", file=f)
+    ...     print("-0.6931 a a", file=f)
+    ...     print("-0.6931 a b", file=f)
+    ...     print("-0.6931 b a", file=f)
+    ...     print("", file=f)
+    ...     print("\\end\\", file=f)
+    >>> arpa_to_compiled_lm(tmpdir / "lm.arpa", tmpdir / "lm", progress=False)
+    {1: 2, 2: 3}
+    >>> lm = CompiledNgramLM.load(tmpdir / "lm")
+    >>> round(lm.logprob("b", context=("b",)), 4)
+    -0.6931
+    """
+    from speechbrain.dataio.columnar import StringColumn
+    from speechbrain.lm.ngram import CompiledNgramLM
+
+    arpa_path = str(arpa_path)
+    output_dir = str(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    if arpa_path.endswith(".gz"):
+        fstream = gzip.open(arpa_path, "rt", encoding="utf-8")
+    else:
+        fstream = open(arpa_path, encoding="utf-8")
+    with fstream, tqdm.tqdm(
+        total=None, unit=" ngrams", disable=not progress
+    ) as pbar:
+        _find_data_section(fstream)
+        num_ngrams = {}
+        line = ""
+        for line in fstream:
+            line = line.strip()
+            if line[:5] == "ngram":
+                lhs, rhs = line.split("=")
+                num_ngrams[int(lhs.split()[1])] = int(rhs)
+            elif line:
+                break
+        top_order = max(num_ngrams) if max_order is None else max_order
+        top_order = min(top_order, max(num_ngrams))
+        pbar.total = sum(num_ngrams[n] for n in range(1, top_order + 1))
+
+        vocab = []
+        num_kept = {}
+        lm = CompiledNgramLM(vocab, [], [], [])
+        order = _parse_order(line) if _starts_ngrams_section(line) else None
+        if order is None:
+            _, order = _next_section_or_end(fstream)
+        while order is not None and order <= top_order:
+            writer = _OrderWriter(output_dir, order, order < top_order)
+            for chunk, line in _read_chunks(fstream, chunk_size):
+                pbar.update(len(chunk))
+                writer.add(*_parse_chunk(chunk, order, lm, vocab))
+            if order == 1:
+                lm.vocab_size = len(vocab)
+            keys, probs, backoffs = writer.finish(prune_threshold, order > 1)
+            num_kept[order] = len(keys)
+            lm.keys.append(keys)
+            lm.probs.append(probs)
+            if backoffs is not None:
+                lm.backoffs.append(backoffs)
+            if _ends_arpa(line):
+                order = None
+            elif _starts_ngrams_section(line):
+                order = _parse_order(line)
+            else:
+                _, order = _next_section_or_end(fstream)
+    if set(range(1, top_order + 1)) - set(num_kept):
+        raise ValueError("Not a properly formatted ARPA file")
+    words = StringColumn.from_strings(vocab)
+    np.save(os.path.join(output_dir, "vocab.data.npy"), words.data)
+    np.save(os.path.join(output_dir, "vocab.offsets.npy"), words.offsets)
+    with open(os.path.join(output_dir, "ngram_lm.json"), "w") as fo:
+        json.dump({"top_order": top_order, "quantized": False}, fo)
+    return num_kept
+
+
+def _read_chunks(fstream, chunk_size):
+    """Yields the lists of (at most chunk_size) lines of an N-grams section,
+    and the line ending the section (the last time)."""
+    chunk = []
+    for line in fstream:
+        line = line.strip()
+        if not line or line[0] == "\\":
+            break
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk, line
+            chunk = []
+    else:
+        line = ""
+    yield chunk, line
+
+
+def _parse_chunk(lines, order, lm, vocab):
+    """Parses N-gram lines of the given order to the keys of the N-grams in
+    lm (the lower orders, -1 if their context is absent) and their values.
+    The unigrams are added to the vocab."""
+    probs = np.empty(len(lines), dtype=np.float32)
+    backoffs = np.zeros(len(lines), dtype=np.float32)
+    words = []
+    for i, line in enumerate(lines):
+        parts = line.split()
+        if len(parts) not in (order + 1, order + 2):
+            raise ValueError("Not a properly formatted ARPA file")
+        probs[i] = float(parts[0])
+        if len(parts) == order + 2:
+            backoffs[i] = float(parts[-1])
+        words.append(parts[1 : order + 1])
+    if order == 1:
+        first_id = len(vocab)
+        vocab.extend(ngram[0] for ngram in words)
+        keys = np.arange(first_id, len(vocab), dtype=np.int64)
+        return keys, probs, backoffs
+    ids = lm.word_ids([word for ngram in words for word in ngram])
+    ids = ids.reshape(len(lines), order)
+    contexts = lm.ngram_positions(ids[:, :-1])
+    keys = np.where(
+        (contexts >= 0) & (ids[:, -1] >= 0),
+        contexts * lm.vocab_size + ids[:, -1],
+        -1,
+    )
+    return keys, probs, backoffs
+
+
+class _OrderWriter:
+    """Accumulates the N-grams of an order on disk, then sorts them into the
+    arrays of `CompiledNgramLM.save`."""
+
+    def __init__(self, output_dir, order, has_backoffs):
+        self.output_dir = output_dir
+        self.order = order
+        self.has_backoffs = has_backoffs
+        self.tmp_path = os.path.join(output_dir, f"tmp.{order}")
+        self.tmp_file = open(self.tmp_path, "wb")
+        self.count = 0
+
+    def add(self, keys, probs, backoffs):
+        """Appends N-grams, as records of key, log prob and backoff."""
+        records = np.empty(len(keys), dtype=_RECORD)
+        records["key"] = keys
+        records["prob"] = probs
+        records["backoff"] = backoffs
+        self.tmp_file.write(records.tobytes())
+        self.count += len(keys)
+
+    def finish(self, prune_threshold=None, prune=True):
+        """Sorts the N-grams, drops the pruned ones, and saves the arrays.
+
+        Returns the arrays, memory-mapped (backoffs is None for the top
+        order).
+        """
+        self.tmp_file.close()
+        records = np.memmap(
+            self.tmp_path, dtype=_RECORD, mode="r", shape=(self.count,)
+        )
+        keep = records["key"] >= 0
+        if prune and prune_threshold is not None:
+            keep &= records["prob"] >= prune_threshold
+        kept = np.flatnonzero(keep)
+        order_index = kept[np.argsort(records["key"][kept], kind="stable")]
+        del kept, keep
+        names = ["key", "prob"] + (["backoff"] if self.has_backoffs else [])
+        arrays = {}
+        for name in names:
+            file_name = {"key": "keys", "prob": "probs", "backoff": "backoffs"}
+            path = os.path.join(
+                self.output_dir, f"{file_name[name]}.{self.order}.npy"
+            )
+            array = np.lib.format.open_memmap(
+                path,
+                mode="w+",
+                dtype=records.dtype[name],
+                shape=(len(order_index),),
+            )
+            array[:] = records[name][order_index]
+            array.flush()
+            del array
+            arrays[name] = np.load(path, mmap_mode="r")
+        del records
+        os.remove(self.tmp_path)
+        return arrays["key"], arrays["prob"], arrays.get("backoff")
+
+
+_RECORD = np.dtype(
+    [("key", np.int64), ("prob", np.float32), ("backoff", np.float32)]
+)
@@ -4,9 +4,13 @@ N-gram language model query interface
 Authors
  * Aku Rouhe 2020
 """
+import os
+import json
 import collections
+import numpy as np
 
 NEGINFINITY = float("-inf")
+NAN = float("nan")
 
 
 class BackoffNgramLM:
@@ -105,6 +109,377 @@ class BackoffNgramLM:
         return lp + backoff_log_weight
 
 
+class CompiledNgramLM:
+    """
+    Compact, array-backed backoff N-gram language model
+
+    Gives the same log probabilities as `BackoffNgramLM` (as float32), from
+    sorted NumPy arrays instead of nested dicts, so that it needs a fraction
+    of the memory, can be saved and memory-mapped (see `save` and `load`),
+    and can score many queries at once (see `batch_logprob`).
+
+    The words are mapped to integer ids by their position in the vocab. The
+    N-grams of each order n are identified by a key: the position of their
+    first n-1 words in the table of order n-1, times the vocab size, plus
+    the id of their last word. Each order stores the sorted keys, and in the
+    same order the log probabilities (NaN for N-grams that are only
+    contexts) and the backoff log weights.
+
+    With quantization_bits, the log probabilities and backoff weights are
+    stored as 8 or 16 bit codes into per-order codebooks, which makes them
+    approximate.
+
+    Arguments
+    ---------
+    vocab : list, speechbrain.dataio.columnar.StringColumn
+        The words, by id.
+    keys : list
+        For each order, the sorted keys of the N-grams, as int64 arrays.
+    probs : list
+        For each order, the log probabilities of the N-grams (or their
+        codes, with codebooks).
+    backoffs : list
+        For each order but the top one, the backoff log weights of the
+        N-grams (or their codes, with codebooks).
+    codebooks : dict
+        None, or the float32 "probs" and "backoffs" codebooks of each order,
+        if the values are quantized.
+
+    Example
+    -------
+    >>> import math
+    >>> ngrams = {1: {tuple(): {'a': -0.6931, 'b': -0.6931}},
+    ...           2: {('a',): {'a': -0.6931, 'b': -0.6931},
+    ...               ('b',): {'a': -0.6931}}}
+    >>> backoffs = {1: {('b',): 0.}}
+    >>> lm = CompiledNgramLM.from_ngrams(ngrams, backoffs)
+    >>> round(math.exp(lm.logprob('b', ('b',))), 1)
+    0.5
+    >>> logprobs = lm.batch_logprob(['a', 'b', 'c'], [('b',), ('a',), ()])
+    >>> [round(logprob, 4) for logprob in logprobs.tolist()]
+    [-0.6931, -0.6931, -inf]
+    """
+
+    def __init__(self, vocab, keys, probs, backoffs, codebooks=None):
+        self.vocab = vocab
+        self.vocab_size = len(vocab)
+        self.keys = keys
+        self.probs = probs
+        self.backoffs = backoffs
+        self.codebooks = codebooks
+        self.top_order = len(keys)
+        self._word_ids = None
+
+    @classmethod
+    def from_ngrams(cls, ngrams, backoffs, quantization_bits=None):
+        """Compiles N-grams in the format of `BackoffNgramLM`.
+
+        Arguments
+        ---------
+        ngrams : dict
+            The N-gram log probabilities, see `BackoffNgramLM`.
+        backoffs : dict
+            The backoff log weights, see `BackoffNgramLM`.
+        quantization_bits : int
+            None to store float32 values, or 8 or 16 to quantize them.
+
+        Returns
+        -------
+        CompiledNgramLM
+        """
+        top_order = len(ngrams)
+        if not (len(backoffs) == top_order or len(backoffs) == top_order - 1):
+            raise ValueError("Backoffs dict needs to be of order N or N-1")
+        # All the N-grams of each order, with their log prob and backoff.
+        # Their contexts (and the prefixes of those) are N-grams too.
+        entries = {order: {} for order in range(1, top_order + 1)}
+        for order in range(top_order, 0, -1):
+            for context, probs in ngrams[order].items():
+                for token, prob in probs.items():
+                    entries[order].setdefault(context + (token,), [NAN, 0.0])
+                    entries[order][context + (token,)][0] = prob
+            if order < top_order:
+                for ngram, backoff in backoffs.get(order, {}).items():
+                    entries[order].setdefault(ngram, [NAN, 0.0])[1] = backoff
+            if order > 1:
+                for ngram in entries[order]:
+                    entries[order - 1].setdefault(ngram[:-1], [NAN, 0.0])
+        vocab = list(dict.fromkeys(ngram[0] for ngram in entries[1]))
+        word_ids = {word: i for i, word in enumerate(vocab)}
+        keys, probs, backoff_values = [], [], []
+        index = {tuple(): 0}
+        for order in range(1, top_order + 1):
+            ngram_keys = np.fromiter(
+                (
+                    index[ngram[:-1]] * len(vocab) + word_ids[ngram[-1]]
+                    for ngram in entries[order]
+                ),
+                dtype=np.int64,
+                count=len(entries[order]),
+            )
+            values = np.array(list(entries[order].values()), dtype=np.float32)
+            order_index = np.argsort(ngram_keys, kind="stable")
+            keys.append(ngram_keys[order_index])
+            probs.append(values[order_index, 0])
+            if order < top_order:
+                backoff_values.append(values[order_index, 1])
+                positions = np.empty_like(order_index)
+                positions[order_index] = np.arange(len(order_index))
+                index = dict(zip(entries[order], positions.tolist()))
+        lm = cls(vocab, keys, probs, backoff_values)
+        if quantization_bits is not None:
+            lm = lm.quantize(quantization_bits)
+        return lm
+
+    @classmethod
+    def from_backoff_lm(cls, lm, quantization_bits=None):
+        """Compiles a `BackoffNgramLM`, see `from_ngrams`."""
+        return cls.from_ngrams(lm.ngrams, lm.backoffs, quantization_bits)
+
+    def quantize(self, bits):
+        """Returns a copy with the values quantized on 8 or 16 bits.
+
+        Each order gets codebooks of 2 ** bits - 1 values (the last code
+        means NaN), at the quantiles of its log probs and backoff weights.
+        """
+        if bits not in (8, 16):
+            raise ValueError("Only 8 and 16 bit quantization is supported")
+        if self.codebooks is not None:
+            raise ValueError("The values are already quantized")
+        dtype = np.uint8 if bits == 8 else np.uint16
+        codebooks = {"probs": [], "backoffs": []}
+        quantized = {"probs": [], "backoffs": []}
+        for name in ["probs", "backoffs"]:
+            for values in getattr(self, name):
+                codebook, codes = _quantize(values, 2 ** bits - 1, dtype)
+                codebooks[name].append(codebook)
+                quantized[name].append(codes)
+        return CompiledNgramLM(
+            self.vocab,
+            self.keys,
+            quantized["probs"],
+            quantized["backoffs"],
+            codebooks,
+        )
+
+    def word_ids(self, words):
+        """Maps words to their ids, -1 for out-of-vocabulary words."""
+        if self._word_ids is None:
+            self._word_ids = {word: i for i, word in enumerate(self.vocab)}
+        return np.fromiter(
+            (self._word_ids.get(word, -1) for word in words),
+            dtype=np.int64,
+            count=len(words),
+        )
+
+    def logprob(self, token, context=tuple()):
+        """Log probability of the token given the context (tuple of words),
+        same as `BackoffNgramLM.logprob`."""
+        return self.batch_logprob([token], [context]).item()
+
+    def batch_logprob(self, tokens, contexts):
+        """Log probabilities of many tokens given their contexts at once.
+
+        Arguments
+        ---------
+        tokens : list, numpy.ndarray
+            The words, or their ids (int array of shape [batch]).
+        contexts : list, numpy.ndarray
+            The contexts: tuples of words, or their ids (int array of shape
+            [batch, context_len], left-padded with -1).
+
+        Returns
+        -------
+        numpy.ndarray
+            The log probabilities, as float32, shape [batch].
+        """
+        if not isinstance(tokens, np.ndarray):
+            tokens = self.word_ids(tokens)
+        if not isinstance(contexts, np.ndarray):
+            contexts = self._context_ids(contexts)
+        # If a longer context is given than we can ever use,
+        # just use less context.
+        max_context = self.top_order - 1
+        contexts = contexts[:, contexts.shape[1] - max_context :]
+        if contexts.shape[1] < max_context:
+            contexts = np.pad(
+                contexts,
+                ((0, 0), (max_context - contexts.shape[1], 0)),
+                constant_values=-1,
+            )
+        # Position of the context suffixes of each length in their tables
+        context_positions = [np.zeros(len(tokens), dtype=np.int64)] + [
+            self.ngram_positions(contexts[:, max_context - length :])
+            for length in range(1, max_context + 1)
+        ]
+        # Back off from the longest context until a prob is found
+        logprobs = np.full(len(tokens), NEGINFINITY, dtype=np.float32)
+        backoff_sums = np.zeros(len(tokens), dtype=np.float32)
+        todo = np.ones(len(tokens), dtype=bool)
+        for length in range(max_context, -1, -1):
+            context_found = context_positions[length] >= 0
+            positions = self._find(
+                length + 1, context_positions[length], tokens
+            )
+            probs = self._values("probs", length + 1, positions)
+            found = todo & ~np.isnan(probs)
+            logprobs[found] = backoff_sums[found] + probs[found]
+            todo &= ~found
+            if length > 0:
+                backoffs = self._values(
+                    "backoffs", length, context_positions[length]
+                )
+                backoff_sums += np.where(todo & context_found, backoffs, 0.0)
+        return logprobs
+
+    def ngram_positions(self, ngrams):
+        """Positions of N-grams in the table of their order.
+
+        Arguments
+        ---------
+        ngrams : numpy.ndarray
+            The word ids of the N-grams, int array of shape [batch, N].
+
+        Returns
+        -------
+        numpy.ndarray
+            The position of each N-gram, -1 for the absent ones.
+        """
+        positions = np.zeros(len(ngrams), dtype=np.int64)
+        for i in range(ngrams.shape[1]):
+            positions = self._find(i + 1, positions, ngrams[:, i])
+        return positions
+
+    def _context_ids(self, contexts):
+        """Word ids of contexts, left-padded with -1."""
+        width = max([len(context) for context in contexts] + [0])
+        ids = np.full((len(contexts), width), -1, dtype=np.int64)
+        for i, context in enumerate(contexts):
+            if context:
+                ids[i, width - len(context) :] = self.word_ids(context)
+        return ids
+
+    def _find(self, order, context_positions, words):
+        """Positions of N-grams in the table of their order, -1 if absent."""
+        keys = self.keys[order - 1]
+        if len(keys) == 0:  # E.g. all pruned
+            return np.full(len(words), -1, dtype=np.int64)
+        valid = (context_positions >= 0) & (words >= 0)
+        query = np.where(valid, context_positions * self.vocab_size + words, -1)
+        positions = np.searchsorted(keys, query)
+        positions = np.minimum(positions, len(keys) - 1)
+        found = valid & (keys[positions] == query)
+        return np.where(found, positions, -1)
+
+    def _values(self, name, order, positions):
+        """Log probs or backoffs at the positions, NaN where absent."""
+        values = getattr(self, name)[order - 1]
+        if len(values) == 0:
+            return np.full(len(positions), NAN, dtype=np.float32)
+        selected = values[np.maximum(positions, 0)]
+        if self.codebooks is not None:
+            selected = self.codebooks[name][order - 1][selected]
+        return np.where(positions >= 0, selected, NAN).astype(np.float32)
+
+    def save(self, path):
+        """Saves the model in a directory, see `CompiledNgramLM.load`."""
+        from speechbrain.dataio.columnar import StringColumn
+
+        os.makedirs(path, exist_ok=True)
+        vocab = self.vocab
+        if not isinstance(vocab, StringColumn):
+            vocab = StringColumn.from_strings(vocab)
+        arrays = {"vocab.data": vocab.data, "vocab.offsets": vocab.offsets}
+        for order in range(1, self.top_order + 1):
+            arrays[f"keys.{order}"] = self.keys[order - 1]
+            arrays[f"probs.{order}"] = self.probs[order - 1]
+            if order < self.top_order:
+                arrays[f"backoffs.{order}"] = self.backoffs[order - 1]
+            if self.codebooks is not None:
+                for name in ["probs", "backoffs"]:
+                    if order - 1 < len(self.codebooks[name]):
+                        arrays[f"{name}_codebook.{order}"] = self.codebooks[
+                            name
+                        ][order - 1]
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, "ngram_lm.json"), "w") as fo:
+            json.dump(
+                {
+                    "top_order": self.top_order,
+                    "quantized": self.codebooks is not None,
+                },
+                fo,
+            )
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a model saved with `CompiledNgramLM.save`.
+
+        Arguments
+        ---------
+        path : str
+            The directory the model was saved in.
+        mmap : bool
+            If True, the arrays are read-only memory maps of the files, so
+            that loading is immediate and all the processes that load the
+            same model share its memory.
+
+        Returns
+        -------
+        CompiledNgramLM
+        """
+        from speechbrain.dataio.columnar import StringColumn
+
+        path = str(path)
+
+        def array(name):
+            return np.load(
+                os.path.join(path, name + ".npy"),
+                mmap_mode="r" if mmap else None,
+            )
+
+        with open(os.path.join(path, "ngram_lm.json")) as fi:
+            meta = json.load(fi)
+        top_order = meta["top_order"]
+        orders = range(1, top_order + 1)
+        codebooks = None
+        if meta["quantized"]:
+            codebooks = {
+                "probs": [array(f"probs_codebook.{n}") for n in orders],
+                "backoffs": [
+                    array(f"backoffs_codebook.{n}") for n in orders[:-1]
+                ],
+            }
+        return cls(
+            StringColumn(array("vocab.data"), array("vocab.offsets")),
+            [array(f"keys.{n}") for n in orders],
+            [array(f"probs.{n}") for n in orders],
+            [array(f"backoffs.{n}") for n in orders[:-1]],
+            codebooks,
+        )
+
+
+def _quantize(values, num_codes, dtype):
+    """Quantizes values to codes into a codebook at their quantiles. The
+    code num_codes is for NaN."""
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0:
+        codebook = np.zeros(1, dtype=np.float32)
+    else:
+        codebook = np.unique(
+            np.quantile(finite, np.linspace(0.0, 1.0, num_codes))
+        ).astype(np.float32)
+    # Nearest codebook value, by the midpoints between them
+    midpoints = (codebook[1:] + codebook[:-1]) / 2
+    codes = np.searchsorted(midpoints, values).astype(dtype)
+    codes[np.isnan(values)] = num_codes
+    codebook = np.concatenate(
+        [codebook, np.full(num_codes + 1 - len(codebook), NAN, np.float32)]
+    )
+    return codebook, codes
+
+
 def ngram_evaluation_details(data, LM):
     """
     Evaluates the N-gram LM on each sentence in data
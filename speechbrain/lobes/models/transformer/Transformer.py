@@ -333,6 +333,53 @@ class TransformerEncoderLayer(nn.Module):
             pos_embs=pos_embs,
         )
 
+        return self._forward_ffn(src, output), self_attn
+
+    def forward_step(
+        self,
+        src,
+        cache: Optional[torch.Tensor] = None,
+        src_key_padding_mask: Optional[torch.Tensor] = None,
+    ):
+        """Incremental forward of the last position of a causal sequence.
+
+        The self-attention keys and values of the previous positions are
+        cached (see MultiheadAttention.forward_step), so that only the new
+        position goes through the layer. Requires regularMHA attention.
+
+        Arguments
+        ----------
+        src : torch.Tensor
+            (batch, 1, d_model) The new position of the sequence.
+        cache : torch.Tensor, optional
+            The self-attention keys and values of the previous positions, as
+            returned by the previous step.
+        src_key_padding_mask : torch.Tensor, optional
+            (batch, time) The mask for the src keys, new position included.
+
+        Returns
+        -------
+        output : torch.Tensor
+            (batch, 1, d_model) The output for the new position.
+        self_attn : torch.Tensor
+            (batch, 1, time) The self-attention weights.
+        cache : torch.Tensor
+            The updated cache.
+        """
+        if self.normalize_before:
+            src1 = self.norm1(src)
+        else:
+            src1 = src
+
+        output, self_attn, cache = self.self_att.forward_step(
+            src1, cache, key_padding_mask=src_key_padding_mask,
+        )
+
+        return self._forward_ffn(src, output), self_attn, cache
+
+    def _forward_ffn(self, src, output):
+        """Adds the self-attention output to the input and applies the
+        feed-forward part of the layer."""
         # add & norm
         src = src + self.dropout1(output)
         if not self.normalize_before:
@@ -349,7 +396,7 @@ class TransformerEncoderLayer(nn.Module):
         if not self.normalize_before:
             output = self.norm2(output)
 
-        return output, self_attn
+        return output
 
 
 class TransformerEncoder(nn.Module):
@@ -452,6 +499,55 @@ class TransformerEncoder(nn.Module):
 
         return output, attention_lst
 
+    def forward_step(
+        self,
+        src,
+        cache: Optional[list] = None,
+        src_key_padding_mask: Optional[torch.Tensor] = None,
+    ):
+        """Incremental forward of the last position of a causal sequence,
+        see TransformerEncoderLayer.forward_step().
+
+        Arguments
+        ----------
+        src : tensor
+            (batch, 1, d_model) The new position of the sequence.
+        cache : list, optional
+            The caches of the layers returned by the previous step.
+        src_key_padding_mask : tensor, optional
+            (batch, time) The mask for the src keys, new position included.
+
+        Example
+        -------
+        >>> import torch
+        >>> from speechbrain.lobes.models.transformer.Transformer import (
+        ...     get_lookahead_mask
+        ... )
+        >>> x = torch.rand((4, 6, 16))
+        >>> net = TransformerEncoder(2, 4, 32, d_model=16).eval()
+        >>> output, _ = net(x, src_mask=get_lookahead_mask(x))
+        >>> cache = None
+        >>> for t in range(x.size(1)):
+        ...     output_t, _, cache = net.forward_step(x[:, t : t + 1], cache)
+        >>> torch.allclose(output_t[:, 0], output[:, -1], atol=1e-5)
+        True
+        """
+        if cache is None:
+            cache = [None] * len(self.layers)
+        output = src
+        attention_lst, new_cache = [], []
+        for enc_layer, layer_cache in zip(self.layers, cache):
+            output, attention, layer_cache = enc_layer.forward_step(
+                output,
+                cache=layer_cache,
+                src_key_padding_mask=src_key_padding_mask,
+            )
+            attention_lst.append(attention)
+            new_cache.append(layer_cache)
+        output = self.norm(output)
+
+        return output, attention_lst, new_cache
+
 
 class TransformerDecoderLayer(nn.Module):
     """This class implements the self-attention decoder layer.
@@ -580,6 +676,88 @@ class TransformerDecoderLayer(nn.Module):
             pos_embs=pos_embs_tgt,
         )
 
+        tgt, multihead_attention = self._forward_cross_attn_ffn(
+            tgt,
+            tgt2,
+            memory,
+            memory_mask=memory_mask,
+            memory_key_padding_mask=memory_key_padding_mask,
+            pos_embs_src=pos_embs_src,
+        )
+
+        return tgt, self_attn, multihead_attention
+
+    def forward_step(
+        self,
+        tgt,
+        memory,
+        cache=None,
+        memory_mask=None,
+        memory_key_padding_mask=None,
+        pos_embs_src=None,
+    ):
+        """Incremental forward of the last position of the target sequence.
+
+        The self-attention keys and values of the previous positions are
+        cached (see MultiheadAttention.forward_step), so that only the new
+        position goes through the layer. Requires regularMHA attention.
+
+        Arguments
+        ----------
+        tgt: tensor
+            (batch, 1, d_model) The new position of the target sequence.
+        memory: tensor
+            The sequence from the last layer of the encoder (required).
+        cache: tensor
+            The self-attention keys and values of the previous positions, as
+            returned by the previous step (optional).
+        memory_mask: tensor
+            The mask for the memory sequence (optional).
+        memory_key_padding_mask: tensor
+            The mask for the memory keys per batch (optional).
+
+        Returns
+        -------
+        output : tensor
+            (batch, 1, d_model) The output for the new position.
+        self_attn : tensor
+            (batch, 1, time) The self-attention weights.
+        multihead_attention : tensor
+            (batch, 1, memory time) The attention weights over the memory.
+        cache : tensor
+            The updated cache.
+        """
+        if self.normalize_before:
+            tgt1 = self.norm1(tgt)
+        else:
+            tgt1 = tgt
+
+        # self-attention of the new position over the target sequence
+        tgt2, self_attn, cache = self.self_attn.forward_step(tgt1, cache)
+
+        tgt, multihead_attention = self._forward_cross_attn_ffn(
+            tgt,
+            tgt2,
+            memory,
+            memory_mask=memory_mask,
+            memory_key_padding_mask=memory_key_padding_mask,
+            pos_embs_src=pos_embs_src,
+        )
+
+        return tgt, self_attn, multihead_attention, cache
+
+    def _forward_cross_attn_ffn(
+        self,
+        tgt,
+        tgt2,
+        memory,
+        memory_mask=None,
+        memory_key_padding_mask=None,
+        pos_embs_src=None,
+    ):
+        """Adds the self-attention output tgt2 to the input tgt and applies
+        the attention over the memory and the feed-forward part of the
+        layer."""
         # add & norm
         tgt = tgt + self.dropout1(tgt2)
         if not self.normalize_before:
@@ -618,7 +796,7 @@ class TransformerDecoderLayer(nn.Module):
         if not self.normalize_before:
             tgt = self.norm3(tgt)
 
-        return tgt, self_attn, multihead_attention
+        return tgt, multihead_attention
 
 
 class TransformerDecoder(nn.Module):
@@ -729,6 +907,70 @@ class TransformerDecoder(nn.Module):
 
         return output, self_attns, multihead_attns
 
+    def forward_step(
+        self,
+        tgt,
+        memory,
+        cache=None,
+        memory_mask=None,
+        memory_key_padding_mask=None,
+        pos_embs_src=None,
+    ):
+        """Incremental forward of the last position of the target sequence,
+        see TransformerDecoderLayer.forward_step().
+
+        Arguments
+        ----------
+        tgt : tensor
+            (batch, 1, d_model) The new position of the target sequence.
+        memory : tensor
+            The sequence from the last layer of the encoder (required).
+        cache : list
+            The caches of the layers returned by the previous step (optional).
+        memory_mask : tensor
+            The mask for the memory sequence (optional).
+        memory_key_padding_mask : tensor
+            The mask for the memory keys per batch (optional).
+
+        Example
+        -------
+        >>> src = torch.rand((8, 20, 64))
+        >>> tgt = torch.rand((8, 10, 64))
+        >>> net = TransformerDecoder(2, 4, 128, d_model=64).eval()
+        >>> output, _, _ = net(tgt, src, tgt_mask=get_lookahead_mask(tgt))
+        >>> cache = None
+        >>> for t in range(tgt.size(1)):
+        ...     output_t, _, _, cache = net.forward_step(
+        ...         tgt[:, t : t + 1], src, cache
+        ...     )
+        >>> torch.allclose(output_t[:, 0], output[:, -1], atol=1e-5)
+        True
+        """
+        if cache is None:
+            cache = [None] * len(self.layers)
+        output = tgt
+        self_attns, multihead_attns, new_cache = [], [], []
+        for dec_layer, layer_cache in zip(self.layers, cache):
+            (
+                output,
+                self_attn,
+                multihead_attn,
+                layer_cache,
+            ) = dec_layer.forward_step(
+                output,
+                memory,
+                cache=layer_cache,
+                memory_mask=memory_mask,
+                memory_key_padding_mask=memory_key_padding_mask,
+                pos_embs_src=pos_embs_src,
+            )
+            self_attns.append(self_attn)
+            multihead_attns.append(multihead_attn)
+            new_cache.append(layer_cache)
+        output = self.norm(output)
+
+        return output, self_attns, multihead_attns, new_cache
+
 
 class NormalizedEmbedding(nn.Module):
     """This class implements the normalized embedding layer for the transformer.
@@ -268,6 +268,51 @@ class TransformerASR(TransformerInterface):
         )
         return prediction, multihead_attns[-1]
 
+    @property
+    def supports_decode_step(self):
+        """Whether decode_step() can be used: only with regularMHA
+        attention."""
+        return self.attention_type == "regularMHA"
+
+    def decode_step(self, tgt, encoder_out, cache=None):
+        """This method implements an incremental decoding step: only the
+        last token of tgt is decoded, the self-attention keys and values of
+        the previous tokens being cached. It returns the same prediction as
+        the last position of decode() (see supports_decode_step).
+
+        Arguments
+        ---------
+        tgt : torch.Tensor
+            The sequence to the decoder, of which the last token is decoded.
+        encoder_out : torch.Tensor
+            Hidden output of the encoder.
+        cache : list
+            The cache returned by the decoding step of the previous token
+            (None for the first token).
+
+        Returns
+        -------
+        prediction : torch.Tensor
+            (batch, 1, d_model) The output of the decoder for the last token.
+        attn : torch.Tensor
+            (batch, 1, time) The attention of the last decoder layer over
+            the encoder output.
+        cache : list
+            The updated cache.
+        """
+        if not self.supports_decode_step:
+            raise ValueError(
+                "Incremental decoding requires regularMHA attention."
+            )
+        tgt_step = self.custom_tgt_module(tgt[:, -1:])
+        if self.positional_encoding_type == "fixed_abs_sine":
+            tgt_step = tgt_step + self.positional_encoding(tgt)[:, -1:]
+
+        prediction, _, multihead_attns, cache = self.decoder.forward_step(
+            tgt_step, encoder_out, cache=cache,
+        )
+        return prediction, multihead_attns[-1], cache
+
     def encode(
         self, src, wav_len=None,
     ):
@@ -139,6 +139,59 @@ class TransformerLM(TransformerInterface):
 
         return pred
 
+    @property
+    def supports_forward_step(self):
+        """Whether forward_step() can be used: only causal models with
+        regularMHA encoder layers, and no decoder layers."""
+        return (
+            self.num_decoder_layers == 0
+            and self.causal
+            and self.attention_type == "regularMHA"
+        )
+
+    def forward_step(self, src, cache=None):
+        """Incremental forward of the last token of src: the self-attention
+        keys and values of the previous tokens are cached. It returns the
+        same prediction as the last position of forward(), for the models
+        that support it (see supports_forward_step).
+
+        Arguments
+        ---------
+        src : tensor
+            The sequence to the encoder, of which the last token is processed.
+        cache : list
+            The cache returned by the step of the previous token
+            (None for the first token).
+
+        Example
+        -------
+        >>> src = torch.randint(1, 720, [4, 10])
+        >>> net = TransformerLM(720, 64, 4, 2, 0, 128).eval()
+        >>> pred = net(src)
+        >>> cache = None
+        >>> for t in range(src.size(1)):
+        ...     pred_t, cache = net.forward_step(src[:, : t + 1], cache)
+        >>> torch.allclose(pred_t[:, 0], pred[:, -1], atol=1e-4)
+        True
+        """
+        if not self.supports_forward_step:
+            raise ValueError(
+                "Incremental forward requires a causal encoder-only model "
+                "with regularMHA attention."
+            )
+        _, src_key_padding_mask = self.make_masks(src, look_ahead_mask=False)
+        src_step = self.custom_src_module(src[:, -1:])
+        if self.embedding_proj is not None:
+            src_step = self.embedding_proj(src_step)
+        src_step = src_step + self.positional_encoding(src)[:, -1:]
+        encoder_out, _, cache = self.encoder.forward_step(
+            src_step, cache=cache, src_key_padding_mask=src_key_padding_mask,
+        )
+
+        pred = self.output_proj(encoder_out)
+
+        return pred, cache
+
     def _reset_params(self):
         for p in self.parameters():
             if p.dim() > 1:
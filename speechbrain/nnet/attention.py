@@ -777,6 +777,95 @@ class MultiheadAttention(nn.Module):
             output = output.permute(1, 0, 2)
             return output
 
+    def forward_step(
+        self,
+        query,
+        cache: Optional[torch.Tensor] = None,
+        key_padding_mask: Optional[torch.Tensor] = None,
+    ):
+        """Incremental self-attention of the last position of a sequence.
+
+        The keys and values of the previous positions are cached after their
+        projection, so that only the new position is projected. The output
+        is the one of forward() at the last position, with a causal mask.
+
+        Arguments
+        ----------
+        query : torch.Tensor
+            (B, 1, E) The new position of the sequence.
+        cache : torch.Tensor, optional
+            (B, 2, H, S - 1, E / H) The projected keys and values of the
+            previous positions, as returned by the previous step.
+        key_padding_mask : torch.Tensor, optional
+            (B, S) The positions with the value of True are ignored.
+
+        Outputs
+        -------
+        attn_output : torch.Tensor
+            (B, 1, E) The output for the new position.
+        attn_output_weights : torch.Tensor
+            (B, 1, S) The attention weights, averaged over the heads.
+        cache : torch.Tensor
+            (B, 2, H, S, E / H) The updated cache.
+
+        Example
+        -------
+        >>> inputs = torch.rand([8, 5, 16])
+        >>> net = MultiheadAttention(nhead=4, d_model=16).eval()
+        >>> mask = torch.triu(torch.ones(5, 5, dtype=torch.bool), diagonal=1)
+        >>> outputs, _ = net(inputs, inputs, inputs, attn_mask=mask)
+        >>> cache = None
+        >>> for t in range(5):
+        ...     output_t, _, cache = net.forward_step(inputs[:, t : t + 1], cache)
+        >>> torch.allclose(output_t[:, 0], outputs[:, -1], atol=1e-5)
+        True
+        """
+        att = self.att
+        if att.bias_k is not None or att.add_zero_attn:
+            raise ValueError(
+                "forward_step does not support add_bias_kv or add_zero_attn."
+            )
+        if att._qkv_same_embed_dim:
+            weights = att.in_proj_weight.chunk(3)
+        else:
+            weights = (att.q_proj_weight, att.k_proj_weight, att.v_proj_weight)
+        if att.in_proj_bias is not None:
+            biases = att.in_proj_bias.chunk(3)
+        else:
+            biases = (None, None, None)
+        batch_size, num_heads, head_dim = (
+            query.size(0),
+            att.num_heads,
+            att.head_dim,
+        )
+
+        # (B, 1, E) -> (B, H, 1, E / H)
+        q, k, v = [
+            F.linear(query, weight, bias)
+            .view(batch_size, 1, num_heads, head_dim)
+            .transpose(1, 2)
+            for weight, bias in zip(weights, biases)
+        ]
+        kv = torch.stack([k, v], dim=1)
+        if cache is not None:
+            kv = torch.cat([cache, kv], dim=3)
+
+        scores = torch.matmul(q, kv[:, 0].transpose(-2, -1))
+        scores = scores / math.sqrt(head_dim)
+        if key_padding_mask is not None:
+            scores = scores.masked_fill(
+                key_padding_mask.bool()[:, None, None, :], float("-inf")
+            )
+        attention_weights = scores.softmax(dim=-1)
+        output = torch.matmul(
+            F.dropout(attention_weights, att.dropout, self.training), kv[:, 1]
+        )
+        output = output.transpose(1, 2).reshape(
+            batch_size, 1, num_heads * head_dim
+        )
+        output = att.out_proj(output)
+        return output, attention_weights.mean(dim=1), kv
+
 
 class PositionalwiseFeedForward(nn.Module):
     """The class implements the positional-wise feed forward module in
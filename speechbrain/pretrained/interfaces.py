@@ -18,6 +18,7 @@ from torch.nn import DataParallel as DP
 from hyperpyyaml import load_hyperpyyaml
 from speechbrain.pretrained.fetching import fetch
 from speechbrain.dataio.preprocess import AudioNormalizer
+from speechbrain.decoders.ctc import CTCPrefixBeamSearcher
 import torch.nn.functional as F
 from torch.nn.parallel import DistributedDataParallel as DDP
 from speechbrain.utils.data_utils import split_path
@@ -199,6 +200,8 @@ class Pretrained(torch.nn.Module):
         self.audio_normalizer = hparams.get(
             "audio_normalizer", AudioNormalizer()
         )
+        # Optional cache of loaded audio, which can be shared between models
+        self.audio_cache = hparams.get("audio_cache", None)
 
     def _prepare_modules(self, freeze_params):
         """Prepare modules for computation, e.g. jit.
@@ -228,9 +231,15 @@ class Pretrained(torch.nn.Module):
         convert a file from a higher sampling rate to a lower one (downsampling).
         Similarly, it is simple to downmix a stereo file to mono.
         The path can be a local path, a web url, or a link to a huggingface repo.
+
+        If ``self.audio_cache`` is set to an AudioCache (e.g. through the
+        "audio_cache" hparam, or assigned to several models), the loaded audio
+        is cached there.
         """
         source, fl = split_path(path)
         path = fetch(fl, source=source, savedir=savedir)
+        if self.audio_cache is not None:
+            return self.audio_cache.load(str(path), self.audio_normalizer)
         signal, sr = torchaudio.load(str(path), channels_first=False)
         return self.audio_normalizer(signal, sr)
 
@@ -605,6 +614,11 @@ class EncoderASR(Pretrained):
     (transcribe()) to transcribe speech. The given YAML must contains the fields
     specified in the *_NEEDED[] lists.
 
+    The decoding_function can be e.g. `speechbrain.decoders.ctc_greedy_decode`
+    or a `speechbrain.decoders.CTCPrefixBeamSearcher`, for beam search with a
+    n-gram LM or a lexicon. Its vocab_list is then taken from the tokenizer
+    if not given.
+
     Example
     -------
     >>> from speechbrain.pretrained import EncoderASR
@@ -623,6 +637,16 @@ class EncoderASR(Pretrained):
         super().__init__(*args, **kwargs)
         self.tokenizer = self.hparams.tokenizer
         self.decoding_function = self.hparams.decoding_function
+        # The prefix beam search needs the strings of the tokens for words
+        if (
+            isinstance(self.decoding_function, CTCPrefixBeamSearcher)
+            and self.decoding_function.vocab_list is None
+            and hasattr(self.tokenizer, "id_to_piece")
+        ):
+            self.decoding_function.vocab_list = [
+                self.tokenizer.id_to_piece(i)
+                for i in range(self.tokenizer.get_piece_size())
+            ]
 
     def transcribe_file(self, path):
         """Transcribes the given audiofile into a sequence of words.
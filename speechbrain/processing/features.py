@@ -37,6 +37,7 @@ import math
 import torch
 import logging
 from packaging import version
+from speechbrain.dataio.dataio import length_to_mask
 from speechbrain.utils.checkpoints import (
     mark_as_saver,
     mark_as_loader,
@@ -964,12 +965,6 @@ class InputNormalization(torch.nn.Module):
     >>> features = norm(inputs, inp_len)
     """
 
-    from typing import Dict
-
-    spk_dict_mean: Dict[int, torch.Tensor]
-    spk_dict_std: Dict[int, torch.Tensor]
-    spk_dict_count: Dict[int, int]
-
     def __init__(
         self,
         mean_norm=True,
@@ -987,9 +982,10 @@ class InputNormalization(torch.nn.Module):
         self.requires_grad = requires_grad
         self.glob_mean = torch.tensor([0])
         self.glob_std = torch.tensor([0])
-        self.spk_dict_mean = {}
-        self.spk_dict_std = {}
-        self.spk_dict_count = {}
+        # Speaker statistics, indexed by speaker id (count 0 if unseen)
+        self.spk_mean = torch.tensor([])
+        self.spk_std = torch.tensor([])
+        self.spk_count = torch.zeros(0, dtype=torch.long)
         self.weight = 1.0
         self.count = 0
         self.eps = 1e-10
@@ -1010,77 +1006,27 @@ class InputNormalization(torch.nn.Module):
             It is used to perform per-speaker normalization when
             norm_type='speaker'.
         """
-        N_batches = x.shape[0]
-
-        current_means = []
-        current_stds = []
-
-        for snt_id in range(N_batches):
+        # Statistics of each sentence, shaped to be broadcast with x
+        current_means, current_stds = self._compute_current_stats(x, lengths)
 
-            # Avoiding padded time steps
-            actual_size = torch.round(lengths[snt_id] * x.shape[1]).int()
-
-            # computing statistics
-            current_mean, current_std = self._compute_current_stats(
-                x[snt_id, 0:actual_size, ...]
+        if self.norm_type == "sentence":
+            x = (x - self._expand(current_means, x)).div_(
+                self._expand(current_stds, x)
             )
 
-            current_means.append(current_mean)
-            current_stds.append(current_std)
-
-            if self.norm_type == "sentence":
-
-                x[snt_id] = (x[snt_id] - current_mean.data) / current_std.data
-
-            if self.norm_type == "speaker":
-
-                spk_id = int(spk_ids[snt_id][0])
-
-                if self.training:
-                    if spk_id not in self.spk_dict_mean:
-
-                        # Initialization of the dictionary
-                        self.spk_dict_mean[spk_id] = current_mean
-                        self.spk_dict_std[spk_id] = current_std
-                        self.spk_dict_count[spk_id] = 1
-
-                    else:
-                        self.spk_dict_count[spk_id] = (
-                            self.spk_dict_count[spk_id] + 1
-                        )
-
-                        if self.avg_factor is None:
-                            self.weight = 1 / self.spk_dict_count[spk_id]
-                        else:
-                            self.weight = self.avg_factor
-
-                        self.spk_dict_mean[spk_id] = (
-                            (1 - self.weight) * self.spk_dict_mean[spk_id]
-                            + self.weight * current_mean
-                        )
-                        self.spk_dict_std[spk_id] = (
-                            (1 - self.weight) * self.spk_dict_std[spk_id]
-                            + self.weight * current_std
-                        )
-
-                        self.spk_dict_mean[spk_id].detach()
-                        self.spk_dict_std[spk_id].detach()
-
-                    speaker_mean = self.spk_dict_mean[spk_id].data
-                    speaker_std = self.spk_dict_std[spk_id].data
-                else:
-                    if spk_id in self.spk_dict_mean:
-                        speaker_mean = self.spk_dict_mean[spk_id].data
-                        speaker_std = self.spk_dict_std[spk_id].data
-                    else:
-                        speaker_mean = current_mean.data
-                        speaker_std = current_std.data
-
-                x[snt_id] = (x[snt_id] - speaker_mean) / speaker_std
+        if self.norm_type == "speaker":
+            speaker_means, speaker_stds = self._speaker_stats(
+                current_means,
+                current_stds,
+                spk_ids.reshape(x.shape[0], -1)[:, 0].long().to(x.device),
+            )
+            x = (x - self._expand(speaker_means, x)).div_(
+                self._expand(speaker_stds, x)
+            )
 
         if self.norm_type == "batch" or self.norm_type == "global":
-            current_mean = torch.mean(torch.stack(current_means), dim=0)
-            current_std = torch.mean(torch.stack(current_stds), dim=0)
+            current_mean = torch.mean(current_means, dim=0)
+            current_std = torch.mean(current_stds, dim=0)
 
             if self.norm_type == "batch":
                 x = (x - current_mean.data) / (current_std.data)
@@ -1115,25 +1061,42 @@ class InputNormalization(torch.nn.Module):
 
         return x
 
-    def _compute_current_stats(self, x):
-        """Returns the tensor with the surrounding context.
+    def _compute_current_stats(self, x, lengths):
+        """Returns the mean and std of the frames of each sentence.
 
         Arguments
         ---------
         x : tensor
             A batch of tensors.
+        lengths : tensor
+            The relative lengths of the sentences.
         """
+        batch_size = x.shape[0]
+        # Avoiding padded time steps: the frames are summed with 0/1 weights
+        actual_size = torch.round(lengths * x.shape[1]).int()
+        mask = length_to_mask(
+            actual_size, max_len=x.shape[1], dtype=x.dtype
+        ).unsqueeze(1)
+        actual_size = actual_size.unsqueeze(1)
+        frames = x.detach().reshape(batch_size, x.shape[1], -1)
+
         # Compute current mean
+        if self.mean_norm or self.std_norm:
+            mean = torch.bmm(mask, frames).squeeze(1) / actual_size
         if self.mean_norm:
-            current_mean = torch.mean(x, dim=0).detach().data
+            current_mean = mean.view(batch_size, *x.shape[2:])
         else:
-            current_mean = torch.tensor([0.0], device=x.device)
+            current_mean = torch.zeros(batch_size, 1, device=x.device)
 
         # Compute current std
         if self.std_norm:
-            current_std = torch.std(x, dim=0).detach().data
+            deviation = frames - mean.unsqueeze(1)
+            deviation = deviation.mul_(deviation)
+            current_std = torch.sqrt(
+                torch.bmm(mask, deviation).squeeze(1) / (actual_size - 1)
+            ).view(batch_size, *x.shape[2:])
         else:
-            current_std = torch.tensor([1.0], device=x.device)
+            current_std = torch.ones(batch_size, 1, device=x.device)
 
         # Improving numerical stability of std
         current_std = torch.max(
@@ -1142,6 +1105,133 @@ class InputNormalization(torch.nn.Module):
 
         return current_mean, current_std
 
+    @staticmethod
+    def _expand(stats, x):
+        """Reshapes the statistics of each sentence to be broadcast with x.
+        """
+        return stats.view(
+            stats.shape[0], *[1] * (x.dim() - stats.dim()), *stats.shape[1:]
+        )
+
+    def _speaker_stats(self, current_means, current_stds, spk_ids):
+        """Returns the speaker statistics to use for each sentence, updating
+        them with the current statistics when training.
+
+        The sentences are processed in order, as if one by one: the first
+        sentence of each speaker in the batch is processed first, for all
+        the speakers at once, then the second one, etc.
+
+        Arguments
+        ---------
+        current_means : tensor
+            The means of the sentences.
+        current_stds : tensor
+            The stds of the sentences.
+        spk_ids : tensor
+            The speaker id of each sentence.
+        """
+        if not self.training:
+            if self.spk_count.shape[0] == 0:
+                return current_means, current_stds
+            known = spk_ids < self.spk_count.shape[0]
+            index = torch.where(known, spk_ids, torch.zeros_like(spk_ids))
+            known = known & (self.spk_count[index] > 0)
+            return (
+                torch.where(
+                    self._expand(known, current_means),
+                    self.spk_mean[index],
+                    current_means,
+                ),
+                torch.where(
+                    self._expand(known, current_stds),
+                    self.spk_std[index],
+                    current_stds,
+                ),
+            )
+
+        self._grow_speaker_stats(
+            int(spk_ids.max()) + 1, current_means, current_stds
+        )
+        # Rank of each sentence among the sentences of its speaker. The sort
+        # keys are unique (and in batch order within a speaker), so any sort
+        # is stable:
+        positions = torch.arange(len(spk_ids), device=spk_ids.device)
+        order = torch.sort(spk_ids * len(spk_ids) + positions)[1]
+        sorted_ids = spk_ids[order]
+        starts = torch.ones_like(sorted_ids, dtype=torch.bool)
+        starts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        first = torch.where(starts, positions, torch.zeros_like(positions))
+        first = torch.cummax(first, dim=0)[0]
+        rank = torch.empty_like(positions)
+        rank[order] = positions - first
+
+        speaker_means = torch.empty_like(current_means)
+        speaker_stds = torch.empty_like(current_stds)
+        for r in range(int(rank.max()) + 1):
+            sentences = (rank == r).nonzero(as_tuple=True)[0]
+            spk = spk_ids[sentences]
+            self.spk_count[spk] += 1
+            count = self.spk_count[spk].double()
+            if self.avg_factor is None:
+                weight = 1 / count
+            else:
+                weight = torch.full_like(count, self.avg_factor)
+            # Initialization of the new speakers
+            weight = torch.where(count == 1, torch.ones_like(count), weight)
+            old_weight = (1 - weight).to(current_means.dtype)
+            weight = weight.to(current_means.dtype)
+
+            self.spk_mean[spk] = self._moving_average(
+                self.spk_mean[spk], current_means[sentences], old_weight, weight
+            )
+            self.spk_std[spk] = self._moving_average(
+                self.spk_std[spk], current_stds[sentences], old_weight, weight
+            )
+            speaker_means[sentences] = self.spk_mean[spk]
+            speaker_stds[sentences] = self.spk_std[spk]
+
+        return speaker_means, speaker_stds
+
+    @staticmethod
+    def _moving_average(stats, current_stats, old_weight, weight):
+        """Returns old_weight * stats + weight * current_stats, with one
+        weight per sentence.
+        """
+        shape = (-1,) + (1,) * (stats.dim() - 1)
+        return (
+            old_weight.view(shape) * stats + weight.view(shape) * current_stats
+        )
+
+    def _grow_speaker_stats(self, num_speakers, means, stds):
+        """Makes room for the statistics of num_speakers speakers.
+
+        Arguments
+        ---------
+        num_speakers : int
+            The number of speakers (maximum speaker id + 1).
+        means : tensor
+            Means of some sentences, for the shape, dtype and device.
+        stds : tensor
+            Stds of some sentences, for the shape, dtype and device.
+        """
+        old_size = self.spk_count.shape[0]
+        if num_speakers <= old_size:
+            return
+        spk_mean = means.new_zeros((num_speakers,) + tuple(means.shape[1:]))
+        spk_std = stds.new_zeros((num_speakers,) + tuple(stds.shape[1:]))
+        spk_count = torch.zeros(
+            num_speakers, dtype=torch.long, device=means.device
+        )
+        if old_size > 0:
+            spk_mean[:old_size] = self.spk_mean
+            spk_std[:old_size] = self.spk_std
+            spk_count[:old_size] = self.spk_count
+        self.spk_mean, self.spk_std, self.spk_count = (
+            spk_mean,
+            spk_std,
+            spk_count,
+        )
+
     def _statistics_dict(self):
         """Fills the dictionary containing the normalization statistics.
         """
@@ -1149,9 +1239,13 @@ class InputNormalization(torch.nn.Module):
         state["count"] = self.count
         state["glob_mean"] = self.glob_mean
         state["glob_std"] = self.glob_std
-        state["spk_dict_mean"] = self.spk_dict_mean
-        state["spk_dict_std"] = self.spk_dict_std
-        state["spk_dict_count"] = self.spk_dict_count
+        # The speaker statistics are saved as dicts, indexed by speaker id
+        speakers = self.spk_count.nonzero(as_tuple=True)[0].tolist()
+        state["spk_dict_mean"] = {spk: self.spk_mean[spk] for spk in speakers}
+        state["spk_dict_std"] = {spk: self.spk_std[spk] for spk in speakers}
+        state["spk_dict_count"] = {
+            spk: int(self.spk_count[spk]) for spk in speakers
+        }
 
         return state
 
@@ -1164,28 +1258,23 @@ class InputNormalization(torch.nn.Module):
             A dictionary containing the normalization statistics.
         """
         self.count = state["count"]
-        if isinstance(state["glob_mean"], int):
-            self.glob_mean = state["glob_mean"]
-            self.glob_std = state["glob_std"]
-        else:
-            self.glob_mean = state["glob_mean"]  # .to(self.device_inp)
-            self.glob_std = state["glob_std"]  # .to(self.device_inp)
-
-        # Loading the spk_dict_mean in the right device
-        self.spk_dict_mean = {}
-        for spk in state["spk_dict_mean"]:
-            self.spk_dict_mean[spk] = state["spk_dict_mean"][spk].to(
-                self.device_inp
+        self.glob_mean = state["glob_mean"]
+        self.glob_std = state["glob_std"]
+
+        self.spk_mean = torch.tensor([])
+        self.spk_std = torch.tensor([])
+        self.spk_count = torch.zeros(0, dtype=torch.long)
+        speakers = list(state["spk_dict_mean"])
+        if speakers:
+            self._grow_speaker_stats(
+                max(speakers) + 1,
+                state["spk_dict_mean"][speakers[0]][None],
+                state["spk_dict_std"][speakers[0]][None],
             )
-
-        # Loading the spk_dict_std in the right device
-        self.spk_dict_std = {}
-        for spk in state["spk_dict_std"]:
-            self.spk_dict_std[spk] = state["spk_dict_std"][spk].to(
-                self.device_inp
-            )
-
-        self.spk_dict_count = state["spk_dict_count"]
+            for spk in speakers:
+                self.spk_mean[spk] = state["spk_dict_mean"][spk]
+                self.spk_std[spk] = state["spk_dict_std"][spk]
+                self.spk_count[spk] = state["spk_dict_count"][spk]
 
         return state
 
@@ -1195,9 +1284,9 @@ class InputNormalization(torch.nn.Module):
         self = super(InputNormalization, self).to(device)
         self.glob_mean = self.glob_mean.to(device)
         self.glob_std = self.glob_std.to(device)
-        for spk in self.spk_dict_mean:
-            self.spk_dict_mean[spk] = self.spk_dict_mean[spk].to(device)
-            self.spk_dict_std[spk] = self.spk_dict_std[spk].to(device)
+        self.spk_mean = self.spk_mean.to(device)
+        self.spk_std = self.spk_std.to(device)
+        self.spk_count = self.spk_count.to(device)
         return self
 
     @mark_as_saver
@@ -0,0 +1,279 @@
+"""Size-bounded caches for expensive, deterministic computations.
+
+`LRUCache` keeps values in memory, `DiskCache` persists them in a directory
+(with an optional in-memory LRU tier in front), so that they can be reused
+across epochs, processes and runs. Both evict the least recently used values
+once their size bound is exceeded.
+
+See `speechbrain.utils.data_pipeline.cache` for caching the outputs of
+dynamic items in a data pipeline.
+
+Example
+-------
+>>> import torch
+>>> cache = DiskCache(getfixture('tmpdir'), max_ram_bytes=2 ** 20)
+>>> cache.get("feats") is None
+True
+>>> cache.put("feats", torch.ones(3))
+>>> cache.get("feats")
+tensor([1., 1., 1.])
+>>> cache.hits, cache.misses
+(1, 1)
+"""
+
+import os
+import sys
+import uuid
+import inspect
+import logging
+import collections
+import torch
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Newer torch versions default to weights_only=True, which rejects e.g. numpy
+# values. The cache only loads files that it wrote itself.
+if "weights_only" in inspect.signature(torch.load).parameters:
+    _LOAD_KWARGS = {"weights_only": False}
+else:
+    _LOAD_KWARGS = {}
+
+
+class LRUCache:
+    """In-memory cache bounded by the total size of the stored values.
+
+    Arguments
+    ---------
+    max_bytes : int
+        Maximum total size of the stored values, see `value_nbytes`. A single
+        value larger than this is not stored at all.
+
+    Example
+    -------
+    >>> cache = LRUCache(max_bytes=100)
+    >>> cache.put("a", torch.zeros(10))  # 40 bytes
+    >>> cache.put("b", torch.zeros(10))
+    >>> _ = cache.get("a")  # Now "b" is the least recently used
+    >>> cache.put("c", torch.zeros(10))
+    >>> "b" in cache, "a" in cache, "c" in cache
+    (False, True, True)
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, or default if not found."""
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, nbytes=None):
+        """Stores value for key, evicting least recently used values if needed.
+
+        Arguments
+        ---------
+        key : hashable
+            Key to store the value under.
+        value : object
+            Value to store. It is stored by reference, not copied.
+        nbytes : int, None
+            Size of the value, if known. Otherwise computed with
+            `value_nbytes`.
+        """
+        if nbytes is None:
+            nbytes = value_nbytes(value)
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+
+    def clear(self):
+        """Removes all values."""
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class DiskCache:
+    """Persistent cache, storing each value as a file in a directory.
+
+    Values are saved with `torch.save`, so anything torch can save (tensors,
+    lists, dicts, strings, numpy arrays) can be cached. Writes are atomic, so
+    multiple processes (e.g. DataLoader workers, or DDP ranks) can safely
+    share the same directory. Unreadable files are treated as cache misses
+    (and deleted).
+
+    When the directory grows larger than ``max_bytes``, the least recently
+    used files (as seen by this process) are deleted. With many processes
+    writing to the same directory, the bound is therefore approximate.
+
+    Deep copies share the same instance, so that e.g. the filtered and sorted
+    versions of a dataset also share the in-memory tier.
+
+    Arguments
+    ---------
+    cache_dir : str, path
+        Directory to store the cached values in. Created if it does not exist,
+        and existing values in it are reused.
+    max_bytes : int, None
+        Maximum size of the cache directory in bytes. None means unbounded.
+    max_ram_bytes : int
+        Size of the in-memory LRU tier in bytes. 0 disables the tier.
+    """
+
+    SUFFIX = ".pt"
+
+    def __init__(self, cache_dir, max_bytes=None, max_ram_bytes=0):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.ram = LRUCache(max_ram_bytes) if max_ram_bytes > 0 else None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._files = self._scan()
+        self.nbytes = sum(self._files.values())
+
+    def _scan(self):
+        """Finds existing values, ordered from oldest to newest."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(self.SUFFIX):
+                    continue
+                stat = os.stat(os.path.join(dirpath, filename))
+                key = filename[: -len(self.SUFFIX)]
+                found.append((stat.st_mtime, key, stat.st_size))
+        found.sort()
+        return collections.OrderedDict((key, size) for _, key, size in found)
+
+    def _path(self, key):
+        # Two-level layout to keep directories reasonably small.
+        return os.path.join(self.cache_dir, key[:2], key + self.SUFFIX)
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, or default if not found.
+
+        Arguments
+        ---------
+        key : str
+            Key made of filename-safe characters, e.g. a hex digest.
+        default : object
+            Returned if the key is not found.
+        """
+        if self.ram is not None:
+            value = self.ram.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+        try:
+            value = torch.load(self._path(key), **_LOAD_KWARGS)
+        except FileNotFoundError:
+            # Possibly evicted by another process.
+            self._forget(key)
+            self.misses += 1
+            return default
+        except Exception as e:
+            # E.g. truncated by a crash, or written by an incompatible version.
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            self._evict(key)
+            self.misses += 1
+            return default
+        self.hits += 1
+        if key in self._files:
+            self._files.move_to_end(key)
+        if self.ram is not None:
+            self.ram.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Stores value for key, evicting old values if needed.
+
+        Arguments
+        ---------
+        key : str
+            Key made of filename-safe characters, e.g. a hex digest.
+        value : object
+            Anything that `torch.save` can save.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        torch.save(value, tmp_path)
+        os.replace(tmp_path, path)
+        self._forget(key)
+        self._files[key] = os.path.getsize(path)
+        self.nbytes += self._files[key]
+        if self.ram is not None:
+            self.ram.put(key, value)
+        if self.max_bytes is not None:
+            while self.nbytes > self.max_bytes and len(self._files) > 1:
+                self._evict(next(iter(self._files)))
+
+    def _forget(self, key):
+        if key in self._files:
+            self.nbytes -= self._files.pop(key)
+
+    def _evict(self, key):
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Removes all values, also from the disk."""
+        for key in list(self._files):
+            self._evict(key)
+        if self.ram is not None:
+            self.ram.clear()
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def value_nbytes(value):
+    """Estimates the memory used by a value, in bytes.
+
+    Counts the data of tensors and numpy arrays, also inside (nested) lists,
+    tuples and dicts. For other objects, uses `sys.getsizeof`.
+
+    Example
+    -------
+    >>> value_nbytes(torch.zeros(4, dtype=torch.float64))
+    32
+    >>> value_nbytes([torch.zeros(2), np.zeros(2, dtype=np.int16)])
+    12
+    """
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(value_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+_MISSING = object()
@@ -23,7 +23,11 @@ Author:
     * Aku Rouhe
 """
 
+import types
+import pickle
+import hashlib
 import inspect
+import functools
 from dataclasses import dataclass
 from speechbrain.utils.depgraph import DependencyGraph
 
@@ -61,15 +65,49 @@ class DynamicItem:
         The function that is used to compute the output.
     provides : list
         The keys that this provides.
+    cache : DiskCache, LRUCache, None
+        If given, the outputs are stored in this cache, and reused whenever
+        the function is called again with equal arguments. Only use for
+        deterministic functions. See the @cache decorator.
+    cache_version : str, int, None
+        Included in the cache keys: change it to invalidate the cached
+        outputs, when the function depends on something that the keys do not
+        capture (see the @cache decorator).
     """
 
-    def __init__(self, takes=[], func=None, provides=[]):
+    def __init__(
+        self, takes=[], func=None, provides=[], cache=None, cache_version=None
+    ):
         self.takes = takes
         self.func = func
         self.provides = provides
+        self.cache = cache
+        self.cache_version = cache_version
+        self._func_digest = None
 
     def __call__(self, *args):
-        return self.func(*args)
+        if self.cache is None:
+            return self.func(*args)
+        key = self._cache_key(args)
+        values = self.cache.get(key, _MISSING)
+        if values is _MISSING:
+            values = self.func(*args)
+            self.cache.put(key, values)
+        return values
+
+    def _cache_key(self, args):
+        """Hash of the function and its arguments.
+
+        The arguments determine the output of a deterministic function, so
+        they also identify the data point (the "id" does not need to be
+        included, unless the function takes it).
+        """
+        if self._func_digest is None:
+            self._func_digest = _function_digest(self.func)
+        hasher = hashlib.sha1(self._func_digest)
+        hasher.update(repr(self.cache_version).encode())
+        hasher.update(pickle.dumps(args, protocol=4))
+        return hasher.hexdigest()
 
     # The next methods are more about supporting GeneratorDynamicItems
     def next_takes(self):
@@ -140,6 +178,8 @@ class GeneratorDynamicItem(DynamicItem):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self.cache is not None:
+            raise ValueError("Generator dynamic items can't be cached.")
         # Doesn't generate electricity, only stores the currently active
         # generator:
         self.current_generator = None
@@ -283,6 +323,150 @@ def provides(*output_keys):
 provides_decorator = provides  # Just for DataPipeline.add_dynamic_item
 
 
+def cache(store, version=None):
+    """Decorator which makes a DynamicItem cache its outputs in a store.
+
+    Expensive, deterministic steps of a data pipeline (e.g. feature
+    extraction, or tokenization) are then computed only once per data point,
+    instead of once per epoch. Outputs are keyed by a hash of the function
+    code, of the values it refers to (closure variables and globals), of
+    ``version`` and of the arguments it is called with.
+
+    NOTE: The values the function refers to are identified by their pickle.
+    Values that cannot be pickled (e.g. some tokenizer wrappers) are only
+    identified by their type, and the state of objects reached through
+    attributes of the arguments is not seen at all. When such a dependency
+    changes, pass a new ``version``, otherwise stale outputs are returned.
+
+    Can be combined with @takes and @provides in any order. Generator
+    functions are not supported.
+
+    Arguments
+    ---------
+    store : DiskCache, LRUCache
+        Where to store the outputs, see `speechbrain.utils.cache`. A
+        `DiskCache` persists across epochs, DataLoader workers and runs.
+    version : str, int, None
+        Included in the cache keys: change it to invalidate the outputs
+        cached so far.
+
+    Example
+    -------
+    >>> from speechbrain.utils.cache import DiskCache
+    >>> store = DiskCache(getfixture('tmpdir'))
+    >>> @takes("text")
+    ... @provides("tokens")
+    ... @cache(store)
+    ... def tokenize(text):
+    ...     return text.split()
+    >>> tokenize("cache me")
+    ['cache', 'me']
+    >>> tokenize("cache me")
+    ['cache', 'me']
+    >>> store.hits, store.misses
+    (1, 1)
+    """
+
+    def decorator(obj):
+        if isinstance(obj, GeneratorDynamicItem) or inspect.isgeneratorfunction(
+            obj
+        ):
+            raise ValueError("Generator dynamic items can't be cached.")
+        if isinstance(obj, DynamicItem):
+            if obj.cache is not None:
+                raise ValueError("Can't overwrite DynamicItem.cache")
+            obj.cache = store
+            obj.cache_version = version
+            return obj
+        else:
+            return DynamicItem(func=obj, cache=store, cache_version=version)
+
+    return decorator
+
+
+cache_decorator = cache  # Just for DataPipeline.add_dynamic_item
+
+
+def _function_digest(func):
+    """Identifies a function by its name, code and the values it refers to
+    (not its memory address).
+
+    This way, the cached outputs of a function are reused across runs, but
+    not after its code has been edited, or after a value it captures in a
+    closure or refers to as a global (e.g. a hyperparameter) has changed.
+    Functions, classes and modules are identified by name (and functions by
+    code, recursively), other values by their pickle, or only by their type
+    if they cannot be pickled.
+    """
+    hasher = hashlib.sha1()
+    _update_function_digest(hasher, func, set())
+    return hasher.digest()
+
+
+def _update_function_digest(hasher, func, visited):
+    if isinstance(func, functools.partial):
+        _update_function_digest(hasher, func.func, visited)
+        _update_value_digest(hasher, func.args, visited)
+        _update_value_digest(hasher, func.keywords, visited)
+        return
+    if inspect.ismethod(func):
+        _update_function_digest(hasher, func.__func__, visited)
+        _update_value_digest(hasher, func.__self__, visited)
+        return
+    hasher.update(str(getattr(func, "__module__", "")).encode())
+    hasher.update(getattr(func, "__qualname__", repr(func)).encode())
+    code = getattr(func, "__code__", None)
+    if code is None or id(code) in visited:
+        return
+    visited.add(id(code))
+    names = set()
+    _update_code_digest(hasher, code, names)
+    for cell in getattr(func, "__closure__", None) or ():
+        try:
+            _update_value_digest(hasher, cell.cell_contents, visited)
+        except ValueError:  # Empty cell
+            pass
+    func_globals = getattr(func, "__globals__", {})
+    # co_names also has attribute names, only some of them are globals:
+    for name in sorted(names):
+        if name in func_globals:
+            hasher.update(name.encode())
+            _update_value_digest(hasher, func_globals[name], visited)
+
+
+def _update_code_digest(hasher, code, names):
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names).encode())
+    names.update(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code_digest(hasher, const, names)
+        else:
+            hasher.update(repr(const).encode())
+
+
+def _update_value_digest(hasher, value, visited):
+    if isinstance(value, types.ModuleType):
+        hasher.update(value.__name__.encode())
+    elif (
+        inspect.isfunction(value)
+        or inspect.ismethod(value)
+        or isinstance(value, functools.partial)
+    ):
+        _update_function_digest(hasher, value, visited)
+    elif inspect.isclass(value) or inspect.isbuiltin(value):
+        hasher.update(str(getattr(value, "__module__", "")).encode())
+        hasher.update(value.__qualname__.encode())
+    else:
+        try:
+            hasher.update(pickle.dumps(value, protocol=4))
+        except Exception:
+            hasher.update(type(value).__qualname__.encode())
+
+
+_MISSING = object()
+
+
 class DataPipeline:
     """Organises data transformations into a pipeline.
 
@@ -328,13 +512,13 @@ class DataPipeline:
             except TypeError:
                 self.add_dynamic_item(item)
 
-    def add_dynamic_item(self, func, takes=None, provides=None):
+    def add_dynamic_item(self, func, takes=None, provides=None, cache=None):
         """Adds a dynamic item to the Pipeline.
 
         Two calling conventions. For DynamicItem objects, just use:
         add_dynamic_item(dynamic_item)
         But otherwise, should use:
-        add_dynamic_item(func, takes, provides)
+        add_dynamic_item(func, takes, provides, cache)
 
         Arguments
         ---------
@@ -354,12 +538,15 @@ class DataPipeline:
             If you give a generator function, key or list of keys that it
             yields, in order. Also see the provides decorator.
             A single key can be given as a bare string.
+        cache : DiskCache, LRUCache, None
+            If given, the outputs of func are cached in this store. Also see
+            the cache decorator.
         """
         if isinstance(func, DynamicItem):
-            if takes is not None or provides is not None:
+            if takes is not None or provides is not None or cache is not None:
                 raise ValueError(
                     "If providing a DynamicItem directly, don't "
-                    "specify takes or provides"
+                    "specify takes, provides or cache"
                 )
             else:
                 self._add_dynamic_item_object(func)
@@ -368,6 +555,8 @@ class DataPipeline:
             takes = [takes]
         if isinstance(provides, str):
             provides = [provides]
+        if cache is not None:
+            func = cache_decorator(cache)(func)
         di = takes_decorator(*takes)(provides_decorator(*provides)(func))
         self._add_dynamic_item_object(di)
 
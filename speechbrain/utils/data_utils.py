@@ -16,6 +16,10 @@ import pathlib
 import speechbrain as sb
 import re
 
+# Below this many elements (in total, along the first dimensions), padding
+# is done by torch.nn.utils.rnn.pad_sequence:
+SMALL_BATCH_NUMEL = 2 ** 16
+
 
 def undo_padding(batch, lengths):
     """Produces Python lists given a batch of sentences with
@@ -358,10 +362,13 @@ def pad_right_to(
     return tensor, valid_vals
 
 
-def batch_pad_right(tensors: list, mode="constant", value=0):
+def batch_pad_right(tensors: list, mode="constant", value=0, pin_memory=False):
     """Given a list of torch tensors it batches them together by padding to the right
     on each dimension in order to get same length for all.
 
+    With constant padding (the default), the output is allocated once, and
+    each tensor is copied directly into its slice.
+
     Parameters
     ----------
     tensors : list
@@ -370,6 +377,10 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
         Padding mode see torch.nn.functional.pad documentation.
     value : float
         Padding value see torch.nn.functional.pad documentation.
+    pin_memory : bool
+        Whether to allocate the padded tensor in pinned memory (for CPU
+        tensors, with constant padding), so that it can be copied to the GPU
+        asynchronously, without another copy.
 
     Returns
     -------
@@ -378,6 +389,14 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
     valid_vals : list
         List containing proportion for each dimension of original, non-padded values.
 
+    Example
+    -------
+    >>> padded, lengths = batch_pad_right([torch.ones(2), torch.ones(4)])
+    >>> padded
+    tensor([[1., 1., 0., 0.],
+            [1., 1., 1., 1.]])
+    >>> lengths
+    tensor([0.5000, 1.0000])
     """
 
     if not len(tensors):
@@ -407,19 +426,50 @@ def batch_pad_right(tensors: list, mode="constant", value=0):
                 )
         max_shape.append(max([x.shape[dim] for x in tensors]))
 
-    batched = []
-    valid = []
-    for t in tensors:
-        # for each tensor we apply pad_right_to
-        padded, valid_percent = pad_right_to(
-            t, max_shape, mode=mode, value=value
-        )
-        batched.append(padded)
-        valid.append(valid_percent[0])
+    if mode != "constant" or tensors[0].ndim == 0:
+        batched = []
+        valid = []
+        for t in tensors:
+            # for each tensor we apply pad_right_to
+            padded, valid_percent = pad_right_to(
+                t, max_shape, mode=mode, value=value
+            )
+            batched.append(padded)
+            valid.append(valid_percent[0])
+
+        batched = torch.stack(batched)
 
-    batched = torch.stack(batched)
+        return batched, torch.tensor(valid)
 
-    return batched, torch.tensor(valid)
+    max_len = max_shape[0]
+    valid = torch.tensor([t.shape[0] / max_len for t in tensors])
+    dtype = tensors[0].dtype
+    for t in tensors[1:]:
+        dtype = torch.promote_types(dtype, t.dtype)
+    device = tensors[0].device
+    if len(tensors) * max_len < SMALL_BATCH_NUMEL and all(
+        t.dtype == dtype for t in tensors
+    ):
+        # For small batches, the overhead of the copies below dominates.
+        batched = torch.nn.utils.rnn.pad_sequence(
+            tensors, batch_first=True, padding_value=value
+        )
+        if pin_memory and device.type == "cpu":
+            batched = batched.pin_memory()
+        return batched, valid
+    batched = torch.empty(
+        (len(tensors), *max_shape),
+        dtype=dtype,
+        device=device,
+        pin_memory=pin_memory and device.type == "cpu",
+    )
+    for i, t in enumerate(tensors):
+        length = t.shape[0]
+        batched[i, :length] = t
+        if length < max_len:
+            batched[i, length:] = value
+
+    return batched, valid
 
 
 def split_by_whitespace(text):
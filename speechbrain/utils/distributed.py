@@ -104,6 +104,33 @@ def ddp_barrier():
         torch.distributed.barrier()
 
 
+def ddp_all_reduce_counts(counts):
+    """In DDP mode, this function sums a dict of counts over all the
+    processes, e.g., to compute metrics on the whole evaluation set. All
+    the processes must call it, with the same keys.
+
+    Arguments
+    ---------
+    counts : dict
+        The counts (int or float values) of this process.
+
+    Returns
+    -------
+    dict
+        The counts summed over all the processes (the counts of this
+        process if DDP is not initialized).
+    """
+    if not torch.distributed.is_initialized():
+        return counts
+    device = "cpu"
+    if torch.distributed.get_backend() == "nccl":
+        device = torch.device("cuda", torch.cuda.current_device())
+    keys = sorted(counts)
+    values = torch.tensor([counts[key] for key in keys], device=device)
+    torch.distributed.all_reduce(values)
+    return dict(zip(keys, values.tolist()))
+
+
 def ddp_init_group(run_opts):
     """This function will initialize the ddp group if
     distributed_launch=True bool is given in the python command line.
@@ -4,6 +4,7 @@ Authors
  * Aku Rouhe 2020
 """
 import collections
+import numpy as np
 
 EDIT_SYMBOLS = {
     "eq": "=",  # when tokens are equal
@@ -12,6 +13,16 @@ EDIT_SYMBOLS = {
     "sub": "S",
 }
 
+# Integer codes of the edit operations, for the batched op tables
+_EQ, _INS, _DEL, _SUB, _NONE = 0, 1, 2, 3, 4
+_CODE_SYMBOLS = [
+    EDIT_SYMBOLS["eq"],
+    EDIT_SYMBOLS["ins"],
+    EDIT_SYMBOLS["del"],
+    EDIT_SYMBOLS["sub"],
+]
+_CODE_KEYS = [None, "insertions", "deletions", "substitutions"]
+
 
 # NOTE: There is a danger in using mutables as default arguments, as they are
 # only initialized once, and not every time the function is run. However,
@@ -111,9 +122,8 @@ def _batch_stats(refs, hyps):
             "The reference and hypothesis batches are not of the same size"
         )
     stats = collections.Counter()
-    for ref_tokens, hyp_tokens in zip(refs, hyps):
-        table = op_table(ref_tokens, hyp_tokens)
-        edits = count_ops(table)
+    all_edits, _ = batch_edit_ops(refs, hyps)
+    for ref_tokens, edits in zip(refs, all_edits):
         stats += edits
         stats["num_ref_tokens"] += len(ref_tokens)
     return stats
@@ -332,6 +342,230 @@ def count_ops(table):
     return edits
 
 
+def batch_edit_ops(refs, hyps, compute_alignments=False, max_cells=2 ** 18):
+    """Counts the edit operations (and finds the alignments) of many pairs
+    of sequences at once.
+
+    This gives the same results as ``count_ops(op_table(ref, hyp))`` and
+    ``alignment(op_table(ref, hyp))`` for each pair, but the tokens are
+    mapped to integer ids and the op tables of the pairs are solved
+    together, with vectorized NumPy operations: row by row, each row
+    being a running minimum over the insertions.
+
+    Arguments
+    ---------
+    refs : iterable
+        Reference sequences.
+    hyps : iterable
+        Hypothesis sequences.
+    compute_alignments : bool
+        Whether to also compute the alignments.
+    max_cells : int
+        The maximum size of the op tables solved at once (pairs of similar
+        lengths are batched together).
+
+    Returns
+    -------
+    list
+        For each pair, a ``collections.Counter`` of the edit operations,
+        see ``count_ops``.
+    list
+        For each pair, the alignment (see ``alignment``), or None if
+        compute_alignments is False.
+
+    Example
+    -------
+    >>> refs = [[1, 2, 3], ["a", "b"], []]
+    >>> hyps = [[1, 2, 4], ["b"], ["c"]]
+    >>> edits, alignments = batch_edit_ops(refs, hyps, compute_alignments=True)
+    >>> edits
+    [Counter({'substitutions': 1}), Counter({'deletions': 1}), Counter({'insertions': 1})]
+    >>> alignments[1]
+    [('D', 0, None), ('=', 1, 0)]
+    """
+    refs, hyps = list(refs), list(hyps)
+    if len(refs) != len(hyps):
+        raise ValueError(
+            "The reference and hypothesis batches are not of the same size"
+        )
+    vocab = {}
+    refs = [_token_ids(tokens, vocab) for tokens in refs]
+    hyps = [_token_ids(tokens, vocab) for tokens in hyps]
+
+    all_edits = [None] * len(refs)
+    all_alignments = [None] * len(refs)
+    # Batch together pairs of similar lengths, to limit the padding
+    order = sorted(range(len(refs)), key=lambda k: (len(refs[k]), len(hyps[k])))
+    start = 0
+    while start < len(order):
+        end, max_ref_len, max_hyp_len = start, 0, 0
+        while end < len(order):
+            ref_len = max(max_ref_len, len(refs[order[end]]))
+            hyp_len = max(max_hyp_len, len(hyps[order[end]]))
+            if (
+                end > start
+                and (end - start + 1) * (ref_len + 1) * (hyp_len + 1)
+                > max_cells
+            ):
+                break
+            max_ref_len, max_hyp_len = ref_len, hyp_len
+            end += 1
+        index = order[start:end]
+        table = _batch_op_table(
+            [refs[k] for k in index], [hyps[k] for k in index]
+        )
+        edits, alignments = _batch_walk_back(
+            table,
+            np.array([len(refs[k]) for k in index]),
+            np.array([len(hyps[k]) for k in index]),
+            compute_alignments,
+        )
+        for k, utterance_edits, utterance_alignment in zip(
+            index, edits, alignments
+        ):
+            all_edits[k] = utterance_edits
+            all_alignments[k] = utterance_alignment
+        start = end
+    return all_edits, all_alignments
+
+
+def _token_ids(tokens, vocab):
+    """Maps the tokens of a sequence to integer ids, adding the new tokens
+    to the vocab dict."""
+    if hasattr(tokens, "tolist"):
+        tokens = tokens.tolist()
+    return np.array(
+        [vocab.setdefault(token, len(vocab)) for token in tokens],
+        dtype=np.int64,
+    )
+
+
+def _batch_op_table(refs, hyps):
+    """Solves the op tables (with codes instead of symbols, see op_table)
+    of a batch of pairs of token id sequences, padded to the same size.
+
+    Arguments
+    ---------
+    refs : list
+        Reference token id arrays.
+    hyps : list
+        Hypothesis token id arrays.
+
+    Returns
+    -------
+    numpy.ndarray
+        (batch, max ref length + 1, max hyp length + 1) The op tables.
+    """
+    batch_size = len(refs)
+    max_ref_len = max(len(ref) for ref in refs)
+    max_hyp_len = max(len(hyp) for hyp in hyps)
+    # Padding ids never match (the padded cells are not used anyway)
+    a = np.full((batch_size, max_ref_len), -1, dtype=np.int64)
+    b = np.full((batch_size, max_hyp_len), -2, dtype=np.int64)
+    for k, (ref, hyp) in enumerate(zip(refs, hyps)):
+        a[k, : len(ref)] = ref
+        b[k, : len(hyp)] = hyp
+
+    table = np.full(
+        (batch_size, max_ref_len + 1, max_hyp_len + 1), _EQ, dtype=np.uint8
+    )
+    table[:, 0, 1:] = _INS
+    table[:, 1:, 0] = _DEL
+    columns = np.arange(max_hyp_len + 1, dtype=np.int32)
+    prev_row = np.tile(columns, (batch_size, 1))
+    best = np.empty_like(prev_row)
+    for i in range(1, max_ref_len + 1):
+        substitution = a[:, i - 1 : i] != b
+        substitution_cost = prev_row[:, :-1] + substitution
+        deletion_cost = prev_row[:, 1:] + 1
+        # The insertions chain along the row: running minimum of
+        # cost[j'] + (j - j') over the best non-insertion costs cost[j']
+        best[:, 0] = i
+        np.minimum(substitution_cost, deletion_cost, out=best[:, 1:])
+        curr_row = np.minimum.accumulate(best - columns, axis=1) + columns
+        insertion_cost = curr_row[:, :-1] + 1
+        # Same tie-breaking as op_table
+        table[:, i, 1:] = np.where(
+            (substitution_cost < insertion_cost)
+            & (substitution_cost < deletion_cost),
+            np.where(substitution, _SUB, _EQ),
+            np.where(deletion_cost < insertion_cost, _DEL, _INS),
+        )
+        prev_row = curr_row
+    return table
+
+
+def _batch_walk_back(table, ref_lens, hyp_lens, compute_alignments=False):
+    """Walks back a batch of op tables, from the end of each sequence pair,
+    to count the edit operations and, optionally, find the alignments.
+
+    Arguments
+    ---------
+    table : numpy.ndarray
+        The op tables, from ``_batch_op_table``.
+    ref_lens : numpy.ndarray
+        The lengths of the reference sequences.
+    hyp_lens : numpy.ndarray
+        The lengths of the hypothesis sequences.
+    compute_alignments : bool
+        Whether to compute the alignments.
+
+    Returns
+    -------
+    list
+        The ``collections.Counter`` of edit operations of each pair.
+    list
+        The alignment of each pair (None if not computed).
+    """
+    batch_size = table.shape[0]
+    rows = np.arange(batch_size)
+    i, j = ref_lens.copy(), hyp_lens.copy()
+    counts = np.zeros((batch_size, 4), dtype=np.int64)
+    # The step at which each op is first seen, for the order of the keys
+    first_seen = np.full((batch_size, 4), np.iinfo(np.int64).max)
+    path = []
+    step = 0
+    while True:
+        active = (i > 0) | (j > 0)
+        if not active.any():
+            break
+        ops = np.where(active, table[rows, i, j], _NONE)
+        counts[rows, np.minimum(ops, 3)] += active
+        seen = active & (counts[rows, np.minimum(ops, 3)] == 1)
+        first_seen[rows[seen], ops[seen]] = step
+        i = i - ((ops == _DEL) | (ops == _SUB) | (ops == _EQ))
+        j = j - ((ops == _INS) | (ops == _SUB) | (ops == _EQ))
+        if compute_alignments:
+            path.append((ops, i.copy(), j.copy()))
+        step += 1
+
+    all_edits = []
+    for k in range(batch_size):
+        edits = collections.Counter()
+        for code in sorted((_INS, _DEL, _SUB), key=lambda c: first_seen[k, c]):
+            if counts[k, code] > 0:
+                edits[_CODE_KEYS[code]] = int(counts[k, code])
+        all_edits.append(edits)
+
+    all_alignments = [None] * batch_size
+    if compute_alignments:
+        for k in range(batch_size):
+            alignment = []
+            for ops, i, j in reversed(path):
+                op = ops[k]
+                if op == _NONE:
+                    continue
+                alignment.append(
+                    (
+                        _CODE_SYMBOLS[op],
+                        None if op == _INS else int(i[k]),
+                        None if op == _DEL else int(j[k]),
+                    )
+                )
+            all_alignments[k] = alignment
+    return all_edits, all_alignments
+
+
 def _batch_to_dict_format(ids, seqs):
     # Used by wer_details_for_batch
     return dict(zip(ids, seqs))
@@ -439,6 +673,8 @@ def wer_details_by_utterance(
         If scoring mode is 'strict' and a hypothesis is not found.
     """
     details_by_utterance = []
+    # The scored utterances, solved together at the end
+    scored_details, scored_refs, scored_hyps = [], [], []
     for key, ref_tokens in ref_dict.items():
         # Initialize utterance_details
         utterance_details = {
@@ -474,9 +710,18 @@ def wer_details_by_utterance(
             )
         else:
             raise ValueError("Invalid scoring mode: " + scoring_mode)
-        # Compute edits for this utterance
-        table = op_table(ref_tokens, hyp_tokens)
-        ops = count_ops(table)
+        details_by_utterance.append(utterance_details)
+        scored_details.append(utterance_details)
+        scored_refs.append(ref_tokens)
+        scored_hyps.append(hyp_tokens)
+
+    # Compute edits for the scored utterances
+    all_ops, alignments = batch_edit_ops(
+        scored_refs, scored_hyps, compute_alignments=compute_alignments
+    )
+    for utterance_details, ref_tokens, hyp_tokens, ops, utt_alignment in zip(
+        scored_details, scored_refs, scored_hyps, all_ops, alignments
+    ):
         # Update the utterance-level details if we got this far:
         utterance_details.update(
             {
@@ -490,12 +735,11 @@ def wer_details_by_utterance(
                 "insertions": ops["insertions"],
                 "deletions": ops["deletions"],
                 "substitutions": ops["substitutions"],
-                "alignment": alignment(table) if compute_alignments else None,
+                "alignment": utt_alignment,
                 "ref_tokens": ref_tokens if compute_alignments else None,
                 "hyp_tokens": hyp_tokens if compute_alignments else None,
             }
         )
-        details_by_utterance.append(utterance_details)
     return details_by_utterance
 
 
@@ -536,37 +780,104 @@ def wer_summary(details_by_utterance):
         insertions, deletions and substitutions. We
         aim to replicate Kaldi compute_wer numbers.
     """
-    # Build the summary details:
-    ins = dels = subs = 0
-    num_scored_tokens = (
-        num_scored_sents
-    ) = num_edits = num_erraneous_sents = num_absent_sents = num_ref_sents = 0
+    return wer_summary_from_counts(wer_counts(details_by_utterance))
+
+
+def wer_counts(details_by_utterance):
+    """
+    Computes the counts behind the summary stats (see ``wer_summary``)
+    from the output of details_by_utterance.
+
+    The counts of different sets of utterances can be summed, to get the
+    counts of their union, so that the summary stats of arbitrarily many
+    utterances can be computed incrementally, see
+    ``wer_summary_from_counts``.
+
+    Arguments
+    ---------
+    details_by_utterance : list
+        See the output of wer_details_by_utterance
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys of ``wer_summary``, except "WER" and "SER".
+
+    Example
+    -------
+    >>> details = wer_details_for_batch(
+    ...     ["utt1", "utt2"], [["a", "b"], ["c"]], [["a"], ["d"]]
+    ... )
+    >>> counts = wer_counts(details)
+    >>> counts["num_edits"], counts["deletions"], counts["substitutions"]
+    (2, 1, 1)
+    """
+    counts = {
+        "num_edits": 0,
+        "num_scored_tokens": 0,
+        "num_erraneous_sents": 0,
+        "num_scored_sents": 0,
+        "num_absent_sents": 0,
+        "num_ref_sents": 0,
+        "insertions": 0,
+        "deletions": 0,
+        "substitutions": 0,
+    }
     for dets in details_by_utterance:
-        num_ref_sents += 1
+        counts["num_ref_sents"] += 1
         if dets["scored"]:
-            num_scored_sents += 1
-            num_scored_tokens += dets["num_ref_tokens"]
-            ins += dets["insertions"]
-            dels += dets["deletions"]
-            subs += dets["substitutions"]
-            num_edits += dets["num_edits"]
+            counts["num_scored_sents"] += 1
+            counts["num_scored_tokens"] += dets["num_ref_tokens"]
+            counts["insertions"] += dets["insertions"]
+            counts["deletions"] += dets["deletions"]
+            counts["substitutions"] += dets["substitutions"]
+            counts["num_edits"] += dets["num_edits"]
             if dets["num_edits"] > 0:
-                num_erraneous_sents += 1
+                counts["num_erraneous_sents"] += 1
         if dets["hyp_absent"]:
-            num_absent_sents += 1
+            counts["num_absent_sents"] += 1
+    return counts
+
+
+def wer_summary_from_counts(counts):
+    """
+    Computes summary stats from the counts of wer_counts.
+
+    Arguments
+    ---------
+    counts : dict
+        See the output of wer_counts
+
+    Returns
+    -------
+    dict
+        See the output of wer_summary
+
+    Example
+    -------
+    >>> summary = wer_summary_from_counts(
+    ...     {
+    ...         "num_edits": 2,
+    ...         "num_scored_tokens": 3,
+    ...         "num_erraneous_sents": 2,
+    ...         "num_scored_sents": 2,
+    ...         "num_absent_sents": 0,
+    ...         "num_ref_sents": 2,
+    ...         "insertions": 0,
+    ...         "deletions": 1,
+    ...         "substitutions": 1,
+    ...     }
+    ... )
+    >>> round(summary["WER"], 2), summary["SER"]
+    (66.67, 100.0)
+    """
     wer_details = {
-        "WER": 100.0 * num_edits / num_scored_tokens,
-        "SER": 100.0 * num_erraneous_sents / num_scored_sents,
-        "num_edits": num_edits,
-        "num_scored_tokens": num_scored_tokens,
-        "num_erraneous_sents": num_erraneous_sents,
-        "num_scored_sents": num_scored_sents,
-        "num_absent_sents": num_absent_sents,
-        "num_ref_sents": num_ref_sents,
-        "insertions": ins,
-        "deletions": dels,
-        "substitutions": subs,
+        "WER": 100.0 * counts["num_edits"] / counts["num_scored_tokens"],
+        "SER": 100.0
+        * counts["num_erraneous_sents"]
+        / counts["num_scored_sents"],
     }
+    wer_details.update(counts)
     return wer_details
 
 
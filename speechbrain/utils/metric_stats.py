@@ -5,10 +5,17 @@ Authors:
  * Peter Plantinga 2020
  * Mirco Ravanelli 2020
 """
+import heapq
 import torch
+import concurrent.futures
 from joblib import Parallel, delayed
 from speechbrain.utils.data_utils import undo_padding
-from speechbrain.utils.edit_distance import wer_summary, wer_details_for_batch
+from speechbrain.utils.distributed import ddp_all_reduce_counts
+from speechbrain.utils.edit_distance import (
+    wer_counts,
+    wer_details_for_batch,
+    wer_summary_from_counts,
+)
 from speechbrain.dataio.dataio import merge_char, split_word
 from speechbrain.dataio.wer import print_wer_summary, print_alignments
 
@@ -204,6 +211,20 @@ class ErrorRateStats(MetricStats):
         this represents character to split on after merge.
         Used with ``split_tokens`` the sequence is joined with
         this token in between, and then the whole sequence is split.
+    incremental : bool
+        If True, the utterances are not stored: only the counts needed for
+        the summary are kept, with the details (and alignments) of the
+        keep_worst utterances with the most edits, in ``self.scores``.
+    keep_worst : int
+        The number of utterances with the most edits to keep, in
+        incremental mode.
+    n_jobs : int
+        If more than one, the batches are scored in the background, in a
+        pool of n_jobs worker processes, in incremental mode.
+    ddp_reduce : bool
+        If True, the counts are summed over all the DDP processes when
+        summarizing, to get the stats of the whole evaluation set. Then,
+        all the processes must call summarize.
 
     Example
     -------
@@ -225,13 +246,48 @@ class ErrorRateStats(MetricStats):
     0
     >>> stats['substitutions']
     1
+
+    In incremental mode, only the worst utterance is kept here:
+
+    >>> cer_stats = ErrorRateStats(incremental=True, keep_worst=1)
+    >>> cer_stats.append(
+    ...     ids=['utterance1', 'utterance2'],
+    ...     predict=[['a', 'b', 'b'], ['a', 'a']],
+    ...     target=[['a', 'b', 'a'], ['b', 'b']],
+    ... )
+    >>> cer_stats.summarize('WER')
+    60.0
+    >>> [details['key'] for details in cer_stats.scores]
+    ['utterance2']
     """
 
-    def __init__(self, merge_tokens=False, split_tokens=False, space_token="_"):
-        self.clear()
+    def __init__(
+        self,
+        merge_tokens=False,
+        split_tokens=False,
+        space_token="_",
+        incremental=False,
+        keep_worst=0,
+        n_jobs=1,
+        ddp_reduce=False,
+    ):
         self.merge_tokens = merge_tokens
         self.split_tokens = split_tokens
         self.space_token = space_token
+        self.incremental = incremental
+        self.keep_worst = keep_worst
+        self.n_jobs = n_jobs
+        self.ddp_reduce = ddp_reduce
+        self._pool = None
+        self.clear()
+
+    def clear(self):
+        """Creates empty containers for storage, removing existing stats."""
+        super().clear()
+        self.counts = wer_counts([])
+        self._worst = []
+        self._num_worst_candidates = 0
+        self._pending = []
 
     def append(
         self,
@@ -264,7 +320,8 @@ class ErrorRateStats(MetricStats):
             Callable that maps from indices to labels, operating on batches,
             for writing alignments.
         """
-        self.ids.extend(ids)
+        if not self.incremental:
+            self.ids.extend(ids)
 
         if predict_len is not None:
             predict = undo_padding(predict, predict_len)
@@ -284,16 +341,68 @@ class ErrorRateStats(MetricStats):
             predict = split_word(predict, space=self.space_token)
             target = split_word(target, space=self.space_token)
 
-        scores = wer_details_for_batch(ids, target, predict, True)
+        if not self.incremental:
+            scores = wer_details_for_batch(ids, target, predict, True)
+            self.scores.extend(scores)
+        elif self.n_jobs > 1:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(self.n_jobs)
+            self._pending.append(
+                self._pool.submit(
+                    _score_error_rate_batch,
+                    ids,
+                    target,
+                    predict,
+                    self.keep_worst,
+                )
+            )
+            # Accumulate the batches already scored (in order)
+            while self._pending and self._pending[0].done():
+                self._accumulate(*self._pending.pop(0).result())
+        else:
+            self._accumulate(
+                *_score_error_rate_batch(ids, target, predict, self.keep_worst)
+            )
 
-        self.scores.extend(scores)
+    def _accumulate(self, counts, worst):
+        """Adds the counts and the worst utterances of a batch."""
+        for key, value in counts.items():
+            self.counts[key] += value
+        for details in worst:
+            # Among utterances with as many edits, keep the earliest ones
+            self._num_worst_candidates += 1
+            heapq.heappush(
+                self._worst,
+                (details["num_edits"], -self._num_worst_candidates, details),
+            )
+            if len(self._worst) > self.keep_worst:
+                heapq.heappop(self._worst)
+
+    def _wait_pending(self):
+        """Waits for the batches scored in the background."""
+        for future in self._pending:
+            self._accumulate(*future.result())
+        self._pending = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
     def summarize(self, field=None):
         """Summarize the error_rate and return relevant statistics.
 
         * See MetricStats.summarize()
         """
-        self.summary = wer_summary(self.scores)
+        if self.incremental:
+            self._wait_pending()
+            counts = self.counts
+            self.scores = [
+                details for _, _, details in sorted(self._worst, reverse=True)
+            ]
+        else:
+            counts = wer_counts(self.scores)
+        if self.ddp_reduce:
+            counts = ddp_all_reduce_counts(counts)
+        self.summary = wer_summary_from_counts(counts)
 
         # Add additional, more generic key
         self.summary["error_rate"] = self.summary["WER"]
@@ -314,19 +423,85 @@ class ErrorRateStats(MetricStats):
         print_alignments(self.scores, filestream)
 
 
+def _score_error_rate_batch(ids, refs, hyps, keep_worst=0):
+    """Scores a batch for the incremental mode of ErrorRateStats.
+
+    Arguments
+    ---------
+    ids : list
+        The utterance ids.
+    refs : list
+        The reference sequences.
+    hyps : list
+        The hypothesis sequences.
+    keep_worst : int
+        The number of utterances with the most edits to return.
+
+    Returns
+    -------
+    dict
+        The counts of the batch, see ``wer_counts``.
+    list
+        The details, with alignments, of the keep_worst utterances with the
+        most edits in the batch.
+    """
+    details = wer_details_for_batch(ids, refs, hyps)
+    worst = sorted(
+        range(len(details)), key=lambda k: details[k]["num_edits"], reverse=True
+    )[:keep_worst]
+    worst_details = []
+    if worst:
+        # Only the alignments of the worst utterances are needed
+        worst_details = wer_details_for_batch(
+            [ids[k] for k in worst],
+            [refs[k] for k in worst],
+            [hyps[k] for k in worst],
+            compute_alignments=True,
+        )
+    return wer_counts(details), worst_details
+
+
 class BinaryMetricStats(MetricStats):
     """Tracks binary metrics, such as precision, recall, F1, EER, etc.
+
+    Arguments
+    ---------
+    positive_label : int
+        The label of the positive class.
+    num_bins : int
+        If given, the scores are not stored: they are counted on the fly in
+        num_bins bins, for arbitrarily large evaluations. The thresholds
+        (e.g., the EER one) are then searched among the bin edges.
+    score_range : tuple
+        The (min, max) range of the bins. Scores outside of it are counted
+        in the first or last bin.
+
+    Example
+    -------
+    >>> binary_stats = BinaryMetricStats(num_bins=100, score_range=(0, 1))
+    >>> binary_stats.append(
+    ...     ids=["utt1", "utt2", "utt3", "utt4"],
+    ...     scores=torch.tensor([0.1, 0.4, 0.8, 0.6]),
+    ...     labels=torch.tensor([0, 0, 1, 1]),
+    ... )
+    >>> binary_stats.summarize("DER")
+    0.0
     """
 
-    def __init__(self, positive_label=1):
-        self.clear()
+    def __init__(self, positive_label=1, num_bins=None, score_range=(-1, 1)):
         self.positive_label = positive_label
+        self.num_bins = num_bins
+        self.score_range = score_range
+        self.clear()
 
     def clear(self):
         self.ids = []
         self.scores = []
         self.labels = []
         self.summary = {}
+        if self.num_bins is not None:
+            self.positive_counts = torch.zeros(self.num_bins, dtype=torch.long)
+            self.negative_counts = torch.zeros(self.num_bins, dtype=torch.long)
 
     def append(self, ids, scores, labels):
         """Appends scores and labels to internal lists.
@@ -337,9 +512,29 @@ class BinaryMetricStats(MetricStats):
         Arguments
         ---------
         ids : list
-            The string ids for the samples
-
+            The string ids for the samples (not stored with num_bins).
+        scores : torch.Tensor
+            The scores of the samples.
+        labels : torch.Tensor
+            The labels of the samples.
         """
+        if self.num_bins is not None:
+            min_score, max_score = self.score_range
+            scores = scores.detach().flatten().cpu()
+            labels = labels.detach().flatten().cpu()
+            bins = (scores - min_score) * (
+                self.num_bins / (max_score - min_score)
+            )
+            bins = bins.floor().long().clamp(0, self.num_bins - 1)
+            positive = labels == self.positive_label
+            self.positive_counts += torch.bincount(
+                bins[positive], minlength=self.num_bins
+            )
+            self.negative_counts += torch.bincount(
+                bins[~positive], minlength=self.num_bins
+            )
+            return
+
         self.ids.extend(ids)
         self.scores.extend(scores.detach())
         self.labels.extend(labels.detach())
@@ -382,6 +577,12 @@ class BinaryMetricStats(MetricStats):
             A small value to avoid dividing by zero.
         """
 
+        if self.num_bins is not None:
+            TP, TN, FP, FN, threshold = self._binned_counts(threshold)
+            return self._summarize_counts(
+                field, TP, TN, FP, FN, threshold, beta, eps
+            )
+
         if isinstance(self.scores, list):
             self.scores = torch.stack(self.scores)
             self.labels = torch.stack(self.labels)
@@ -424,10 +625,65 @@ class BinaryMetricStats(MetricStats):
         pred = (self.scores >= threshold).float()
         true = self.labels
 
-        TP = self.summary["TP"] = float(pred.mul(true).sum())
-        TN = self.summary["TN"] = float((1.0 - pred).mul(1.0 - true).sum())
-        FP = self.summary["FP"] = float(pred.mul(1.0 - true).sum())
-        FN = self.summary["FN"] = float((1.0 - pred).mul(true).sum())
+        TP = float(pred.mul(true).sum())
+        TN = float((1.0 - pred).mul(1.0 - true).sum())
+        FP = float(pred.mul(1.0 - true).sum())
+        FN = float((1.0 - pred).mul(true).sum())
+
+        return self._summarize_counts(
+            field, TP, TN, FP, FN, threshold, beta, eps
+        )
+
+    def _binned_counts(self, threshold=None):
+        """Computes the TP, TN, FP, FN counts from the binned scores, at the
+        given threshold (rounded up to a bin edge) or at the EER threshold.
+
+        Arguments
+        ---------
+        threshold : float
+            If no threshold is provided, equal error rate is used.
+
+        Returns
+        -------
+        TP, TN, FP, FN : float
+            The counts at the threshold.
+        threshold : float
+            The threshold (a bin edge).
+        """
+        min_score, max_score = self.score_range
+        edges = torch.linspace(
+            min_score, max_score, self.num_bins + 1, dtype=torch.float64
+        )
+        # Number of scores below each edge (rejected with this threshold)
+        zero = torch.zeros(1, dtype=torch.long)
+        rejected_positives = torch.cat([zero, self.positive_counts.cumsum(0)])
+        rejected_negatives = torch.cat([zero, self.negative_counts.cumsum(0)])
+        n_positives = int(rejected_positives[-1])
+        n_negatives = int(rejected_negatives[-1])
+
+        if threshold is None:
+            FRR = rejected_positives.double() / max(n_positives, 1)
+            FAR = (n_negatives - rejected_negatives).double() / max(
+                n_negatives, 1
+            )
+            index = int((FAR - FRR).abs().argmin())
+        else:
+            index = int(torch.searchsorted(edges, float(threshold)))
+            index = min(index, self.num_bins)
+
+        FN = float(rejected_positives[index])
+        TN = float(rejected_negatives[index])
+        TP = n_positives - FN
+        FP = n_negatives - TN
+        return TP, TN, FP, FN, float(edges[index])
+
+    def _summarize_counts(self, field, TP, TN, FP, FN, threshold, beta, eps):
+        """Computes the statistics from the counts at a threshold,
+        see summarize()."""
+        self.summary["TP"] = TP
+        self.summary["TN"] = TN
+        self.summary["FP"] = FP
+        self.summary["FN"] = FN
 
         self.summary["FAR"] = FP / (FP + TN + eps)
         self.summary["FRR"] = FN / (TP + FN + eps)
@@ -471,31 +727,9 @@ def EER(positive_scores, negative_scores):
     0.0
     """
 
-    # Computing candidate thresholds
-    thresholds, _ = torch.sort(torch.cat([positive_scores, negative_scores]))
-    thresholds = torch.unique(thresholds)
-
-    # Adding intermediate thresholds
-    interm_thresholds = (thresholds[0:-1] + thresholds[1:]) / 2
-    thresholds, _ = torch.sort(torch.cat([thresholds, interm_thresholds]))
-
-    # Computing False Rejection Rate (miss detection)
-    positive_scores = torch.cat(
-        len(thresholds) * [positive_scores.unsqueeze(0)]
-    )
-    pos_scores_threshold = positive_scores.transpose(0, 1) <= thresholds
-    FRR = (pos_scores_threshold.sum(0)).float() / positive_scores.shape[1]
-    del positive_scores
-    del pos_scores_threshold
-
-    # Computing False Acceptance Rate (false alarm)
-    negative_scores = torch.cat(
-        len(thresholds) * [negative_scores.unsqueeze(0)]
+    thresholds, FAR, FRR = _threshold_error_rates(
+        positive_scores, negative_scores
     )
-    neg_scores_threshold = negative_scores.transpose(0, 1) > thresholds
-    FAR = (neg_scores_threshold.sum(0)).float() / negative_scores.shape[1]
-    del negative_scores
-    del neg_scores_threshold
 
     # Finding the threshold for EER
     min_index = (FAR - FRR).abs().argmin()
@@ -541,33 +775,56 @@ def minDCF(
     0.0
     """
 
+    thresholds, p_fa, p_miss = _threshold_error_rates(
+        positive_scores, negative_scores
+    )
+
+    c_det = c_miss * p_miss * p_target + c_fa * p_fa * (1 - p_target)
+    c_min, min_index = torch.min(c_det, dim=0)
+
+    return float(c_min), float(thresholds[min_index])
+
+
+def _threshold_error_rates(positive_scores, negative_scores):
+    """Computes the false acceptance and false rejection rates at the
+    candidate thresholds: the scores and the midpoints between them.
+
+    The rates are counted by binary search in the sorted scores, so
+    this takes O(N log N) time and O(N) memory for N scores.
+
+    Arguments
+    ---------
+    positive_scores : torch.tensor
+        The scores from entries of the same class.
+    negative_scores : torch.tensor
+        The scores from entries of different classes.
+
+    Returns
+    -------
+    thresholds : torch.tensor
+        The sorted candidate thresholds.
+    FAR : torch.tensor
+        The false acceptance rate (false alarm) at each threshold.
+    FRR : torch.tensor
+        The false rejection rate (miss detection) at each threshold.
+    """
     # Computing candidate thresholds
-    thresholds, _ = torch.sort(torch.cat([positive_scores, negative_scores]))
-    thresholds = torch.unique(thresholds)
+    thresholds = torch.unique(torch.cat([positive_scores, negative_scores]))
 
     # Adding intermediate thresholds
     interm_thresholds = (thresholds[0:-1] + thresholds[1:]) / 2
     thresholds, _ = torch.sort(torch.cat([thresholds, interm_thresholds]))
 
-    # Computing False Rejection Rate (miss detection)
-    positive_scores = torch.cat(
-        len(thresholds) * [positive_scores.unsqueeze(0)]
-    )
-    pos_scores_threshold = positive_scores.transpose(0, 1) <= thresholds
-    p_miss = (pos_scores_threshold.sum(0)).float() / positive_scores.shape[1]
-    del positive_scores
-    del pos_scores_threshold
-
-    # Computing False Acceptance Rate (false alarm)
-    negative_scores = torch.cat(
-        len(thresholds) * [negative_scores.unsqueeze(0)]
-    )
-    neg_scores_threshold = negative_scores.transpose(0, 1) > thresholds
-    p_fa = (neg_scores_threshold.sum(0)).float() / negative_scores.shape[1]
-    del negative_scores
-    del neg_scores_threshold
+    # Computing False Rejection Rate (scores <= threshold)
+    positive_scores, _ = torch.sort(positive_scores)
+    n_rejected = torch.searchsorted(positive_scores, thresholds, right=True)
+    FRR = n_rejected.float() / positive_scores.shape[0]
 
-    c_det = c_miss * p_miss * p_target + c_fa * p_fa * (1 - p_target)
-    c_min, min_index = torch.min(c_det, dim=0)
+    # Computing False Acceptance Rate (scores > threshold)
+    negative_scores, _ = torch.sort(negative_scores)
+    n_accepted = negative_scores.shape[0] - torch.searchsorted(
+        negative_scores, thresholds, right=True
+    )
+    FAR = n_accepted.float() / negative_scores.shape[0]
 
-    return float(c_min), float(thresholds[min_index])
+    return thresholds, FAR, FRR
@@ -125,3 +125,98 @@ def test_weird_arpa_formats():
     assert ngrams[2][("b",)]["a"] == -0.6931
     assert backoffs[1][("b",)] == 0.0
     assert list(backoffs[1].keys()) == [("b",)]
+
+
+def test_arpa_to_compiled_lm(tmpdir):
+    import gzip
+    import random
+    import numpy as np
+    from speechbrain.lm.arpa import read_arpa, arpa_to_compiled_lm
+    from speechbrain.lm.ngram import BackoffNgramLM, CompiledNgramLM
+
+    # A random trigram model, without an empty line before \end\
+    random.seed(1)
+    words = ["<s>", "</s>", "a", "b", "c", "d", "e"]
+    ngram_sets = {1: [(word,) for word in words]}
+    for order in [2, 3]:
+        ngram_sets[order] = list(
+            set(
+                random.choice(ngram_sets[order - 1]) + (random.choice(words),)
+                for _ in range(40)
+            )
+        )
+    arpa_path = str(tmpdir / "lm.arpa.gz")
+    with gzip.open(arpa_path, "wt") as f:
+        print("\\data\\", file=f)
+        for order, ngram_set in ngram_sets.items():
+            print(f"ngram {order}={len(ngram_set)}", file=f)
+        for order, ngram_set in ngram_sets.items():
+            print(f"\n\\{order}-grams:", file=f)
+            for ngram in ngram_set:
+                line = f"{-2 * random.random():.4f} {' '.join(ngram)}"
+                if order < 3:
+                    line += f" {-random.random():.4f}"
+                print(line, file=f)
+        print("\\end\\", file=f)
+    with gzip.open(arpa_path, "rt") as f:
+        _, ngrams, backoffs = read_arpa(f)
+
+    queries = [
+        (random.choice(words), tuple(random.choice(words) for _ in range(n)))
+        for n in [0, 1, 2] * 100
+    ]
+
+    def check(ngrams, backoffs, out_dir, **kwargs):
+        lm = BackoffNgramLM(ngrams, backoffs)
+        num_kept = arpa_to_compiled_lm(
+            arpa_path, out_dir, chunk_size=7, progress=False, **kwargs
+        )
+        assert num_kept == {
+            order: sum(map(len, ngrams[order].values())) for order in ngrams
+        }
+        compiled = CompiledNgramLM.load(out_dir)
+        expected = [lm.logprob(token, context) for token, context in queries]
+        logprobs = compiled.batch_logprob(*zip(*queries))
+        assert np.allclose(logprobs, expected, atol=1e-6)
+
+    check(ngrams, backoffs, tmpdir / "full")
+    # Pruning by order
+    bigram_backoffs = {1: backoffs[1], 2: backoffs[2]}
+    check(
+        {1: ngrams[1], 2: ngrams[2]}, bigram_backoffs, tmpdir / "2", max_order=2
+    )
+
+    # Pruning by threshold, also drops the N-grams with a dropped context
+    def prune(threshold):
+        pruned = {1: ngrams[1], 2: {}, 3: {}}
+        for order in [2, 3]:
+            for context, probs in ngrams[order].items():
+                if order == 3 and context[-1] not in pruned[2].get(
+                    context[:-1], {}
+                ):
+                    continue
+                kept = {
+                    token: p for token, p in probs.items() if p >= threshold
+                }
+                if kept:
+                    pruned[order][context] = kept
+        pruned_backoffs = {
+            1: backoffs[1],
+            2: {
+                ngram: backoff
+                for ngram, backoff in backoffs[2].items()
+                if ngram[-1] in pruned[2].get(ngram[:-1], {})
+            },
+        }
+        return pruned, pruned_backoffs
+
+    # Down to empty orders (0.0 drops all the bigrams and trigrams)
+    for threshold in [-1.0, -0.3, 0.0]:
+        pruned, pruned_backoffs = prune(threshold)
+        check(
+            pruned,
+            pruned_backoffs,
+            tmpdir / f"pruned{threshold}",
+            prune_threshold=threshold,
+        )
+    assert not prune(0.0)[0][2] and not prune(0.0)[0][3]
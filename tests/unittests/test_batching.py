@@ -32,6 +32,27 @@ def test_batch_pad_right_to(device):
         )
 
 
+def test_batch_pad_right_preallocated(device):
+    from speechbrain.utils.data_utils import batch_pad_right, pad_right_to
+
+    # Both the small (pad_sequence) and the large (preallocated) batches:
+    for max_len in [7, 20000]:
+        tensors = [
+            torch.randn(max_len, 3, device=device),
+            torch.randn(max_len // 2, 3, device=device),
+            torch.randn(max_len // 3, 3, device=device).half(),
+        ]
+        padded, lens = batch_pad_right(tensors, value=-1)
+        expected = torch.stack(
+            [pad_right_to(t, [max_len, 3], value=-1)[0] for t in tensors]
+        )
+        assert padded.dtype == torch.float32
+        assert torch.equal(padded, expected.float())
+        assert torch.equal(
+            lens, torch.tensor([t.shape[0] / max_len for t in tensors])
+        )
+
+
 def test_paddedbatch(device):
     from speechbrain.dataio.batch import PaddedBatch
 
@@ -79,3 +100,13 @@ def test_pin_memory():
     )
     batch.pin_memory()
     assert batch.foo.data.is_pinned()
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="Requires CUDA")
+def test_batch_pad_right_pinned():
+    from speechbrain.utils.data_utils import batch_pad_right
+
+    for max_len in [7, 20000]:
+        tensors = [torch.randn(max_len), torch.randn(max_len // 2)]
+        padded, _ = batch_pad_right(tensors, pin_memory=True)
+        assert padded.is_pinned()
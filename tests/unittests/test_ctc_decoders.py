@@ -0,0 +1,115 @@
+import torch
+
+
+def test_ctc_streaming_decode():
+    from speechbrain.decoders.ctc import CTCStreamingDecoder, ctc_greedy_decode
+
+    torch.manual_seed(0)
+    # Few tokens, so that there are repetitions across chunks
+    probs = torch.randn(4, 50, 3).softmax(-1)
+    lens = torch.tensor([1.0, 0.5, 0.82, 0.07])
+    hyps = ctc_greedy_decode(probs, lens, blank_id=0)
+    abs_lens = torch.round(lens * 50)
+    decoder = CTCStreamingDecoder(blank_id=0)
+    for chunk_size in [1, 3, 16, 50]:
+        for start in range(0, 50, chunk_size):
+            chunk = probs[:, start : start + chunk_size]
+            chunk_lens = (abs_lens - start).clamp(0, chunk.size(1))
+            partial_hyps = decoder.accept_chunk(
+                chunk, chunk_lens / chunk.size(1)
+            )
+            for partial_hyp, hyp in zip(partial_hyps, hyps):
+                assert hyp[: len(partial_hyp)] == partial_hyp
+        assert decoder.finalize() == hyps
+
+
+def test_ctc_prefix_scorer():
+    from speechbrain.decoders.ctc import CTCPrefixScorer
+
+    torch.manual_seed(0)
+    batch_size, max_len, vocab_size = 2, 30, 6
+    x = torch.randn(batch_size, max_len, vocab_size).log_softmax(-1)
+    enc_lens = torch.tensor([30, 21])
+    targets = torch.randint(1, vocab_size - 1, (batch_size, 5))
+    for partial in [False, True]:
+        scorer = CTCPrefixScorer(
+            x.clone(), enc_lens, batch_size, 1, 0, vocab_size - 1
+        )
+        state = None
+        for step in range(targets.size(1) + 1):
+            g = targets[:, :step]
+            candidates = None
+            if partial:
+                candidates = torch.arange(1, vocab_size).repeat(batch_size, 1)
+            scores, memory = scorer.forward_step(g, state, candidates)
+            # The eos score is the probability of the whole prefix
+            if step > 0:
+                eos_logp = state[1][:, 0] + scores[:, vocab_size - 1]
+                ctc_logp = -torch.nn.functional.ctc_loss(
+                    x.transpose(0, 1),
+                    g,
+                    enc_lens,
+                    torch.full((batch_size,), step),
+                    reduction="none",
+                )
+                assert torch.allclose(eos_logp, ctc_logp, atol=1e-4)
+            if step < targets.size(1):
+                state = scorer.permute_mem(memory, targets[:, step : step + 1])
+
+
+def test_ctc_prefix_beam_search():
+    import itertools
+    from speechbrain.decoders.ctc import CTCPrefixBeamSearcher
+
+    torch.manual_seed(0)
+    batch_size, max_len, vocab_size = 3, 5, 3
+    log_probs = torch.randn(batch_size, max_len, vocab_size).log_softmax(-1)
+    lens = torch.tensor([1.0, 0.8, 0.6])
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0, beam_size=100, token_threshold=float("-inf")
+    )
+    hyps = searcher(log_probs, lens)
+    # The best label sequence by CTC probability, by brute force
+    for i in range(batch_size):
+        length = int(round(lens[i].item() * max_len))
+        best_score, best_hyp = float("-inf"), None
+        for hyp_len in range(length + 1):
+            for hyp in itertools.product(range(1, vocab_size), repeat=hyp_len):
+                score = -torch.nn.functional.ctc_loss(
+                    log_probs[i : i + 1, :length].transpose(0, 1),
+                    torch.tensor([hyp], dtype=torch.long),
+                    torch.tensor([length]),
+                    torch.tensor([hyp_len]),
+                    reduction="sum",
+                )
+                if score > best_score:
+                    best_score, best_hyp = score, list(hyp)
+        assert hyps[i] == best_hyp
+
+
+def test_ctc_prefix_beam_search_lm():
+    from speechbrain.decoders.ctc import CTCPrefixBeamSearcher
+    from speechbrain.lm.ngram import BackoffNgramLM
+
+    vocab_list = ["-", " ", "a", "b"]
+    # "a" or "b", then "a"
+    probs = torch.tensor(
+        [[[0.1, 0.0, 0.4, 0.5], [0.1, 0.9, 0.0, 0.0], [0.1, 0.0, 0.9, 0.0]]]
+    )
+    lens = torch.tensor([1.0])
+    searcher = CTCPrefixBeamSearcher(blank_index=0, vocab_list=vocab_list)
+    assert searcher(probs.log(), lens) == [[3, 1, 2]]
+    ngrams = {
+        1: {tuple(): {"a": -0.3, "b": -0.3, "</s>": -0.3}},
+        2: {("<s>",): {"a": -0.1, "b": -2.0}},
+    }
+    lm = BackoffNgramLM(ngrams, {1: {("<s>",): 0.0}})
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0, vocab_list=vocab_list, lm=lm, lm_weight=1.0
+    )
+    assert searcher(probs.log(), lens) == [[2, 1, 2]]
+    # Words out of the lexicon are not allowed
+    searcher = CTCPrefixBeamSearcher(
+        blank_index=0, vocab_list=vocab_list, lexicon=["b"]
+    )
+    assert searcher(probs.log(), lens) == [[3, 1]]
@@ -68,3 +68,112 @@ def test_read_audio_multichannel(tmpdir, device):
         #         ),
         #     )
         # )
+
+
+def test_audio_archive(tmpdir):
+    import pickle
+    from speechbrain.dataio.dataio import read_audio, write_audio
+    from speechbrain.dataio.archive import write_audio_archive, AudioArchive
+
+    mono = os.path.join(tmpdir, "mono.wav")
+    stereo = os.path.join(tmpdir, "stereo.wav")
+    write_audio(mono, torch.rand(16000), 16000)
+    write_audio(stereo, torch.rand(8000, 2), 16000)
+    data = {
+        "utt1": {"wav": mono},
+        "utt2": {"wav": {"file": stereo, "start": 100, "stop": 4000}},
+        "utt3": {"wav": {"file": mono, "start": 8000, "stop": 12000}},
+    }
+    # Small shards, so that each file goes in its own shard:
+    write_audio_archive(data, tmpdir / "archive", max_shard_bytes=1000)
+    archive = AudioArchive(tmpdir / "archive")
+    assert len(archive) == 2
+    assert archive.num_shards == 2
+    for data_id, data_point in data.items():
+        expected = read_audio(data_point["wav"])
+        assert torch.equal(archive.read_audio(data_point["wav"]), expected)
+        assert torch.equal(archive.read_id(data_id), expected)
+    # The memory maps are not pickled, but re-opened:
+    unpickled = pickle.loads(pickle.dumps(archive))
+    assert torch.equal(unpickled.read_id("utt3"), archive.read_id("utt3"))
+
+
+def test_feature_archive(tmpdir):
+    from speechbrain.lobes.features import Fbank
+    from speechbrain.dataio.archive import write_feature_archive, FeatureArchive
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.batch import PaddedBatch
+
+    signals = {f"utt{i}": torch.rand(4000 * (i + 1)) for i in range(4)}
+    data = {data_id: {"wav": data_id} for data_id in signals}
+    compute_features = Fbank(n_mels=20)
+    write_feature_archive(
+        data,
+        tmpdir / "features",
+        compute_features,
+        audio_reader=signals.get,
+        num_workers=2,
+        max_shard_bytes=10000,
+    )
+    archive = FeatureArchive(tmpdir / "features")
+    assert archive.num_shards > 1
+    for data_id, signal in signals.items():
+        expected = compute_features(signal.unsqueeze(0))[0]
+        assert archive.num_frames(data_id) == expected.shape[0]
+        assert torch.allclose(archive.read_id(data_id), expected)
+    assert torch.equal(
+        archive.read_id("utt1", 10, 20), archive.read_id("utt1")[10:20]
+    )
+
+    dataset = DynamicItemDataset(data)
+    dataset.add_dynamic_item(archive.dynamic_item())
+    dataset.set_output_keys(["id", "feats"])
+    batch = PaddedBatch([dataset[0], dataset[3]])
+    assert batch.feats.data.shape == (2, archive.num_frames("utt3"), 20)
+    assert torch.allclose(batch.feats.lengths[0], torch.tensor(26 / 101))
+
+
+def test_audio_cache(tmpdir):
+    from speechbrain.dataio.dataio import write_audio
+    from speechbrain.dataio.preprocess import AudioCache, AudioNormalizer
+
+    wavfile = os.path.join(tmpdir, "wave.wav")
+    write_audio(wavfile, torch.rand(16000), 16000)
+    cache = AudioCache()
+    normalizer = AudioNormalizer(sample_rate=8000)
+    audio = cache.load(wavfile, normalizer)
+    assert audio.shape == (8000,)
+    # Returned copies can be modified without touching the cache
+    audio.zero_()
+    assert cache.load(wavfile, normalizer).abs().sum() > 0
+    assert cache.hits == 1 and cache.misses == 1
+    # Another target format is cached separately
+    assert cache.load(wavfile, AudioNormalizer()).shape == (16000,)
+    assert cache.misses == 2
+    # A changed file is decoded again
+    write_audio(wavfile, torch.rand(4000), 16000)
+    stat = os.stat(wavfile)
+    os.utime(wavfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(wavfile, normalizer).shape == (2000,)
+    assert cache.misses == 3
+
+
+def test_resampler_per_thread():
+    from concurrent.futures import ThreadPoolExecutor
+    from speechbrain.dataio.preprocess import AudioNormalizer
+
+    normalizer = AudioNormalizer(sample_rate=8000)
+    # Resamplers are shared between normalizers of the same thread
+    assert AudioNormalizer()._cached_resample(
+        16000, 8000
+    ) is normalizer._cached_resample(16000, 8000)
+    # But not between threads, and they are initialized concurrently:
+    signals = [torch.rand(16000) for _ in range(8)]
+    expected = [normalizer(signal, 16000) for signal in signals]
+    with ThreadPoolExecutor(4) as executor:
+        other = executor.submit(normalizer._cached_resample, 16000, 8000)
+        assert other.result() is not normalizer._cached_resample(16000, 8000)
+        outputs = list(
+            executor.map(lambda x: AudioNormalizer(8000)(x, 16000), signals)
+        )
+    assert all(torch.equal(x, y) for x, y in zip(outputs, expected))
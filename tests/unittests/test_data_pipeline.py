@@ -1,3 +1,4 @@
+import os
 import pytest
 
 
@@ -155,3 +156,67 @@ def test_MIMO_pipeline():
         ["message"], {"text": "abc", "other-text": "def"}
     )
     assert result["message"] == "hello-world, abc"
+
+
+def test_cached_dynamic_item(tmpdir):
+    from speechbrain.utils.data_pipeline import DataPipeline
+    from speechbrain.utils.cache import DiskCache
+    from unittest.mock import MagicMock
+
+    store = DiskCache(tmpdir, max_ram_bytes=1000)
+    watcher = MagicMock(side_effect=lambda x: x.upper())
+    pipeline = DataPipeline(["text"], output_keys=["upper"])
+    pipeline.add_dynamic_item(watcher, "text", "upper", cache=store)
+    for epoch in range(3):
+        assert pipeline({"text": "foo"}) == {"upper": "FOO"}
+        assert pipeline({"text": "bar"}) == {"upper": "BAR"}
+    assert watcher.call_count == 2
+    assert store.hits == 4 and store.misses == 2
+    # The values persist on disk, so a new store reuses them:
+    store = DiskCache(tmpdir)
+    pipeline = DataPipeline(["text"], output_keys=["upper"])
+    pipeline.add_dynamic_item(watcher, "text", "upper", cache=store)
+    assert pipeline({"text": "bar"}) == {"upper": "BAR"}
+    assert watcher.call_count == 2
+    # Size bound:
+    store = DiskCache(tmpdir / "bounded", max_bytes=1)
+    store.put("a", "foo")
+    store.put("b", "bar")
+    assert store.get("a") is None
+    assert store.get("b") == "bar"
+    with pytest.raises(ValueError):
+        pipeline.add_dynamic_item(lambda x: (yield x), "text", "gen", store)
+    # Numpy values, and unreadable entries are misses:
+    import numpy as np
+
+    store = DiskCache(tmpdir / "numpy")
+    store.put("a", np.arange(3))
+    assert (DiskCache(tmpdir / "numpy").get("a") == np.arange(3)).all()
+    with open(store._path("a"), "wb") as fo:
+        fo.write(b"truncated")
+    assert store.get("a") is None
+    assert store.misses == 1
+    assert not os.path.exists(store._path("a"))
+
+
+def test_function_digest():
+    from speechbrain.utils.data_pipeline import _function_digest, DynamicItem
+
+    def make_scaler(scale):
+        return lambda x: x * scale
+
+    # Closure values are part of the digest
+    assert _function_digest(make_scaler(2)) == _function_digest(make_scaler(2))
+    assert _function_digest(make_scaler(2)) != _function_digest(make_scaler(3))
+    # And so are the globals
+    namespace = {"SCALE": 2}
+    exec("def scale(x):\n    return x * SCALE", namespace)
+    digest = _function_digest(namespace["scale"])
+    namespace["SCALE"] = 3
+    assert _function_digest(namespace["scale"]) != digest
+    # The explicit version
+    keys = [
+        DynamicItem(func=namespace["scale"], cache_version=v)._cache_key((1,))
+        for v in [None, None, 1]
+    ]
+    assert keys[0] == keys[1] != keys[2]
@@ -85,3 +85,112 @@ def test_looped_loader(tmpdir):
     next(new_data_iterator)
     with pytest.raises(StopIteration):
         next(new_data_iterator)
+
+
+def _write_tar_shards(tmpdir, num_shards, per_shard):
+    import io
+    import json
+    import tarfile
+
+    shards = []
+    for shard in range(num_shards):
+        path = str(tmpdir / f"shard-{shard}.tar")
+        with tarfile.open(path, "w") as tar:
+            for i in range(per_shard):
+                data_id = f"utt-{shard}-{i}"
+                for name, content in [
+                    (data_id + ".json", json.dumps({"n": i}).encode()),
+                    (data_id + ".txt", data_id.upper().encode()),
+                ]:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(content)
+                    tar.addfile(info, io.BytesIO(content))
+        shards.append(path)
+    return shards
+
+
+def test_iterable_dynamic_item_dataset(tmpdir):
+    from speechbrain.dataio.dataset import IterableDynamicItemDataset
+    from speechbrain.dataio.dataloader import make_dataloader
+
+    shards = _write_tar_shards(tmpdir, num_shards=4, per_shard=5)
+    all_ids = {f"utt-{shard}-{i}" for shard in range(4) for i in range(5)}
+    dataset = IterableDynamicItemDataset(
+        shards,
+        output_keys=["id", "txt", "n"],
+        shuffle_shards=True,
+        shuffle_buffer=3,
+    )
+    data_points = list(dataset)
+    assert {data_point["id"] for data_point in data_points} == all_ids
+    assert all(dp["txt"] == dp["id"].upper() for dp in data_points)
+    dataset.set_epoch(1)
+    assert [dp["id"] for dp in dataset] != [dp["id"] for dp in data_points]
+
+    # Shards are split over the workers:
+    for num_workers in [0, 2, 3]:
+        loader = make_dataloader(dataset, batch_size=2, num_workers=num_workers)
+        ids = [data_id for batch in loader for data_id in batch.id]
+        assert sorted(ids) == sorted(all_ids)
+
+
+def test_iterable_dynamic_item_dataset_recovery(tmpdir):
+    from speechbrain.dataio.dataset import IterableDynamicItemDataset
+    from speechbrain.dataio.dataloader import make_dataloader
+
+    shards = _write_tar_shards(tmpdir, num_shards=4, per_shard=5)
+    save_file = tmpdir + "/dataloader.ckpt"
+    for num_workers in [0, 2]:
+        dataset = IterableDynamicItemDataset(shards, output_keys=["id"])
+        loader = make_dataloader(dataset, batch_size=2, num_workers=num_workers)
+        seen = []
+        for i, batch in enumerate(loader):
+            seen.extend(batch.id)
+            if i == 3:
+                loader._speechbrain_save(save_file)
+                break
+        del loader
+        # Recover in a new loader, the epoch continues where it was:
+        dataset = IterableDynamicItemDataset(shards, output_keys=["id"])
+        loader = make_dataloader(dataset, batch_size=2, num_workers=num_workers)
+        loader._speechbrain_load(save_file, end_of_epoch=False, device=None)
+        seen.extend(data_id for batch in loader for data_id in batch.id)
+        assert len(seen) == len(set(seen)) == 20
+        # And the next epoch is complete:
+        assert len([data_id for batch in loader for data_id in batch.id]) == 20
+
+
+def test_prefetch_loader(tmpdir, device):
+    from speechbrain.dataio.dataloader import (
+        SaveableDataLoader,
+        PrefetchLoader,
+    )
+
+    save_file = tmpdir + "/dataloader.ckpt"
+    dataset = torch.arange(10)
+    loader = PrefetchLoader(
+        SaveableDataLoader(dataset, batch_size=2), 3, device=device
+    )
+    assert len(loader) == 5
+    batches = list(loader)
+    assert all(
+        batch.device.type == torch.device(device).type for batch in batches
+    )
+    assert torch.equal(torch.cat(batches).cpu(), dataset)
+
+    # The position saved is the one of the consumer, not of the prefetching:
+    data_iterator = iter(loader)
+    assert next(data_iterator).tolist() == [0, 1]
+    loader._speechbrain_save(save_file)
+    del data_iterator
+    new_loader = PrefetchLoader(SaveableDataLoader(dataset, batch_size=2), 3)
+    new_loader._speechbrain_load(save_file, end_of_epoch=False, device=None)
+    assert next(iter(new_loader)).tolist() == [2, 3]
+
+    # Errors in loading are raised in the consumer:
+    def failing():
+        yield 1
+        raise ValueError("Loading failed")
+
+    with pytest.raises(ValueError):
+        list(PrefetchLoader(failing()))
@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_dynamic_item_dataset():
     from speechbrain.dataio.dataset import DynamicItemDataset
     import operator
@@ -86,3 +89,92 @@ def test_filtered_sorted_dynamic_item_dataset():
         key_max_value={"foo": 1}, sort_key="foo", reverse=True
     )
     assert subset[0]["id"] == "utt2"
+
+
+def test_columnar_dynamic_item_dataset(tmpdir):
+    from speechbrain.dataio.dataset import DynamicItemDataset
+    from speechbrain.dataio.columnar import load_data_csv_columnar
+    from speechbrain.dataio.dataio import load_data_csv
+
+    csv_path = tmpdir / "data.csv"
+    with open(csv_path, "w") as fo:
+        fo.write("ID, duration, wav, spk\n")
+        for i in range(50):
+            duration = (i * 7) % 13 / 2
+            fo.write(f"utt{i}, {duration}, $root/utt{i}.wav, spk{i % 3}\n")
+        # Only \n and \r\n end lines:
+        fo.write("utt50, 1.0, $root/a\x85b\u2028c.wav, spk0\r\n")
+    reference = load_data_csv(csv_path, {"root": "/data"})
+    for num_workers in [1, 3]:
+        data = load_data_csv_columnar(csv_path, {"root": "/data"}, num_workers)
+        assert list(data) == list(reference)
+        assert all(data[data_id] == reference[data_id] for data_id in data)
+    # Replacements containing newlines keep the rows aligned
+    newline_data = load_data_csv_columnar(csv_path, {"root": "/da\nta"})
+    newline_reference = load_data_csv(csv_path, {"root": "/da\nta"})
+    assert all(
+        newline_data[data_id] == newline_reference[data_id]
+        for data_id in newline_reference
+    )
+
+    dataset = DynamicItemDataset(reference)
+    columnar = DynamicItemDataset(data)
+    for kwargs in [
+        {"sort_key": "duration"},
+        {"sort_key": "duration", "reverse": True, "select_n": 10},
+        {"key_min_value": {"duration": 1.0}, "key_max_value": {"duration": 5}},
+        {
+            "key_test": {"spk": lambda spk: spk != "spk1"},
+            "sort_key": "duration",
+        },
+    ]:
+        expected = dataset.filtered_sorted(**kwargs)
+        filtered = columnar.filtered_sorted(**kwargs)
+        assert list(filtered.data_ids) == expected.data_ids
+        filtered.set_output_keys(["id", "wav"])
+        expected.set_output_keys(["id", "wav"])
+        assert list(filtered) == list(expected)
+
+
+def test_columnar_data(tmpdir):
+    import pickle
+    import numpy as np
+    from speechbrain.dataio.columnar import (
+        ColumnarData,
+        StringColumn,
+        CategoricalColumn,
+    )
+
+    data = {
+        f"utt{i}": {
+            "spk": f"spk{i % 4}",
+            "wrd": f"wörds number {i}",
+            "length": i,
+            "extra": {"n": i},
+        }
+        for i in range(20)
+    }
+    columnar = ColumnarData.from_dict(data)
+    assert isinstance(columnar.column("spk"), CategoricalColumn)
+    assert isinstance(columnar.column("wrd"), StringColumn)
+    assert isinstance(columnar.column("length"), np.ndarray)
+    assert list(columnar) == list(data)
+    assert all(columnar[data_id] == data[data_id] for data_id in data)
+    assert (
+        "utt3" in columnar and "utt30" not in columnar and "ut" not in columnar
+    )
+    assert columnar.index_of(["utt7", "utt1"]).tolist() == [7, 1]
+    with pytest.raises(KeyError):
+        columnar.index_of(["utt7", "utt100"])
+    with pytest.raises(ValueError):
+        ColumnarData(["a", "b", "a"], {"x": [1, 2, 3]})
+    for other in [{"x": 2}, {"x": 2, "y": 3, "z": 4}]:
+        with pytest.raises(ValueError, match="Data point b"):
+            ColumnarData.from_dict({"a": {"x": 1, "y": 1}, "b": other})
+
+    columnar.save(tmpdir / "data")
+    for mmap in [True, False]:
+        loaded = ColumnarData.load(tmpdir / "data", mmap=mmap)
+        assert all(loaded[data_id] == data[data_id] for data_id in data)
+        unpickled = pickle.loads(pickle.dumps(loaded))
+        assert all(unpickled[data_id] == data[data_id] for data_id in data)
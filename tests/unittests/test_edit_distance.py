@@ -60,3 +60,38 @@ def test_count_ops():
     assert count_ops(table)["insertions"] == 0
     assert count_ops(table)["deletions"] == 0
     assert count_ops(table)["substitutions"] == 1
+
+
+def test_batch_edit_ops():
+    import random
+    from speechbrain.utils.edit_distance import (
+        op_table,
+        count_ops,
+        alignment,
+        batch_edit_ops,
+    )
+
+    random.seed(0)
+    # A small vocabulary, for many ties in the op tables
+    refs = [
+        [random.choice("abc") for _ in range(random.randint(0, 12))]
+        for _ in range(200)
+    ]
+    hyps = [
+        [random.choice("abcd") for _ in range(random.randint(0, 12))]
+        for _ in range(200)
+    ]
+    edits, alignments = batch_edit_ops(
+        refs, hyps, compute_alignments=True, max_cells=2000
+    )
+    for ref, hyp, utt_edits, utt_alignment in zip(
+        refs, hyps, edits, alignments
+    ):
+        table = op_table(ref, hyp)
+        expected = count_ops(table)
+        assert utt_edits == expected
+        assert list(utt_edits) == list(expected)
+        assert utt_alignment == alignment(table)
+    edits, alignments = batch_edit_ops(refs, hyps)
+    assert alignments == [None] * len(refs)
+    assert edits == [count_ops(op_table(r, h)) for r, h in zip(refs, hyps)]
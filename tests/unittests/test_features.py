@@ -119,6 +119,47 @@ def test_input_normalization(device):
     assert torch.equal(out_norm, target)
 
 
+def test_input_normalization_stats(device):
+
+    from speechbrain.processing.features import InputNormalization
+
+    torch.manual_seed(0)
+    inputs = torch.randn([6, 30, 4], device=device)
+    inp_len = torch.tensor([1.0, 0.5, 0.8, 0.3, 1.0, 0.6], device=device)
+    spk_ids = torch.tensor([[2], [0], [2], [5], [2], [0]], device=device)
+
+    # Sentence statistics, computed one sentence at a time
+    means, stds = [], []
+    for x, length in zip(inputs, inp_len):
+        frames = x[: int(torch.round(length * x.shape[0]))]
+        means.append(frames.mean(dim=0))
+        stds.append(frames.std(dim=0))
+
+    norm = InputNormalization(norm_type="sentence").to(device)
+    output = norm(inputs, inp_len)
+    for k in range(len(inputs)):
+        target = (inputs[k] - means[k]) / stds[k]
+        assert torch.allclose(output[k], target, atol=1e-5)
+
+    # Speaker statistics: running averages over the sentences, in order
+    norm = InputNormalization(norm_type="speaker").to(device)
+    output = norm(inputs, inp_len, spk_ids)
+    for k in range(len(inputs)):
+        same = [i for i in range(k + 1) if spk_ids[i] == spk_ids[k]]
+        mean = torch.stack([means[i] for i in same]).mean(dim=0)
+        std = torch.stack([stds[i] for i in same]).mean(dim=0)
+        target = (inputs[k] - mean) / std
+        assert torch.allclose(output[k], target, atol=1e-5)
+    assert norm._statistics_dict()["spk_dict_count"] == {0: 2, 2: 3, 5: 1}
+
+    # Unseen speakers use the sentence statistics at inference
+    norm.eval()
+    output = norm(inputs, inp_len, torch.tensor([[7]] * 6, device=device))
+    assert torch.allclose(
+        output[0], (inputs[0] - means[0]) / stds[0], atol=1e-5
+    )
+
+
 def test_features_multimic(device):
 
     from speechbrain.processing.features import Filterbank
@@ -48,6 +48,52 @@ def test_error_rate_stats(device):
     assert wer_stats.scores[0]["hyp_tokens"] == ["the", "world", "hello"]
 
 
+def test_error_rate_stats_incremental(tmpdir):
+    import random
+    from speechbrain.utils.metric_stats import ErrorRateStats
+
+    random.seed(0)
+    batches = []
+    for b in range(10):
+        ids = [f"utt{b}_{k}" for k in range(8)]
+        refs = [
+            [random.choice("abc") for _ in range(random.randint(1, 10))]
+            for _ in ids
+        ]
+        hyps = [
+            [random.choice("abc") for _ in range(random.randint(0, 10))]
+            for _ in ids
+        ]
+        batches.append((ids, hyps, refs))
+
+    wer_stats = ErrorRateStats()
+    incremental_stats = ErrorRateStats(incremental=True, keep_worst=5)
+    parallel_stats = ErrorRateStats(incremental=True, keep_worst=5, n_jobs=2)
+    for ids, hyps, refs in batches:
+        for stats in (wer_stats, incremental_stats, parallel_stats):
+            stats.append(ids=ids, predict=hyps, target=refs)
+    summary = wer_stats.summarize()
+    assert incremental_stats.summarize() == summary
+    assert parallel_stats.summarize() == summary
+    assert incremental_stats.ids == []
+
+    worst = sorted(wer_stats.scores, key=lambda d: -d["num_edits"])[:5]
+    assert incremental_stats.scores == worst
+    assert parallel_stats.scores == worst
+
+    # Reduction over a single process group
+    torch.distributed.init_process_group(
+        "gloo", init_method=f"file://{tmpdir}/ddp_init", rank=0, world_size=1
+    )
+    try:
+        ddp_stats = ErrorRateStats(incremental=True, ddp_reduce=True)
+        for ids, hyps, refs in batches:
+            ddp_stats.append(ids=ids, predict=hyps, target=refs)
+        assert ddp_stats.summarize() == summary
+    finally:
+        torch.distributed.destroy_process_group()
+
+
 def test_binary_metrics(device):
     from speechbrain.utils.metric_stats import BinaryMetricStats
 
@@ -70,6 +116,67 @@ def test_binary_metrics(device):
     assert summary["threshold"] >= 0.1 and summary["threshold"] < 0.2
 
 
+def test_binary_metrics_binned(device):
+    from speechbrain.utils.metric_stats import BinaryMetricStats
+
+    torch.manual_seed(0)
+    scores = torch.cat([torch.rand(500) * 0.8 + 0.2, torch.rand(500) * 0.8])
+    labels = torch.cat([torch.ones(500), torch.zeros(500)])
+    exact_stats = BinaryMetricStats()
+    binned_stats = BinaryMetricStats(num_bins=1000, score_range=(0, 1))
+    for i in range(0, 1000, 100):
+        ids = [f"utt{j}" for j in range(i, i + 100)]
+        batch_scores = scores[i : i + 100].to(device)
+        batch_labels = labels[i : i + 100].to(device)
+        exact_stats.append(ids, batch_scores, batch_labels)
+        binned_stats.append(ids, batch_scores, batch_labels)
+    assert binned_stats.scores == []
+
+    exact = exact_stats.summarize()
+    binned = binned_stats.summarize()
+    assert abs(binned["threshold"] - exact["threshold"]) < 0.01
+    assert abs(binned["DER"] - exact["DER"]) < 0.01
+    assert binned["TP"] + binned["FN"] == 500
+
+    binned = binned_stats.summarize(threshold=0.5)
+    exact = exact_stats.summarize(threshold=0.5)
+    for key in ["TP", "TN", "FP", "FN"]:
+        assert binned[key] == exact[key]
+
+
+def test_EER_minDCF_parity(device):
+    from speechbrain.utils.metric_stats import EER, minDCF
+
+    def reference_error_rates(positive_scores, negative_scores):
+        thresholds = torch.unique(torch.cat([positive_scores, negative_scores]))
+        interm_thresholds = (thresholds[0:-1] + thresholds[1:]) / 2
+        thresholds, _ = torch.sort(torch.cat([thresholds, interm_thresholds]))
+        FRR = (positive_scores.unsqueeze(1) <= thresholds).float().mean(0)
+        FAR = (negative_scores.unsqueeze(1) > thresholds).float().mean(0)
+        return thresholds, FAR, FRR
+
+    torch.manual_seed(0)
+    for quantize in [False, True]:
+        positive_scores = torch.randn(300, device=device) + 1.5
+        negative_scores = torch.randn(700, device=device)
+        if quantize:
+            # Many ties between the scores
+            positive_scores = (positive_scores * 4).round() / 4
+            negative_scores = (negative_scores * 4).round() / 4
+        thresholds, FAR, FRR = reference_error_rates(
+            positive_scores, negative_scores
+        )
+        index = (FAR - FRR).abs().argmin()
+        eer, threshold = EER(positive_scores, negative_scores)
+        assert math.isclose(eer, float(FAR[index] + FRR[index]) / 2)
+        assert threshold == float(thresholds[index])
+
+        c_det = 0.01 * FRR + 0.99 * FAR
+        min_dcf, threshold = minDCF(positive_scores, negative_scores)
+        assert math.isclose(min_dcf, float(c_det.min()), rel_tol=1e-5)
+        assert threshold == float(thresholds[c_det.argmin()])
+
+
 def test_EER(device):
     from speechbrain.utils.metric_stats import EER
 
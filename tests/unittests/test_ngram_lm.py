@@ -24,3 +24,104 @@ def test_backofff_ngram_lm():
     assert lm.logprob("c", ()) == float("-inf")
     # OOV in context:
     assert lm.logprob("a", ("c",)) == HALF
+
+
+def test_compiled_ngram_lm(tmpdir):
+    import io
+    import random
+    import collections
+    import numpy as np
+    from speechbrain.lm.arpa import read_arpa
+    from speechbrain.lm.counting import ngrams_for_evaluation
+    from speechbrain.lm.ngram import (
+        BackoffNgramLM,
+        CompiledNgramLM,
+        ngram_evaluation_details,
+        ngram_perplexity,
+    )
+
+    # A random trigram model, with all the backoff cases
+    random.seed(0)
+    words = ["<s>", "</s>", "a", "b", "c", "d"]
+    lines = collections.defaultdict(list)
+    for order in range(1, 4):
+        for ngram in set(
+            tuple(random.choice(words[1:]) for _ in range(order))
+            if order == 1 or random.random() < 0.7
+            else ("<s>",)
+            + tuple(random.choice(words) for _ in range(order - 1))
+            for _ in range(20 * order)
+        ):
+            line = f"{-random.random():.4f} {' '.join(ngram)}"
+            if order < 3 and random.random() < 0.8:
+                line += f" {-random.random():.4f}"
+            lines[order].append(line)
+    lines[1].append("-99 <s> -0.5")
+    with io.StringIO() as f:
+        print("\\data\\", file=f)
+        for order in lines:
+            print(f"ngram {order}={len(lines[order])}", file=f)
+        for order in lines:
+            print(f"\n\\{order}-grams:", file=f)
+            print("\n".join(lines[order]), file=f)
+        print("\n\\end\\", file=f)
+        f.seek(0)
+        _, ngrams, backoffs = read_arpa(f)
+    lm = BackoffNgramLM(ngrams, backoffs)
+    compiled = CompiledNgramLM.from_backoff_lm(lm)
+    compiled.save(tmpdir)
+    loaded = CompiledNgramLM.load(tmpdir)
+
+    queries = [
+        (
+            random.choice(words + ["oov"]),
+            tuple(random.choice(words + ["oov"]) for _ in range(n)),
+        )
+        for n in [0, 1, 2, 3] * 200
+    ]
+    expected = np.array(
+        [lm.logprob(token, context) for token, context in queries]
+    )
+    for model in [compiled, loaded]:
+        logprobs = model.batch_logprob(*zip(*queries))
+        assert np.allclose(logprobs, expected, atol=1e-6)
+        assert model.logprob(*queries[5]) == logprobs[5]
+
+    sentences = [
+        [random.choice(words[2:]) for _ in range(random.randint(1, 8))]
+        for _ in range(10)
+    ]
+
+    def perplexity(model):
+        data = (ngrams_for_evaluation(s, max_n=3) for s in sentences)
+        return ngram_perplexity(ngram_evaluation_details(data, model))
+
+    assert np.isclose(perplexity(loaded), perplexity(lm))
+    # Quantized values are close
+    quantized = compiled.quantize(8)
+    quantized.save(tmpdir + "/quantized")
+    quantized = CompiledNgramLM.load(tmpdir + "/quantized")
+    logprobs = quantized.batch_logprob(*zip(*queries))
+    assert np.array_equal(np.isinf(logprobs), np.isinf(expected))
+    finite = np.isfinite(expected)
+    assert np.allclose(logprobs[finite], expected[finite], atol=0.05)
+
+
+def test_compiled_ngram_lm_empty_order(tmpdir):
+    from speechbrain.lm.arpa import arpa_to_compiled_lm
+    from speechbrain.lm.ngram import CompiledNgramLM
+
+    # All the bigrams are pruned
+    with open(tmpdir / "lm.arpa", "w") as f:
+        f.write("\\data\\\nngram 1=2\nngram 2=2\n\n")
+        f.write("\\1-grams:\n-0.5 a -0.25\n-0.7 b\n\n")
+        f.write("\\2-grams:\n-3.0 a b\n-3.0 b a\n\n\\end\\\n")
+    num_kept = arpa_to_compiled_lm(
+        tmpdir / "lm.arpa", tmpdir / "lm", prune_threshold=-1.0, progress=False
+    )
+    assert num_kept == {1: 2, 2: 0}
+    lm = CompiledNgramLM.load(tmpdir / "lm")
+    assert abs(lm.logprob("b", context=("a",)) - (-0.25 - 0.7)) < 1e-6
+    assert abs(lm.logprob("a", context=("b",)) - -0.5) < 1e-6
+    logprobs = lm.batch_logprob(["a", "b"], [("b",), ("a",)])
+    assert abs(logprobs[1] - (-0.25 - 0.7)) < 1e-6
@@ -46,3 +46,102 @@ def test_ConcatDatasetBatchSampler(device):
     non_cat_data = [x[:minlen] for x in non_cat_data]
     non_cat_data = np.array(non_cat_data)
     np.testing.assert_array_equal(non_cat_data.T, concat_data)
+
+
+def test_DynamicBatchSampler():
+    from speechbrain.dataio.sampler import DynamicBatchSampler
+    import numpy as np
+
+    lengths = np.random.RandomState(0).randint(1, 200, 500).tolist()
+    dataset = list(range(len(lengths)))
+
+    def reference_batches(sampler, order):
+        # Straightforward greedy bucketing, in sampling order:
+        batches = []
+        buckets = [[] for _ in sampler._bucket_lens]
+        for idx in order:
+            bucket_id = np.searchsorted(
+                sampler._bucket_boundaries, lengths[idx]
+            )
+            buckets[bucket_id].append(idx)
+            if len(buckets[bucket_id]) == sampler._bucket_lens[bucket_id]:
+                batches.append(buckets[bucket_id])
+                buckets[bucket_id] = []
+        return batches + [batch for batch in buckets if batch]
+
+    sampler = DynamicBatchSampler(
+        dataset,
+        max_batch_length=400,
+        num_buckets=5,
+        lengths_list=lengths,
+        shuffle=False,
+        batch_ordering="ascending",
+    )
+    expected = sorted(
+        reference_batches(sampler, range(len(lengths))),
+        key=lambda batch: max(lengths[idx] for idx in batch),
+    )
+    assert list(sampler) == expected
+    assert sorted(idx for batch in sampler for idx in batch) == dataset
+
+    sampler = DynamicBatchSampler(
+        dataset,
+        max_batch_length=400,
+        bucket_boundaries=[20, 50, 100],
+        lengths_list=lengths,
+        max_batch_ex=4,
+    )
+    for batch in sampler:
+        assert 1 <= len(batch) <= 4
+    sampler.set_epoch(1)
+    epoch1 = list(sampler)
+    sampler.set_epoch(1)
+    assert list(sampler) == epoch1
+
+
+def test_DynamicBatchSampler_packing():
+    from speechbrain.dataio.sampler import DynamicBatchSampler
+    from speechbrain.dataio.iterators import total_length_with_padding
+    import numpy as np
+
+    lengths = np.random.RandomState(0).randint(1, 200, 500).tolist()
+    dataset = list(range(len(lengths)))
+
+    def padded_length(sampler):
+        return sum(
+            total_length_with_padding(sampler.get_durations(batch))
+            for batch in sampler
+        )
+
+    bucketed = DynamicBatchSampler(
+        dataset, max_batch_length=400, num_buckets=5, lengths_list=lengths
+    )
+    packed = DynamicBatchSampler(
+        dataset, max_batch_length=400, lengths_list=lengths, packing=True
+    )
+    assert sorted(idx for batch in packed for idx in batch) == dataset
+    for batch in packed:
+        assert total_length_with_padding(packed.get_durations(batch)) <= 400
+    assert padded_length(packed) < padded_length(bucketed)
+    assert len(packed) <= len(bucketed)
+
+    # Reproducible with windows, too:
+    packed = DynamicBatchSampler(
+        dataset,
+        max_batch_length=400,
+        lengths_list=lengths,
+        packing=True,
+        packing_window=100,
+    )
+    packed.set_epoch(3)
+    epoch3 = list(packed)
+    packed.set_epoch(4)
+    assert list(packed) != epoch3
+    packed.set_epoch(3)
+    assert list(packed) == epoch3
+
+    # Zero lengths (padding ratio log)
+    packed = DynamicBatchSampler(
+        [0, 1], max_batch_length=400, lengths_list=[0, 0], packing=True,
+    )
+    assert sorted(idx for batch in packed for idx in batch) == [0, 1]
@@ -0,0 +1,289 @@
+import torch
+
+
+def test_beam_search_nbest():
+    import speechbrain as sb
+    from speechbrain.decoders.seq2seq import S2SRNNBeamSearcher
+
+    torch.manual_seed(0)
+    emb = torch.nn.Embedding(6, 3)
+    dec = sb.nnet.RNN.AttentionalRNNDecoder(
+        "gru", "content", 3, 3, 1, enc_dim=7, input_size=3
+    )
+    lin = sb.nnet.linear.Linear(n_neurons=6, input_size=3)
+    searcher = S2SRNNBeamSearcher(
+        embedding=emb,
+        decoder=dec,
+        linear=lin,
+        bos_index=0,
+        eos_index=1,
+        min_decode_ratio=0,
+        max_decode_ratio=1,
+        beam_size=4,
+        topk=3,
+        return_nbest=True,
+        using_eos_threshold=False,
+    )
+    enc = torch.rand([2, 10, 7])
+    wav_len = torch.ones(2)
+    hyps, scores, nbest = searcher(enc, wav_len)
+    assert len(nbest) == 2
+    for hyp, utterance_scores, utterance_nbest in zip(hyps, scores, nbest):
+        assert len(utterance_nbest) == 3
+        assert utterance_nbest[0]["tokens"] == hyp
+        for j, entry in enumerate(utterance_nbest):
+            assert entry["score"] == utterance_scores[j].item()
+            assert len(entry["token_log_probs"]) == len(entry["tokens"])
+            assert all(lp <= 0 for lp in entry["token_log_probs"])
+            assert 1 not in entry["tokens"]
+
+
+def test_rescore_nbest():
+    from speechbrain.decoders.seq2seq import lm_score_sequences, rescore_nbest
+    from speechbrain.lobes.models.RNNLM import RNNLM
+    from speechbrain.lobes.models.transformer.TransformerLM import TransformerLM
+
+    torch.manual_seed(0)
+    bos, eos = 1, 2
+    sequences = [[3, 4, 5], [], [6], [3, 3, 3, 3, 4]]
+    lms = [
+        RNNLM(output_neurons=7, return_hidden=True).eval(),
+        TransformerLM(7, 32, 2, 1, 0, 64, dropout=0.0).eval(),
+    ]
+    for lm in lms:
+        with torch.no_grad():
+            batch_scores = lm_score_sequences(lm, sequences, bos, eos)
+            # Reference: one sequence at a time, without padding
+            for seq, batch_score in zip(sequences, batch_scores):
+                inputs = torch.tensor([[bos] + seq])
+                logits = lm(inputs)
+                if isinstance(logits, tuple):
+                    logits = logits[0]
+                log_probs = logits.log_softmax(-1)[0]
+                score = sum(
+                    log_probs[i, token] for i, token in enumerate(seq + [eos])
+                )
+                assert torch.allclose(batch_score, score, atol=1e-4)
+
+    lm = lms[0]
+    nbest = [
+        [
+            {"tokens": seq, "score": -float(i)}
+            for i, seq in enumerate(sequences)
+        ],
+        [{"tokens": [4, 5], "score": -1.0}],
+    ]
+    rescored = rescore_nbest(nbest, lm, bos, eos, lm_weight=0.3)
+    rescored_small_batches = rescore_nbest(
+        nbest, lm, bos, eos, lm_weight=0.3, max_batch_size=2
+    )
+    assert [len(hyps) for hyps in rescored] == [4, 1]
+    for utterance_rescored, utterance_rescored_sb in zip(
+        rescored, rescored_small_batches
+    ):
+        utterance_scores = [hyp["score"] for hyp in utterance_rescored]
+        assert utterance_scores == sorted(utterance_scores, reverse=True)
+        for hyp, hyp_sb in zip(utterance_rescored, utterance_rescored_sb):
+            assert hyp["tokens"] == hyp_sb["tokens"]
+            assert abs(hyp["score"] - hyp_sb["score"]) < 1e-4
+    # The LM score is normalized like the search score
+    unnormalized = rescore_nbest(
+        nbest, lm, bos, eos, lm_weight=0.3, length_normalization=False
+    )
+    for hyp, hyp_un in zip(rescored[0], unnormalized[0]):
+        original = nbest[0][sequences.index(hyp["tokens"])]
+        lm_score = hyp["lm_score"] / (len(hyp["tokens"]) + 1)
+        assert abs(hyp["score"] - (original["score"] + 0.3 * lm_score)) < 1e-6
+        original = nbest[0][sequences.index(hyp_un["tokens"])]
+        assert (
+            abs(
+                hyp_un["score"] - (original["score"] + 0.3 * hyp_un["lm_score"])
+            )
+            < 1e-6
+        )
+
+
+def test_transformer_beam_search_kv_cache():
+    import speechbrain as sb
+    from speechbrain.decoders.seq2seq import S2STransformerBeamSearch
+    from speechbrain.lobes.models.transformer.TransformerASR import (
+        TransformerASR,
+    )
+    from speechbrain.lobes.models.transformer.TransformerLM import TransformerLM
+
+    torch.manual_seed(0)
+    vocab_size = 12
+    model = TransformerASR(
+        tgt_vocab=vocab_size,
+        input_size=8,
+        d_model=32,
+        nhead=4,
+        num_encoder_layers=1,
+        num_decoder_layers=2,
+        d_ffn=64,
+        dropout=0.0,
+    ).eval()
+    seq_lin = sb.nnet.linear.Linear(input_size=32, n_neurons=vocab_size)
+    ctc_lin = sb.nnet.linear.Linear(input_size=32, n_neurons=vocab_size)
+    lm = TransformerLM(vocab_size, 32, 4, 2, 0, 64, dropout=0.0).eval()
+    src = torch.rand(3, 15, 8)
+    wav_len = torch.tensor([1.0, 0.8, 0.6])
+    with torch.no_grad():
+        enc = model.encode(src, wav_len)
+    for lm_weight, ctc_weight in [(0.0, 0.0), (0.5, 0.3)]:
+        outputs = []
+        for use_kv_cache in [False, True]:
+            searcher = S2STransformerBeamSearch(
+                modules=[model, seq_lin, ctc_lin],
+                bos_index=1,
+                eos_index=2,
+                blank_index=0,
+                min_decode_ratio=0.0,
+                max_decode_ratio=1.0,
+                beam_size=4,
+                topk=2,
+                using_eos_threshold=False,
+                lm_weight=lm_weight,
+                lm_modules=lm,
+                ctc_weight=ctc_weight,
+                use_kv_cache=use_kv_cache,
+            )
+            assert searcher.use_kv_cache == use_kv_cache
+            assert searcher.use_lm_kv_cache == use_kv_cache
+            with torch.no_grad():
+                outputs.append(searcher(enc, wav_len))
+        (hyps, scores), (cached_hyps, cached_scores) = outputs
+        assert hyps == cached_hyps
+        assert torch.allclose(scores, cached_scores, atol=1e-4)
+
+    # LMs without incremental forward fall back to decoding the whole prefix
+    for lm in [
+        TransformerLM(vocab_size, 32, 4, 1, 1, 64),
+        TransformerLM(
+            vocab_size, 32, 4, 1, 0, 64, attention_type="RelPosMHAXL"
+        ),
+        TransformerLM(vocab_size, 32, 4, 1, 0, 64, causal=False),
+    ]:
+        searcher = S2STransformerBeamSearch(
+            modules=[model, seq_lin, ctc_lin],
+            bos_index=1,
+            eos_index=2,
+            min_decode_ratio=0.0,
+            max_decode_ratio=1.0,
+            beam_size=4,
+            using_eos_threshold=False,
+            lm_weight=0.5,
+            lm_modules=lm.eval(),
+        )
+        assert searcher.use_kv_cache and not searcher.use_lm_kv_cache
+    with torch.no_grad():
+        hyps, _ = searcher(enc, wav_len)  # Non-causal LM
+    assert len(hyps) == 3
+
+
+def test_beam_search_early_exit():
+    import speechbrain as sb
+    from speechbrain.decoders.seq2seq import (
+        S2SBeamSearcher,
+        S2SRNNBeamSearcher,
+    )
+
+    class OracleSearcher(S2SBeamSearcher):
+        """Decodes the log-softmax of the encoder states, one per step."""
+
+        def reset_mem(self, batch_size, device):
+            return 0
+
+        def permute_mem(self, memory, index):
+            return memory
+
+        def forward_step(self, inp_tokens, memory, enc_states, enc_lens):
+            return enc_states[:, memory].log_softmax(-1), memory + 1, None
+
+    torch.manual_seed(0)
+    batch_size, max_len, vocab_size = 8, 40, 10
+    logits = torch.randn(batch_size, max_len, vocab_size)
+    # Utterances of different lengths, ending with eos
+    for i, length in enumerate(torch.randint(3, 30, (batch_size,))):
+        targets = torch.randint(3, vocab_size, (length,))
+        logits[i, torch.arange(length), targets] += 4.0
+        logits[i, length, 2] += 4.0
+    wav_len = torch.ones(batch_size)
+
+    outputs = []
+    for beam_threshold, compact_batch in [
+        (None, False),
+        (None, True),
+        (5.0, True),
+    ]:
+        searcher = OracleSearcher(
+            bos_index=1,
+            eos_index=2,
+            min_decode_ratio=0.0,
+            max_decode_ratio=1.0,
+            beam_size=4,
+            topk=2,
+            length_normalization=False,
+            beam_threshold=beam_threshold,
+            compact_batch=compact_batch,
+        )
+        hyps, scores = searcher(logits, wav_len)
+        outputs.append((hyps, scores, searcher.decode_steps))
+        assert (
+            searcher.decode_steps + searcher.decode_steps_saved
+            == batch_size * max_len
+        )
+    (hyps, scores, steps), (compact_hyps, compact_scores, compact_steps) = (
+        outputs[0],
+        outputs[1],
+    )
+    # Compacting the batch does not change the results
+    assert compact_hyps == hyps
+    assert torch.equal(compact_scores, scores)
+    assert compact_steps < steps
+    # Pruning keeps the best hypotheses
+    pruned_hyps, pruned_scores, pruned_steps = outputs[2]
+    assert pruned_hyps == hyps
+    assert torch.equal(pruned_scores[:, 0], scores[:, 0])
+    assert pruned_steps <= compact_steps
+
+    # With the memories of an attentional RNN decoder and of CTC
+    emb = torch.nn.Embedding(vocab_size, 8)
+    dec = sb.nnet.RNN.AttentionalRNNDecoder(
+        "gru",
+        "location",
+        16,
+        16,
+        1,
+        enc_dim=12,
+        input_size=8,
+        channels=4,
+        kernel_size=5,
+    )
+    lin = sb.nnet.linear.Linear(n_neurons=vocab_size, input_size=16)
+    with torch.no_grad():
+        lin.w.bias[2] += 2.5
+    ctc_lin = sb.nnet.linear.Linear(n_neurons=vocab_size, input_size=12)
+    enc = torch.rand(6, 30, 12)
+    wav_len = torch.tensor([1.0, 0.3, 0.5, 0.9, 0.2, 0.7])
+    outputs = []
+    for compact_batch in [False, True]:
+        searcher = S2SRNNBeamSearcher(
+            embedding=emb,
+            decoder=dec,
+            linear=lin,
+            ctc_linear=ctc_lin,
+            bos_index=1,
+            eos_index=2,
+            blank_index=0,
+            min_decode_ratio=0.0,
+            max_decode_ratio=1.0,
+            beam_size=4,
+            ctc_weight=0.4,
+            compact_batch=compact_batch,
+        )
+        with torch.no_grad():
+            outputs.append(searcher(enc, wav_len))
+    assert searcher.decode_steps_saved > 0
+    assert outputs[0][0] == outputs[1][0]
+    assert torch.allclose(outputs[0][1], outputs[1][1])
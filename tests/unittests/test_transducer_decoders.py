@@ -0,0 +1,220 @@
+import torch
+
+
+def _make_searcher(beam_size, lm_module=None, lm_weight=0.0):
+    import speechbrain as sb
+    from speechbrain.decoders.transducer import TransducerBeamSearcher
+    from speechbrain.nnet.transducer.transducer_joint import Transducer_joint
+
+    torch.manual_seed(0)
+    emb = sb.nnet.embedding.Embedding(
+        num_embeddings=20, embedding_dim=20, consider_as_one_hot=True
+    )
+    dec = sb.nnet.RNN.GRU(
+        hidden_size=16, input_shape=(1, 1, 19), bidirectional=False
+    )
+    lin = sb.nnet.linear.Linear(input_shape=(1, 1, 1, 16), n_neurons=20)
+    with torch.no_grad():
+        # Makes blank likely, as in a trained model
+        lin.w.weight.mul_(3)
+        lin.w.bias[0] += 5
+    tjoint = Transducer_joint(lin, joint="sum")
+    return TransducerBeamSearcher(
+        decode_network_lst=[emb, dec],
+        tjoint=tjoint,
+        classifier_network=[lin],
+        blank_id=0,
+        beam_size=beam_size,
+        nbest=2,
+        lm_module=lm_module,
+        lm_weight=lm_weight,
+    )
+
+
+def test_transducer_greedy_decode():
+    searcher = _make_searcher(beam_size=1)
+    enc = torch.randn(4, 30, 16)
+    hyps, _, _, _ = searcher(enc)
+    assert len(hyps) == 4
+    # Greedy decoding over the batch is the same as one by one
+    for i in range(4):
+        assert searcher(enc[i : i + 1])[0] == [hyps[i]]
+
+
+def test_transducer_beam_search_decode():
+    searcher = _make_searcher(beam_size=4)
+    enc = torch.randn(4, 30, 16)
+    hyps, _, nbest_hyps, nbest_scores = searcher(enc)
+    assert len(hyps) == 4
+    for i in range(4):
+        assert hyps[i] == nbest_hyps[i][0]
+        assert 0 < len(nbest_hyps[i]) <= 2
+        assert nbest_scores[i] == sorted(nbest_scores[i], reverse=True)
+        assert all(0 < token < 20 for token in hyps[i])
+        # All the hyps of the batch are decoded together, independently
+        _, _, single_hyps, single_scores = searcher(enc[i : i + 1])
+        assert single_hyps[0] == nbest_hyps[i]
+        assert torch.allclose(
+            torch.tensor(single_scores[0]), torch.tensor(nbest_scores[i])
+        )
+
+
+def test_transducer_beam_search_decode_lm():
+    from speechbrain.lobes.models.RNNLM import RNNLM
+
+    lm = RNNLM(
+        output_neurons=20,
+        embedding_dim=8,
+        rnn_layers=1,
+        rnn_neurons=8,
+        dnn_neurons=8,
+        dropout=0.0,
+        return_hidden=True,
+    ).eval()
+    searcher = _make_searcher(beam_size=3, lm_module=lm, lm_weight=0.5)
+    enc = torch.randn(3, 20, 16)
+    hyps, _, nbest_hyps, _ = searcher(enc)
+    for i in range(3):
+        assert searcher(enc[i : i + 1])[2] == [nbest_hyps[i]]
+
+
+def test_transducer_beam_search_lm_scores():
+    import speechbrain as sb
+    from speechbrain.decoders.transducer import TransducerBeamSearcher
+    from speechbrain.lobes.models.RNNLM import RNNLM
+    from speechbrain.nnet.transducer.transducer_joint import Transducer_joint
+
+    torch.manual_seed(0)
+    # The PN outputs zeros and the TN outputs are zeros: the joint gives
+    # the same log-probs at every step, so that the acoustic score of a hyp
+    # does not depend on its alignment
+    emb = sb.nnet.embedding.Embedding(
+        num_embeddings=20, embedding_dim=20, consider_as_one_hot=True
+    )
+    zero_PN = sb.nnet.linear.Linear(input_shape=(1, 1, 19), n_neurons=16)
+    lin = sb.nnet.linear.Linear(input_shape=(1, 1, 1, 16), n_neurons=20)
+    with torch.no_grad():
+        zero_PN.w.weight.zero_()
+        zero_PN.w.bias.zero_()
+        lin.w.bias.copy_(torch.randn(20))
+        lin.w.bias[0] += 2
+    lm = RNNLM(
+        output_neurons=20,
+        embedding_dim=8,
+        rnn_layers=1,
+        rnn_neurons=8,
+        dnn_neurons=8,
+        dropout=0.0,
+        return_hidden=True,
+    ).eval()
+    lm_weight = 0.5
+    searcher = TransducerBeamSearcher(
+        decode_network_lst=[emb, zero_PN],
+        tjoint=Transducer_joint(lin, joint="sum"),
+        classifier_network=[lin],
+        blank_id=0,
+        beam_size=3,
+        nbest=3,
+        lm_module=lm,
+        lm_weight=lm_weight,
+    )
+    num_frames = 8
+    enc = torch.zeros(2, num_frames, 16)
+    _, _, nbest_hyps, nbest_scores = searcher(enc)
+    am_log_probs = searcher._joint_forward_step(
+        torch.zeros(1, 1, 1, 16), torch.zeros(1, 1, 1, 16)
+    ).view(-1)
+
+    # Reference: score each hyp on its own, with the LM over the whole hyp
+    num_tokens = 0
+    for hyps, scores in zip(nbest_hyps, nbest_scores):
+        for hyp, score in zip(hyps, scores):
+            num_tokens = max(num_tokens, len(hyp))
+            tokens = torch.tensor([[0] + hyp])
+            with torch.no_grad():
+                lm_log_probs = lm(tokens)[0].log_softmax(-1)[0]
+            lm_score = lm_log_probs[torch.arange(len(hyp)), hyp].sum()
+            am_score = am_log_probs[hyp].sum() + num_frames * am_log_probs[0]
+            expected = (am_score + lm_weight * lm_score) / (len(hyp) + 1)
+            assert torch.allclose(torch.tensor(score), expected, atol=1e-5)
+    # Hyps span several frames, so the LM states are carried across them
+    assert num_tokens > 2
+
+
+def test_transducer_beam_search_pn_cache():
+    searcher = _make_searcher(beam_size=4)
+    enc = torch.randn(3, 30, 16)
+    _, _, nbest_hyps, nbest_scores = searcher(enc)
+    assert searcher.pn_cache_hits > 0
+    assert searcher.pn_cache_misses > 0
+    # The cache does not change the results
+    searcher.pn_cache_bytes = 0
+    _, _, uncached_hyps, uncached_scores = searcher(enc)
+    assert uncached_hyps == nbest_hyps
+    for scores, uncached in zip(nbest_scores, uncached_scores):
+        assert torch.allclose(torch.tensor(scores), torch.tensor(uncached))
+
+
+def test_transducer_streaming_decode():
+    from speechbrain.decoders.transducer import TransducerStreamingDecoder
+
+    enc = torch.randn(3, 30, 16)
+    for beam_size in [1, 4]:
+        searcher = _make_searcher(beam_size=beam_size)
+        hyps, _, nbest_hyps, nbest_scores = searcher(enc)
+        decoder = TransducerStreamingDecoder(searcher)
+        for chunk_size in [1, 7, 30]:
+            previous_stable = [[] for _ in range(3)]
+            for chunk in enc.split(chunk_size, dim=1):
+                partial_hyps, stable_hyps = decoder.accept_chunk(chunk)
+                for i in range(3):
+                    # The stable prefixes only grow
+                    stable = stable_hyps[i]
+                    assert partial_hyps[i][: len(stable)] == stable
+                    assert stable[: len(previous_stable[i])] == (
+                        previous_stable[i]
+                    )
+                previous_stable = stable_hyps
+            # Chunked decoding is the same as whole-utterance decoding
+            stream_hyps, _, stream_nbest, stream_scores = decoder.finalize()
+            assert stream_hyps == hyps
+            assert stream_nbest == nbest_hyps
+            for i in range(3):
+                assert hyps[i][: len(previous_stable[i])] == previous_stable[i]
+                if nbest_scores is not None:
+                    assert torch.allclose(
+                        torch.tensor(stream_scores[i]),
+                        torch.tensor(nbest_scores[i]),
+                    )
+
+
+def test_transducer_streaming_decode_lm():
+    from speechbrain.decoders.transducer import TransducerStreamingDecoder
+    from speechbrain.lobes.models.RNNLM import RNNLM
+
+    lm = RNNLM(
+        output_neurons=20,
+        embedding_dim=8,
+        rnn_layers=1,
+        rnn_neurons=8,
+        dnn_neurons=8,
+        dropout=0.0,
+        return_hidden=True,
+    ).eval()
+    searcher = _make_searcher(beam_size=3, lm_module=lm, lm_weight=0.5)
+    enc = torch.randn(3, 30, 16)
+    hyps, _, nbest_hyps, nbest_scores = searcher(enc)
+    decoder = TransducerStreamingDecoder(searcher)
+    for chunk_size in [1, 7]:
+        for chunk in enc.split(chunk_size, dim=1):
+            decoder.accept_chunk(chunk)
+        # The LM memory of each hyp is carried from chunk to chunk
+        assert decoder.state["hyps"]["hidden_lm"] is not None
+        # Chunked decoding with the LM is the same as whole-utterance decoding
+        stream_hyps, _, stream_nbest, stream_scores = decoder.finalize()
+        assert stream_hyps == hyps
+        assert stream_nbest == nbest_hyps
+        for i in range(3):
+            assert torch.allclose(
+                torch.tensor(stream_scores[i]), torch.tensor(nbest_scores[i])
+            )
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Benchmarks the padding of PaddedBatch on typical ASR batch shapes.
+
+Compares the preallocated padding in
+``speechbrain.utils.data_utils.batch_pad_right`` (optionally into pinned
+memory) against padding each example with ``pad_right_to`` and stacking,
+and reports the throughput of the full ``PaddedBatch`` collation.
+
+Usage
+-----
+
+::
+
+    python tools/benchmark_collate.py [--batch-size 16] [--repeats 20]
+"""
+import time
+import random
+import argparse
+import torch
+from speechbrain.dataio.batch import PaddedBatch
+from speechbrain.utils.data_utils import batch_pad_right, pad_right_to
+
+
+def pad_and_stack(tensors, value=0):
+    """The reference: pad each tensor separately, then stack."""
+    max_shape = [
+        max(tensor.shape[dim] for tensor in tensors)
+        for dim in range(tensors[0].ndim)
+    ]
+    padded = []
+    valid = []
+    for tensor in tensors:
+        tensor, valid_percent = pad_right_to(tensor, max_shape, value=value)
+        padded.append(tensor)
+        valid.append(valid_percent[0])
+    return torch.stack(padded), torch.tensor(valid)
+
+
+def make_examples(batch_size, rng):
+    """Examples with waveforms, fbank features and tokens."""
+    examples = []
+    for i in range(batch_size):
+        seconds = rng.uniform(2.0, 16.0)
+        examples.append(
+            {
+                "id": f"utt{i}",
+                "sig": torch.randn(int(seconds * 16000)),
+                "feats": torch.randn(int(seconds * 100), 80),
+                "tokens": torch.randint(1000, (int(seconds * 6),)),
+            }
+        )
+    return examples
+
+
+def throughput(func, batches, repeats):
+    """Batches per second."""
+    func(batches[0])  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            func(batch)
+    return repeats * len(batches) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--num-batches", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    batches = [
+        make_examples(args.batch_size, rng) for _ in range(args.num_batches)
+    ]
+    pin = torch.cuda.is_available()
+    for key in ["sig", "feats", "tokens"]:
+        tensors = [[example[key] for example in batch] for batch in batches]
+        results = {
+            "pad_right_to + stack": throughput(
+                pad_and_stack, tensors, args.repeats
+            ),
+            "batch_pad_right": throughput(
+                batch_pad_right, tensors, args.repeats
+            ),
+        }
+        if pin:
+            results["batch_pad_right, pinned"] = throughput(
+                lambda values: batch_pad_right(values, pin_memory=True),
+                tensors,
+                args.repeats,
+            )
+        for name, result in results.items():
+            print(f"{key:>7} {name:<25} {result:8.1f} batches/s")
+    result = throughput(PaddedBatch, batches, args.repeats)
+    print(f"PaddedBatch, all keys: {result:.1f} batches/s")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmarks the per-batch time of InputNormalization.
+
+Compares, for several batch sizes, the statistics of each sentence computed
+one sentence at a time (as InputNormalization used to do) against the
+vectorized ``InputNormalization`` (masked reductions over the batch, and
+speaker statistics updated for all the speakers at once), for the
+'sentence' and 'speaker' normalizations.
+
+Usage
+-----
+
+::
+
+    python tools/benchmark_input_normalization.py [--device cuda] [--repeats 20]
+"""
+import time
+import argparse
+import torch
+from speechbrain.processing.features import InputNormalization
+
+
+def loop_sentence_norm(x, lengths, eps=1e-10):
+    """Normalizes each sentence with its statistics, one at a time."""
+    x = x.clone()
+    for snt_id in range(x.shape[0]):
+        actual_size = torch.round(lengths[snt_id] * x.shape[1]).int()
+        frames = x[snt_id, 0:actual_size]
+        mean = torch.mean(frames, dim=0)
+        std = torch.std(frames, dim=0).clamp(min=eps)
+        x[snt_id] = (x[snt_id] - mean) / std
+    return x
+
+
+def latency(func, repeats, device, *args):
+    """Seconds per call."""
+    func(*args)  # Warm up
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--features", type=int, default=80)
+    parser.add_argument("--speakers", type=int, default=100)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[8, 32, 64, 128, 256]
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    sentence_norm = InputNormalization(norm_type="sentence").to(args.device)
+    speaker_norm = InputNormalization(norm_type="speaker").to(args.device)
+    for batch_size in args.batch_sizes:
+        x = torch.randn(
+            batch_size, args.frames, args.features, device=args.device
+        )
+        lengths = torch.rand(batch_size, device=args.device) * 0.5 + 0.5
+        spk_ids = torch.randint(
+            args.speakers, (batch_size, 1), device=args.device
+        )
+        loop = latency(
+            loop_sentence_norm, args.repeats, args.device, x, lengths
+        )
+        sentence = latency(sentence_norm, args.repeats, args.device, x, lengths)
+        speaker = latency(
+            speaker_norm, args.repeats, args.device, x, lengths, spk_ids
+        )
+        print(
+            f"batch {batch_size:4d}: per-sentence loop {loop * 1000:7.2f} ms, "
+            f"sentence {sentence * 1000:7.2f} ms (x{loop / sentence:.1f}), "
+            f"speaker {speaker * 1000:7.2f} ms"
+        )
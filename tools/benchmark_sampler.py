@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmarks the batch generation of DynamicBatchSampler.
+
+Compares, for several dataset sizes, the time of ``set_epoch`` (which
+shuffles the examples and cuts them into batches) with the vectorized
+bucketing of ``DynamicBatchSampler`` against the per-example loop it
+replaced (lengths looked up by string keys, one ``searchsorted`` per
+example), and checks that both give the same batches.
+
+Usage
+-----
+
+::
+
+    python tools/benchmark_sampler.py [--sizes 1000000 10000000] [--num-buckets 20]
+"""
+import time
+import argparse
+import numpy as np
+import torch
+from speechbrain.dataio.sampler import DynamicBatchSampler
+
+
+def loop_generate_batches(sampler, str_lengths):
+    """The previous batch generation: one example at a time."""
+    g = torch.Generator()
+    g.manual_seed(sampler._seed + sampler._epoch)
+    order = torch.randperm(len(str_lengths), generator=g).tolist()
+    batches = []
+    bucket_batches = [[] for _ in sampler._bucket_lens]
+    for idx in order:
+        item_len = str_lengths[str(idx)]
+        bucket_id = np.searchsorted(sampler._bucket_boundaries, item_len)
+        bucket_batches[bucket_id].append(idx)
+        if len(bucket_batches[bucket_id]) >= sampler._bucket_lens[bucket_id]:
+            batches.append(bucket_batches[bucket_id])
+            bucket_batches[bucket_id] = []
+    if not sampler._drop_last:
+        batches.extend(batch for batch in bucket_batches if batch)
+    return batches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000000, 10000000]
+    )
+    parser.add_argument("--num-buckets", type=int, default=20)
+    parser.add_argument("--max-batch-length", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    for size in args.sizes:
+        # Lognormal lengths, in frames
+        lengths = np.maximum(rng.lognormal(6.0, 0.5, size), 1).astype(int)
+        sampler = DynamicBatchSampler(
+            range(size),
+            max_batch_length=args.max_batch_length,
+            num_buckets=args.num_buckets,
+            lengths_list=lengths,
+            epoch=1,
+        )
+        str_lengths = {str(i): length for i, length in enumerate(lengths)}
+
+        start = time.perf_counter()
+        sampler.set_epoch(2)
+        vectorized = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batches = loop_generate_batches(sampler, str_lengths)
+        sampler._batches = batches
+        sampler._permute_batches()
+        loop = time.perf_counter() - start
+
+        # Same batches, before their permutation
+        g = torch.Generator()
+        g.manual_seed(sampler._seed + sampler._epoch)
+        order = torch.randperm(size, generator=g).numpy()
+        assert sampler._bucket_batches(order) == batches
+        print(
+            f"{size:9d} examples: per-example loop {loop:7.2f} s, "
+            f"vectorized {vectorized:6.2f} s (x{loop / vectorized:.1f})"
+        )
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Benchmarks the autoregressive decoding of a Transformer ASR model.
+
+Compares, for several output lengths, decoding the whole token prefix at
+every step (``TransformerASR.decode``) against the incremental decoding
+with cached self-attention keys and values (``TransformerASR.decode_step``),
+as done by ``S2STransformerBeamSearch``, and reports the latency of a full
+decoding (the hypotheses of a beam are decoded as one batch).
+
+Usage
+-----
+
+::
+
+    python tools/benchmark_transformer_decoding.py [--hyps 40] [--repeats 3]
+"""
+import time
+import argparse
+import torch
+from speechbrain.lobes.models.transformer.TransformerASR import TransformerASR
+
+
+def decode_full(model, tokens, enc):
+    """Decodes each prefix of tokens from scratch."""
+    for t in range(1, tokens.size(1) + 1):
+        pred, _ = model.decode(tokens[:, :t], enc)
+    return pred[:, -1]
+
+
+def decode_incremental(model, tokens, enc):
+    """Decodes each prefix of tokens, reusing the cache of the previous one."""
+    cache = None
+    for t in range(1, tokens.size(1) + 1):
+        pred, _, cache = model.decode_step(tokens[:, :t], enc, cache)
+    return pred[:, -1]
+
+
+def latency(func, repeats, *args):
+    """Seconds per call."""
+    func(*args)  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--hyps", type=int, default=40)
+    parser.add_argument("--enc-len", type=int, default=200)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    vocab_size = 1000
+    model = TransformerASR(
+        tgt_vocab=vocab_size,
+        input_size=80,
+        d_model=args.d_model,
+        nhead=4,
+        num_encoder_layers=1,
+        num_decoder_layers=args.layers,
+        d_ffn=4 * args.d_model,
+        dropout=0.0,
+    ).eval()
+    enc = torch.randn(args.hyps, args.enc_len, args.d_model)
+    with torch.no_grad():
+        for length in args.lengths:
+            tokens = torch.randint(1, vocab_size, (args.hyps, length))
+            full = latency(decode_full, args.repeats, model, tokens, enc)
+            incremental = latency(
+                decode_incremental, args.repeats, model, tokens, enc
+            )
+            print(
+                f"{length:4d} tokens: full prefix {full * 1000:8.1f} ms, "
+                f"incremental {incremental * 1000:8.1f} ms "
+                f"(x{full / incremental:.1f})"
+            )
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Precomputes the Fbank or MFCC features of a data manifest.
+
+The features of each data point are computed in parallel worker processes
+and packed into a feature archive (sharded and memory-mapped, see
+``speechbrain.dataio.archive``). The archive can then replace the feature
+computation of a recipe, when the audio is not augmented::
+
+    archive = FeatureArchive("path/to/archive")
+    dataset.add_dynamic_item(archive.dynamic_item(provides="feats"))
+
+The feature options must of course match the ones of the recipe.
+
+Usage
+-----
+
+::
+
+    python tools/compute_features.py train.json path/to/archive \\
+        [--features fbank] [--n-mels 80] [--num-workers 8] \\
+        [--replacements data_root=/path/to/data]
+"""
+import argparse
+import logging
+import torch
+from speechbrain.dataio.archive import write_feature_archive
+from speechbrain.dataio.dataio import load_data_csv, load_data_json
+from speechbrain.lobes.features import MFCC, Fbank
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("manifest", help="Data manifest (.json or .csv).")
+    parser.add_argument("archive_dir", help="Directory to write to.")
+    parser.add_argument(
+        "--features", choices=["fbank", "mfcc"], default="fbank"
+    )
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--n-mels", type=int, default=40)
+    parser.add_argument("--n-mfcc", type=int, default=20)
+    parser.add_argument("--deltas", action="store_true")
+    parser.add_argument("--context", action="store_true")
+    parser.add_argument("--audio-key", default="wav")
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--max-shard-bytes", type=int, default=2 ** 30)
+    parser.add_argument(
+        "--replacements",
+        nargs="*",
+        default=[],
+        help="key=value replacements in the manifest, e.g. data_root=...",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    replacements = dict(item.split("=", 1) for item in args.replacements)
+    if args.manifest.endswith(".csv"):
+        data = load_data_csv(args.manifest, replacements)
+    else:
+        data = load_data_json(args.manifest, replacements)
+
+    if args.features == "fbank":
+        compute_features = Fbank(
+            deltas=args.deltas,
+            context=args.context,
+            sample_rate=args.sample_rate,
+            n_mels=args.n_mels,
+        )
+    else:
+        compute_features = MFCC(
+            deltas=args.deltas,
+            context=args.context,
+            sample_rate=args.sample_rate,
+            n_mels=args.n_mels,
+            n_mfcc=args.n_mfcc,
+        )
+    # The parallelism is over the workers
+    torch.set_num_threads(1)
+    write_feature_archive(
+        data,
+        args.archive_dir,
+        compute_features.eval(),
+        audio_key=args.audio_key,
+        num_workers=args.num_workers,
+        max_shard_bytes=args.max_shard_bytes,
+    )